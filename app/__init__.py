@@ -1,5 +1,7 @@
 from app.core.dependency import RedisControl, MongoDBControl
 from app.core.exceptions import SettingNotFound
+from app.core.periodic import PeriodicTasks
+from app.utils.local_cache import LocalCache
 
 from contextlib import asynccontextmanager  # 异步上下文管理器
 from fastapi import FastAPI                 # FastAPI 框架
@@ -12,6 +14,7 @@ from app.core.init_app import (
     register_exceptions,  # 注册异常处理
     register_routers,     # 注册路由
 )
+from app.core import jobs  # noqa: F401 注册周期任务
 
 try:
     from app.core.config import settings  # 加载应用配置
@@ -23,7 +26,11 @@ except ImportError:
 @asynccontextmanager
 async def lifespan(app: FastAPI):          # 应用生命周期管理
     await init_data()                      # 启动时：初始化数据
+    await PeriodicTasks.start()            # 启动时：启动周期任务
+    await LocalCache.start(await RedisControl.get_redis_pool())  # 启动时：订阅一级缓存失效通知
     yield                                  # 应用运行阶段
+    await PeriodicTasks.stop()             # 关闭时：停止周期任务并执行最后一次
+    await LocalCache.stop()                # 关闭时：停止一级缓存失效订阅
     await Tortoise.close_connections()     # 关闭时：清理数据库连接
     await RedisControl.close_pool()         # 关闭时：清理Redis连接
     await MongoDBControl.close_pool()      # 关闭时：清理MongoDB连接
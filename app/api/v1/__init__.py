@@ -7,6 +7,8 @@ from .base import base_router
 from .menus import menus_router
 from .auditlog import auditlog_router   
 from .notes import notes_router
+from .comments import comments_router
+from .cache import cache_router
 
 from app.core.dependency import DependPermisson
 
@@ -18,7 +20,9 @@ v1_router.include_router(roles_router, prefix="/roles", dependencies=[DependPerm
 v1_router.include_router(apis_router, prefix="/apis", dependencies=[DependPermisson])
 v1_router.include_router(menus_router, prefix="/menus", dependencies=[DependPermisson])
 v1_router.include_router(auditlog_router, prefix="/auditlog", dependencies=[DependPermisson])
+v1_router.include_router(cache_router, prefix="/cache", dependencies=[DependPermisson])
 v1_router.include_router(base_router, prefix="/base")
 v1_router.include_router(notes_router, prefix="/notes")
+v1_router.include_router(comments_router, prefix="/comments")
 
 __all__ = ["v1_router"]
@@ -1,6 +1,10 @@
+from typing import Optional
+
 from fastapi import APIRouter, Query
 from tortoise.expressions import Q
 
+from app.core.pagination import keyset_paginate
+
 from app.models.admin import AuditLog
 from app.schemas import SuccessExtra
 from app.schemas.apis import *
@@ -19,7 +23,13 @@ async def get_audit_log_list(
     status: int = Query(None, description="状态码"),
     start_time: str = Query("", description="开始时间"),
     end_time: str = Query("", description="结束时间"),
+    cursor: Optional[str] = Query(None, description="游标(传入空字符串开启游标分页, 之后传入上一页返回的next_cursor)"),
 ):
+    """
+    查看操作日志
+    
+    默认使用页码分页; 传入cursor时使用游标分页, 不统计总数, 返回next_cursor
+    """
     q = Q()
     if username:
         q &= Q(username__icontains=username)
@@ -38,6 +48,11 @@ async def get_audit_log_list(
     elif end_time:
         q &= Q(created_at__lte=end_time)
 
+    if cursor is not None:
+        audit_log_objs, next_cursor = await keyset_paginate(AuditLog.filter(q), cursor, page_size)
+        data = [await audit_log.to_dict() for audit_log in audit_log_objs]
+        return SuccessExtra(data=data, page_size=page_size, next_cursor=next_cursor)
+
     audit_log_objs = await AuditLog.filter(q).offset((page - 1) * page_size).limit(page_size).order_by("-created_at")
     total = await AuditLog.filter(q).count()
     data = [await audit_log.to_dict() for audit_log in audit_log_objs]
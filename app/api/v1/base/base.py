@@ -8,6 +8,7 @@ from redis import Redis
 from app.controllers.user import user_controller
 from app.core.ctx import CTX_USER_ID
 from app.core.dependency import DependAuth, RedisControl
+from app.core.response_cache import CacheTag, ResponseCache
 from app.models.admin import Api, Menu, Role, User
 from app.schemas.base import Fail, Success
 from app.schemas.login import *
@@ -105,15 +106,10 @@ async def get_userinfo():
 
 
 @router.get("/usermenu", summary="查看用户菜单", dependencies=[DependAuth])
-async def get_user_menu(redis: Redis = Depends(RedisControl.get_redis)):
+@ResponseCache.cached("usermenu", expire=1800, vary_by_user=True, tags=[CacheTag.USER_MENUS])
+async def get_user_menu():
     user_id = CTX_USER_ID.get()
     
-    # 先尝试从缓存获取
-    cached_menus = await RedisCache.get_user_menus(redis, user_id)
-    if cached_menus:
-        return Success(data=cached_menus)
-    
-    # 缓存未命中，从数据库查询
     user_obj = await User.filter(id=user_id).first()
     menus: list[Menu] = []
     if user_obj.is_superuser:
@@ -139,8 +135,6 @@ async def get_user_menu(redis: Redis = Depends(RedisControl.get_redis)):
                 parent_menu_dict["children"].append(await menu.to_dict())
         res.append(parent_menu_dict)
     
-    # 写入缓存
-    await RedisCache.set_user_menus(redis, user_id, res)
     return Success(data=res)
 
 
@@ -148,27 +142,23 @@ async def get_user_menu(redis: Redis = Depends(RedisControl.get_redis)):
 async def get_user_api(redis: Redis = Depends(RedisControl.get_redis)):
     user_id = CTX_USER_ID.get()
     
-    # 先尝试从缓存获取
-    permissions = await RedisCache.get_user_permissions(redis, user_id)
-    if permissions:
-        return Success(data=permissions)
-    
-    # 缓存未命中，从数据库查询
-    user_obj = await User.filter(id=user_id).first()
-    if user_obj.is_superuser:
-        api_objs: list[Api] = await Api.all()
-        apis = [api.method.lower() + api.path for api in api_objs]
-    else:
-        role_objs: list[Role] = await user_obj.roles
-        apis = []
-        for role_obj in role_objs:
-            api_objs: list[Api] = await role_obj.apis
-            apis.extend([api.method.lower() + api.path for api in api_objs])
-        apis = list(set(apis))
+    async def load():
+        # 缓存未命中，从数据库查询
+        user_obj = await User.filter(id=user_id).first()
+        if user_obj.is_superuser:
+            api_objs: list[Api] = await Api.all()
+            apis = [api.method.lower() + api.path for api in api_objs]
+        else:
+            role_objs: list[Role] = await user_obj.roles
+            apis = []
+            for role_obj in role_objs:
+                api_objs: list[Api] = await role_obj.apis
+                apis.extend([api.method.lower() + api.path for api in api_objs])
+            apis = list(set(apis))
+        return apis
     
-    # 写入缓存
-    await RedisCache.set_user_permissions(redis, user_id, apis)
-    return Success(data=apis)
+    permissions = await RedisCache.get_user_permissions(redis, user_id, loader=load)
+    return Success(data=permissions)
 
 
 @router.post("/updateUserInfo", summary="修改用户信息", dependencies=[DependAuth])
@@ -0,0 +1,8 @@
+from fastapi import APIRouter
+
+from .cache import router
+
+cache_router = APIRouter()
+cache_router.include_router(router, tags=["缓存模块"])
+
+__all__ = ["cache_router"]
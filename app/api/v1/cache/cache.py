@@ -0,0 +1,40 @@
+import os
+import socket
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from redis import Redis
+
+from app.core.dependency import RedisControl
+from app.schemas import Success
+from app.utils.cache_metrics import CacheMetrics
+from app.utils.local_cache import LocalCache
+
+router = APIRouter()
+
+WORKER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+@router.get("/metrics", summary="查看缓存指标")
+async def get_cache_metrics(redis: Redis = Depends(RedisControl.get_redis)):
+    """
+    查看缓存指标
+
+    families 为所有worker汇总的按键族统计(命中率、读写次数、字节数、平均延迟等);
+    local 为处理本次请求的worker的一级缓存统计
+    """
+    snapshot = await CacheMetrics.snapshot(redis)
+    data = {
+        "families": CacheMetrics.summarize(snapshot),
+        "local": LocalCache.stats(),
+        "worker": WORKER,
+    }
+    return Success(data=data)
+
+
+@router.get("/metrics/prometheus", summary="导出缓存指标(Prometheus格式)")
+async def get_cache_metrics_prometheus(redis: Redis = Depends(RedisControl.get_redis)):
+    """以 Prometheus 文本格式导出缓存指标, 一级缓存指标带worker标签"""
+    snapshot = await CacheMetrics.snapshot(redis)
+    content = CacheMetrics.exposition(snapshot, LocalCache.stats(), WORKER)
+    return PlainTextResponse(content, media_type="text/plain; version=0.0.4")
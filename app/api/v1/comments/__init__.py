@@ -0,0 +1,8 @@
+from fastapi import APIRouter
+
+from .comments import router
+
+comments_router = APIRouter()
+comments_router.include_router(router, tags=["评论模块"])
+
+__all__ = ["comments_router"]
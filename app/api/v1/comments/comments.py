@@ -0,0 +1,109 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.exceptions import HTTPException
+from redis import Redis
+
+from app.controllers.comment import comment_controller
+from app.core.ctx import CTX_USER_ID
+from app.core.dependency import DependAuth, RedisControl
+from app.models.admin import Comment, Note
+from app.schemas.base import Success, SuccessExtra
+from app.schemas.comments import CommentCreate
+from app.utils.redis_cache import RedisCache
+
+router = APIRouter()
+
+
+async def _check_note_visible(redis: Redis, note_id: int) -> None:
+    """检查笔记存在且当前用户可见(公开或自己的笔记)"""
+    note = await RedisCache.load_note(redis, note_id, lambda: Note.filter(id=note_id).first())
+    if not note:
+        raise HTTPException(status_code=400, detail="笔记不存在")
+    if note.status != 1 and note.user_id != CTX_USER_ID.get():
+        raise HTTPException(status_code=403, detail="无权限访问此笔记")
+
+
+@router.get("/list", summary="获取笔记评论")
+async def get_comments(
+    note_id: int = Query(..., description="笔记ID"),
+    page: int = Query(1, ge=1, description="页码"),
+    page_size: int = Query(10, ge=1, le=50, description="每页根评论数"),
+    reply_limit: int = Query(3, ge=0, le=20, description="每条根评论附带的回复数"),
+    redis: Redis = Depends(RedisControl.get_redis)
+):
+    """分页获取笔记的根评论，每条根评论附带最早的若干条回复组成的评论树
+    
+    每条根评论的回复分别限量查询，结果短时间缓存，评论变更时清除；
+    只能查看公开笔记或自己笔记的评论
+    """
+    await _check_note_visible(redis, note_id)
+    
+    async def load():
+        total, data = await comment_controller.list_threads(note_id, page, page_size, reply_limit)
+        return {
+            "data": data,
+            "total": total,
+            "page": page,
+            "page_size": page_size
+        }
+    
+    page_key = f"{page}_{page_size}_{reply_limit}"
+    result = await RedisCache.get_note_comments(redis, note_id, page_key, loader=load)
+    return SuccessExtra(**result)
+
+
+@router.get("/replies", summary="获取评论回复")
+async def get_replies(
+    root_id: int = Query(..., description="根评论ID"),
+    page: int = Query(1, ge=1, description="页码"),
+    page_size: int = Query(20, ge=1, le=100, description="每页数量"),
+    redis: Redis = Depends(RedisControl.get_redis)
+):
+    """分页获取根评论下的全部回复，按时间正序，只能查看公开笔记或自己笔记的评论"""
+    root = await Comment.filter(id=root_id).first()
+    if not root:
+        raise HTTPException(status_code=400, detail="评论不存在")
+    await _check_note_visible(redis, root.note_id)
+    total, data = await comment_controller.list_replies(root_id, page, page_size)
+    return SuccessExtra(data=data, total=total, page=page, page_size=page_size)
+
+
+@router.post("/create", summary="发表评论", dependencies=[DependAuth])
+async def create_comment(
+    comment: CommentCreate,
+    redis: Redis = Depends(RedisControl.get_redis)
+):
+    """发表评论或回复评论"""
+    await _check_note_visible(redis, comment.note_id)
+    
+    user_id = CTX_USER_ID.get()
+    try:
+        comment_obj = await comment_controller.create_comment(user_id, comment)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # 清除评论缓存
+    await RedisCache.delete_note_comments(redis, comment.note_id)
+    return Success(data=await comment_obj.to_dict(), msg="评论成功")
+
+
+@router.delete("/delete", summary="删除评论", dependencies=[DependAuth])
+async def delete_comment(
+    id: int = Query(..., description="评论ID"),
+    redis: Redis = Depends(RedisControl.get_redis)
+):
+    """删除评论及其所有下级回复，评论作者和笔记作者可以删除"""
+    comment = await Comment.filter(id=id).first()
+    if not comment:
+        raise HTTPException(status_code=400, detail="评论不存在")
+    
+    user_id = CTX_USER_ID.get()
+    if comment.user_id != user_id:
+        note = await Note.filter(id=comment.note_id).first()
+        if not note or note.user_id != user_id:
+            raise HTTPException(status_code=403, detail="无权限删除此评论")
+    
+    deleted = await comment_controller.delete_comment(comment)
+    
+    # 清除评论缓存
+    await RedisCache.delete_note_comments(redis, comment.note_id)
+    return Success(data={"deleted": len(deleted)}, msg="评论删除成功")
@@ -1,44 +1,53 @@
 import logging
+import os
 import uuid
 from datetime import datetime
 import json
+from urllib.parse import quote
 
-from fastapi import APIRouter, Query, Depends
+from fastapi import APIRouter, Query, Depends, File, Form, UploadFile
 from fastapi.exceptions import HTTPException
+from fastapi.responses import StreamingResponse
 from tortoise.expressions import Q
 from typing import Optional, List
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from redis import Redis
 
+from app.controllers.feed import feed_controller
+from app.controllers.note import note_controller
+from app.core.bgtask import BgTasks
 from app.core.ctx import CTX_USER_ID
 from app.core.dependency import DependAuth, DependMongoDB, RedisControl
+from app.core.etag import etag_matches
+from app.core.identity_map import IdentityMap
+from app.core.pagination import keyset_paginate
+from app.core.response_cache import CacheTag, ResponseCache
 from app.schemas.base import Success, SuccessExtra, Fail
 from app.schemas.notes import *
-from app.models.admin import KnowledgeBases, Note, User
+from app.models.admin import KnowledgeBases, Note, NoteCollection, NoteLike, User
 from app.utils.redis_cache import RedisCache
-from app.utils.redis import RedisUtils
+from app.utils.content_codec import CONTENT_META_PROJECTION, CONTENT_PROJECTION, ContentChunksMissing, NoteContentCodec
+from app.utils.note_export import export_knowledge_base
+from app.utils.note_import import ArchiveError
+from app.utils.revision import NoteRevisionStore
+from app.utils.search import NoteSearchIndex, highlight, snippet
+from app.utils.text_patch import apply_patches, content_hash
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
 @router.get("/knowledge_bases_list", summary="获取用户全部知识库")
+@ResponseCache.cached("knowledge_bases_list", expire=300, tags=[CacheTag.KNOWLEDGE_BASES])
 async def get_all_knowledge_bases(
-    user_id: int = Query(..., description="用户ID"),
-    redis: Redis = Depends(RedisControl.get_redis)
+    user_id: int = Query(..., description="用户ID")
 ):
-    """获取用户全部知识库"""
-    # 先尝试从缓存获取
-    cached_knowledge_bases = await RedisCache.get_knowledge_bases(redis, user_id)
-    if cached_knowledge_bases:
-        return Success(data=cached_knowledge_bases)
-    
-    # 缓存未命中，从数据库查询
-    knowledge_bases = await KnowledgeBases.filter(user_id=user_id).all()
-    data = [await kb.to_dict() for kb in knowledge_bases]
+    """获取用户全部知识库
     
-    # 写入缓存
-    await RedisCache.set_knowledge_bases(redis, user_id, data)
+    响应缓存5分钟，支持If-None-Match，数据未变化时返回304
+    """
+    knowledge_bases = await KnowledgeBases.filter(user_id=user_id, deleting=False).all()
+    data = [await kb.to_dict() for kb in knowledge_bases]
     return Success(data=data)
 
 
@@ -55,8 +64,8 @@ async def create_knowledge_bases(
         type=knowledge_bases.type
     )
     
-    # 清除知识库列表缓存
-    await RedisCache.delete_knowledge_bases(redis, user_id)
+    # 清除知识库列表缓存和新ID的不存在标记
+    await RedisCache.clear_knowledge_base_cache(redis, user_id, knowledge_bases_obj.id)
     return Success(msg="知识库创建成功")
 
 
@@ -66,7 +75,9 @@ async def update_knowledge_bases(
     redis: Redis = Depends(RedisControl.get_redis)
 ):
     """更新知识库"""
-    knowledge_bases_obj = await KnowledgeBases.filter(id=knowledge_bases.id).first()
+    knowledge_bases_obj = await RedisCache.load_knowledge_base(
+        redis, knowledge_bases.id, lambda: KnowledgeBases.filter(id=knowledge_bases.id, deleting=False).first()
+    )
     if not knowledge_bases_obj:
         raise HTTPException(status_code=400, detail="知识库不存在")
     
@@ -86,7 +97,11 @@ async def delete_knowledge_bases(
     mongodb: AsyncIOMotorDatabase = DependMongoDB,
     redis: Redis = Depends(RedisControl.get_redis)
 ):
-    """删除知识库及其所有笔记"""
+    """删除知识库及其所有笔记
+    
+    知识库标记为删除中后立即返回，笔记在后台分批删除，
+    进度可通过 /delete_knowledge_bases_progress 查询
+    """
     # 检查知识库是否存在
     knowledge_bases = await KnowledgeBases.filter(id=id).first()
     if not knowledge_bases:
@@ -97,26 +112,144 @@ async def delete_knowledge_bases(
     if knowledge_bases.user_id != user_id:
         raise HTTPException(status_code=403, detail="无权限删除此知识库")
     
-    # 获取该知识库下的所有笔记
-    notes = await Note.filter(knowledge_bases_id=id).all()
+    if not knowledge_bases.deleting:
+        # 标记为删除中并记录待删除的笔记数
+        total = await Note.filter(knowledge_bases_id=id).count()
+        await RedisCache.set_purge_progress(redis, id, total=total, deleted=0, done=0)
+        await KnowledgeBases.filter(id=id).update(deleting=True)
+        
+        # 清除相关缓存
+        await RedisCache.clear_knowledge_base_cache(redis, knowledge_bases.user_id, id)
     
-    # 删除MongoDB中的笔记内容
-    if notes:
-        content_keys = [note.content for note in notes]
-        await mongodb.note_contents.delete_many({"key": {"$in": content_keys}})
+    # 后台分批删除
+    await BgTasks.add_task(note_controller.safe_purge_knowledge_base, mongodb, redis, id)
+    return Success(msg="知识库正在删除")
+
+
+@router.get("/delete_knowledge_bases_progress", summary="获取知识库删除进度", dependencies=[DependAuth])
+async def get_delete_knowledge_bases_progress(
+    id: int = Query(..., description="知识库ID"),
+    redis: Redis = Depends(RedisControl.get_redis)
+):
+    """获取知识库删除进度"""
+    progress = await RedisCache.get_purge_progress(redis, id)
+    knowledge_bases = await KnowledgeBases.filter(id=id).first()
+    if knowledge_bases and knowledge_bases.user_id != CTX_USER_ID.get():
+        raise HTTPException(status_code=403, detail="无权限查看此知识库")
+    if not knowledge_bases and not progress:
+        raise HTTPException(status_code=400, detail="知识库不存在")
+    if knowledge_bases and not knowledge_bases.deleting:
+        raise HTTPException(status_code=400, detail="知识库未在删除中")
+    
+    progress = progress or {"total": 0, "deleted": 0, "done": 0}
+    return Success(data={
+        "total": progress.get("total", 0),
+        "deleted": progress.get("deleted", 0),
+        "done": bool(progress.get("done")) or not knowledge_bases
+    })
+
+
+@router.post("/import_knowledge_bases", summary="批量导入笔记", dependencies=[DependAuth])
+async def import_knowledge_bases(
+    file: UploadFile = File(..., description="markdown文件的zip或tar归档"),
+    knowledge_bases_id: Optional[int] = Form(None, description="导入到已有知识库，为空时新建知识库"),
+    name: Optional[str] = Form(None, description="新建知识库名称，默认使用归档文件名"),
+    status: int = Form(0, description="导入笔记的状态: 0-私有 1-公开 2-审核中"),
+    mongodb: AsyncIOMotorDatabase = DependMongoDB,
+    redis: Redis = Depends(RedisControl.get_redis)
+):
+    """从zip或tar归档批量导入markdown笔记
     
-    # 删除所有笔记
-    await Note.filter(knowledge_bases_id=id).delete()
+    归档逐批解析写入，全文索引和历史版本在后台建立，缓存只在导入完成后清除一次
+    """
+    user_id = CTX_USER_ID.get()
     
-    # 删除知识库
-    await knowledge_bases.delete()
+    if knowledge_bases_id is not None:
+        # 检查知识库是否存在以及是否是知识库作者
+        knowledge_base = await RedisCache.load_knowledge_base(
+            redis, knowledge_bases_id, lambda: KnowledgeBases.filter(id=knowledge_bases_id, deleting=False).first()
+        )
+        if not knowledge_base:
+            raise HTTPException(status_code=400, detail="知识库不存在")
+        if knowledge_base.user_id != user_id:
+            raise HTTPException(status_code=403, detail="无权限导入到此知识库")
+    else:
+        knowledge_base = await KnowledgeBases.create(
+            user_id=user_id,
+            name=name or os.path.splitext(file.filename or "")[0] or "导入的知识库"
+        )
+    
+    try:
+        note_ids, skipped = await note_controller.import_archive(
+            mongodb, user_id, knowledge_base.id, status, file.file, file.filename or ""
+        )
+    except Exception as e:
+        # 已写入的笔记由 import_archive 删除，这里删除自动新建的知识库
+        if knowledge_bases_id is None:
+            await knowledge_base.delete()
+        if isinstance(e, ArchiveError):
+            raise HTTPException(status_code=400, detail=str(e))
+        raise
+    finally:
+        await file.close()
+        # 清除相关缓存(每个知识库只清除一次)
+        await RedisCache.clear_knowledge_base_cache(redis, user_id, knowledge_base.id)
+    
+    # 删除新笔记ID的不存在标记
+    await RedisCache.delete_missing_notes(redis, note_ids)
+    
+    # 后台建立全文索引并记录初始版本
+    await BgTasks.add_task(note_controller.index_imported, mongodb, user_id, note_ids)
+    if status == 1:
+        await BgTasks.add_task(feed_controller.safe_fan_out, redis, user_id, note_ids)
+    
+    return Success(
+        data={"knowledge_bases_id": knowledge_base.id, "imported": len(note_ids), "skipped": skipped},
+        msg="笔记导入成功"
+    )
+
+
+@router.get("/export_knowledge_bases", summary="导出知识库", dependencies=[DependAuth])
+async def export_knowledge_bases(
+    id: int = Query(..., description="知识库ID"),
+    mongodb: AsyncIOMotorDatabase = DependMongoDB,
+    redis: Redis = Depends(RedisControl.get_redis)
+):
+    """将知识库导出为markdown文件的zip归档
     
-    # 清除相关缓存
-    await RedisCache.clear_knowledge_base_cache(redis, knowledge_bases.user_id, id)
-    return Success(msg="知识库及其笔记删除成功")
+    笔记按批读取并边压缩边输出，不会在内存或磁盘中生成完整归档
+    """
+    # 检查知识库是否存在以及是否是知识库作者
+    knowledge_base = await RedisCache.load_knowledge_base(
+        redis, id, lambda: KnowledgeBases.filter(id=id, deleting=False).first()
+    )
+    if not knowledge_base:
+        raise HTTPException(status_code=400, detail="知识库不存在")
+    if knowledge_base.user_id != CTX_USER_ID.get():
+        raise HTTPException(status_code=403, detail="无权限导出此知识库")
+    
+    filename = quote(f"{knowledge_base.name or id}.zip")
+    return StreamingResponse(
+        export_knowledge_base(mongodb, id),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{filename}"}
+    )
+
+
+async def _check_knowledge_base_active(redis: Redis, knowledge_bases_id: int) -> None:
+    """检查知识库存在且不在删除中，正在后台删除的知识库不再允许读取或修改其中的笔记"""
+    knowledge_base = await RedisCache.load_knowledge_base(
+        redis, knowledge_bases_id, lambda: KnowledgeBases.filter(id=knowledge_bases_id, deleting=False).first()
+    )
+    if not knowledge_base:
+        raise HTTPException(status_code=400, detail="知识库不存在")
 
 
 @router.get("/knowledge_bases_notes_list", summary="获取知识库笔记列表")
+@ResponseCache.cached(
+    "knowledge_bases_notes_list", expire=300, tags=[CacheTag.KNOWLEDGE_BASE_NOTES],
+    skip_if=lambda query: bool(query["keyword"] or query["cursor"])
+)
 async def get_notes_list(
     knowledge_bases_id: int = Query(..., description="知识库ID"),
     page: int = Query(1, description="页码"),
@@ -124,14 +257,15 @@ async def get_notes_list(
     status: Optional[int] = Query(None, description="状态: 0-私有 1-公开 2-审核中"),
     type: Optional[int] = Query(None, description="类型: 0-免费 1-付费"),
     keyword: Optional[str] = Query(None, description="搜索关键词"),
+    cursor: Optional[str] = Query(None, description="游标(传入空字符串开启游标分页, 之后传入上一页返回的next_cursor)"),
     redis: Redis = Depends(RedisControl.get_redis)
 ):
-    """获取笔记列表，支持分页、状态筛选和关键词搜索"""
-    # 如果没有筛选条件，尝试从缓存获取
-    if status is None and type is None and not keyword:
-        cached_notes = await RedisCache.get_knowledge_base_notes(redis, knowledge_bases_id, page)
-        if cached_notes:
-            return SuccessExtra(**cached_notes)
+    """获取笔记列表，支持分页、状态筛选和关键词搜索
+    
+    传入cursor时使用游标分页，不统计总数，返回next_cursor；
+    响应按查询参数缓存5分钟，知识库内笔记变更时失效，关键词搜索和游标翻页不缓存
+    """
+    await _check_knowledge_base_active(redis, knowledge_bases_id)
     
     # 构建查询条件
     query = Q(knowledge_bases_id=knowledge_bases_id)
@@ -142,6 +276,17 @@ async def get_notes_list(
     if keyword:
         query &= (Q(title__icontains=keyword) | Q(introduction__icontains=keyword))
     
+    # 游标分页模式
+    if cursor is not None:
+        notes, next_cursor = await keyset_paginate(Note.filter(query), cursor, page_size)
+        data = []
+        for note in notes:
+            note_dict = await note.to_dict()
+            if 'price' in note_dict:
+                note_dict['price'] = float(note_dict['price'])
+            data.append(note_dict)
+        return SuccessExtra(data=data, page_size=page_size, next_cursor=next_cursor)
+    
     # 计算总数
     total = await Note.filter(query).count()
     
@@ -156,18 +301,7 @@ async def get_notes_list(
             note_dict['price'] = float(note_dict['price'])
         data.append(note_dict)
     
-    result = {
-        "data": data,
-        "total": total,
-        "page": page,
-        "page_size": page_size
-    }
-    
-    # 如果没有筛选条件，写入缓存
-    if status is None and type is None and not keyword:
-        await RedisCache.set_knowledge_base_notes(redis, knowledge_bases_id, page, result)
-    
-    return SuccessExtra(**result)
+    return SuccessExtra(data=data, total=total, page=page, page_size=page_size)
 
 
 @router.get("/note_detail", summary="获取笔记详情")
@@ -176,44 +310,97 @@ async def get_note_detail(
     mongodb: AsyncIOMotorDatabase = DependMongoDB,
     redis: Redis = Depends(RedisControl.get_redis)
 ):
-    """获取笔记详情"""
-    # 先尝试从缓存获取
-    cached_note = await RedisCache.get_note_content(redis, note_id)
-    if cached_note:
-        return Success(data=cached_note)
+    """获取笔记详情
     
-    # 缓存未命中，从数据库查询
-    note = await Note.filter(id=note_id).first()
-    if not note:
-        raise HTTPException(status_code=400, detail="笔记不存在")
+    浏览次数在Redis中计数并定期回写数据库，返回的view_count为实时浏览次数；
+    支持If-None-Match，ETag由缓存的笔记数据计算，不包含实时浏览次数，
+    因此声明为弱ETag：304只表示笔记内容未变，浏览次数可能已经变化
+    """
+    async def load():
+        # 缓存未命中，从数据库查询；并发的未命中只查询一次，不存在的笔记短期缓存不存在标记
+        note = await RedisCache.load_note(redis, note_id, lambda: Note.filter(id=note_id).first())
+        if not note:
+            raise HTTPException(status_code=400, detail="笔记不存在")
+        
+        # 获取笔记基本信息
+        data = await note.to_dict()
+        
+        # 处理 Decimal 类型
+        if 'price' in data:
+            data['price'] = str(data['price'])
+            
+        # 获取作者信息
+        user = await User.get_or_none(id=note.user_id)
+        data["author_name"] = user.username if user else ""
+        data["author_avatar"] = user.avatar if user else ""
+        
+        # 从MongoDB获取笔记内容
+        content_doc = await mongodb.note_contents.find_one({"key": note.content}, CONTENT_PROJECTION)
+        data["content"] = await NoteContentCodec.load(mongodb, content_doc)
+        # 正文版本哈希，用于增量更新
+        data["content_hash"] = content_hash(data["content"])
+        return data
+    
+    cached = await RedisCache.get_note_content(redis, note_id, loader=load)
     
     # 增加浏览次数
-    note.view_count += 1
-    await note.save()
+    view_count = await note_controller.record_view(redis, note_id)
+    etag = f"W/{cached.etag}"
+    if etag_matches(etag):
+        return Success(etag=etag)
+    # 缓存数据在请求间共享，复制后再写入实时浏览次数
+    data = dict(cached.data)
+    data["view_count"] = view_count
+    return Success(data=data, etag=etag)
+
+
+@router.get("/note_detail_stream", summary="流式获取笔记详情")
+async def get_note_detail_stream(
+    note_id: int = Query(..., description="笔记ID"),
+    mongodb: AsyncIOMotorDatabase = DependMongoDB,
+    redis: Redis = Depends(RedisControl.get_redis)
+):
+    """流式获取笔记详情
     
-    # 获取笔记基本信息
-    data = await note.to_dict()
+    适用于超大笔记，返回 application/x-ndjson:
+    第一行为笔记元信息 {"type": "meta", "data": {...}}，
+    之后每行为一段正文 {"type": "content", "data": "..."}；
+    读取中途失败时最后一行为 {"type": "error", "data": "..."}，已收到的正文不完整；
+    分片存储的正文逐片读取，服务端不会持有完整正文
+    """
+    note = await RedisCache.load_note(redis, note_id, lambda: Note.filter(id=note_id).first())
+    if not note:
+        raise HTTPException(status_code=400, detail="笔记不存在")
     
-    # 处理 Decimal 类型
+    # 获取笔记基本信息
+    data = await note.to_dict(exclude_fields=["content"])
     if 'price' in data:
         data['price'] = str(data['price'])
-        
+    
     # 获取作者信息
-    user = await User.get_or_none(id=note.user_id)
+    user = await IdentityMap.current().get(User, note.user_id)
     data["author_name"] = user.username if user else ""
     data["author_avatar"] = user.avatar if user else ""
     
-    # 从MongoDB获取笔记内容
-    content_doc = await mongodb.note_contents.find_one({"key": note.content})
-    if content_doc:
-        data["content"] = content_doc["content"]
-    else:
-        data["content"] = ""
+    # 只读取正文元信息
+    content_doc = await mongodb.note_contents.find_one({"key": note.content}, CONTENT_META_PROJECTION)
+    data["content_hash"] = content_doc.get("hash") if content_doc else content_hash("")
+    data["content_size"] = content_doc.get("raw_size") if content_doc else 0
+    
+    # 增加浏览次数
+    data["view_count"] = await note_controller.record_view(redis, note_id)
     
-    # 写入缓存
-    await RedisCache.set_note_content(redis, note_id, data)
+    async def body():
+        yield json.dumps({"type": "meta", "data": data}, ensure_ascii=False) + "\n"
+        try:
+            async for chunk in NoteContentCodec.iter_chunks(mongodb, content_doc):
+                yield json.dumps({"type": "content", "data": chunk}, ensure_ascii=False) + "\n"
+        except ContentChunksMissing as e:
+            # 响应头和部分正文已经发出，以最后一行error告知客户端正文不完整
+            logger.error(f"流式读取笔记 {note_id} 的正文失败: {e}")
+            yield json.dumps({"type": "error", "data": "正文读取失败，请重新获取"}, ensure_ascii=False) + "\n"
     
-    return Success(data=data)
+    return StreamingResponse(body(), media_type="application/x-ndjson")
 
 
 @router.post("/create_note", summary="创建笔记", dependencies=[DependAuth])
@@ -226,7 +413,9 @@ async def create_note(
     user_id = CTX_USER_ID.get()
     
     # 检查知识库是否存在
-    knowledge_base = await KnowledgeBases.filter(id=note.knowledge_bases_id).first()
+    knowledge_base = await RedisCache.load_knowledge_base(
+        redis, note.knowledge_bases_id, lambda: KnowledgeBases.filter(id=note.knowledge_bases_id, deleting=False).first()
+    )
     if not knowledge_base:
         raise HTTPException(status_code=400, detail="知识库不存在")
     
@@ -236,7 +425,8 @@ async def create_note(
     # 将内容存储到MongoDB
     await mongodb.note_contents.insert_one({
         "key": content_key,
-        "content": note.content,
+        **(await NoteContentCodec.encode_for_store(mongodb, content_key, note.content)),
+        "hash": content_hash(note.content),
         "created_at": datetime.now(),
         "updated_at": datetime.now()
     })
@@ -254,18 +444,22 @@ async def create_note(
         status=note.status
     )
     
+    # 建立全文索引，记录初始版本
+    await BgTasks.add_task(NoteSearchIndex.safe_index_note, mongodb, note_obj, note.content)
+    await BgTasks.add_task(NoteRevisionStore.safe_append, mongodb, note_obj.id, user_id, note.content, datetime.now())
+    
+    # 公开笔记推送到粉丝的关注动态
+    if note_obj.status == 1:
+        await BgTasks.add_task(feed_controller.safe_fan_out, redis, user_id, [note_obj.id])
+    
     # 处理返回数据
     data = await note_obj.to_dict(exclude_fields=["content"])
     if 'price' in data:
         data['price'] = str(data['price'])
     
-    # 清除用户笔记列表缓存
-    await RedisCache.delete_user_notes(redis, user_id)
-    # 清除知识库笔记列表缓存
-    await RedisCache.delete_knowledge_base_notes(redis, note.knowledge_bases_id)
-    
-    # 设置新笔记的缓存
-    await RedisCache.set_note_content(redis, note_obj.id, data)
+    # 清除用户笔记列表、知识库笔记列表和全部笔记列表缓存，以及新ID的不存在标记；
+    # 笔记详情缓存需要包含正文、正文哈希和作者信息，由首次读取详情时加载
+    await RedisCache.clear_note_cache(redis, user_id, note.knowledge_bases_id, note_obj.id)
     
     return Success(data=data, msg="笔记创建成功")
 
@@ -285,6 +479,7 @@ async def update_note(
     user_id = CTX_USER_ID.get()
     if note_obj.user_id != user_id:
         raise HTTPException(status_code=403, detail="无权限修改此笔记")
+    await _check_knowledge_base_active(redis, note_obj.knowledge_bases_id)
     
     # 只更新前端传递的字段
     update_data = {}
@@ -292,15 +487,17 @@ async def update_note(
         if value is not None and field != "id" and field != "content":
             update_data[field] = value
     
+    was_public = note_obj.status == 1
     if update_data:
         await note_obj.update_from_dict(update_data)
         await note_obj.save()
     
-    # 清除相关缓存
-    await RedisCache.delete_note_content(redis, note.id)
-    await RedisCache.delete_user_notes(redis, user_id)
-    # 清除知识库笔记列表缓存
-    await RedisCache.delete_knowledge_base_notes(redis, note_obj.knowledge_bases_id)
+    # 笔记改为公开时推送到粉丝的关注动态
+    if not was_public and note_obj.status == 1:
+        await BgTasks.add_task(feed_controller.safe_fan_out, redis, user_id, [note_obj.id])
+    
+    # 清除笔记内容、用户笔记列表、知识库笔记列表和全部笔记列表缓存
+    await RedisCache.clear_note_cache(redis, user_id, note_obj.knowledge_bases_id, note.id)
     
     # 更新笔记基本信息缓存
     note_dict = await note_obj.to_dict()
@@ -308,14 +505,15 @@ async def update_note(
         note_dict['price'] = float(note_dict['price'])
     
     # 从 MongoDB 获取笔记内容
-    content_doc = await mongodb.note_contents.find_one({"key": note_obj.content})
-    if content_doc:
-        note_dict["content"] = content_doc["content"]
-    else:
-        note_dict["content"] = ""
+    content_doc = await mongodb.note_contents.find_one({"key": note_obj.content}, CONTENT_PROJECTION)
+    note_dict["content"] = await NoteContentCodec.load(mongodb, content_doc)
+    note_dict["content_hash"] = content_hash(note_dict["content"])
         
     await RedisCache.set_note_content(redis, note.id, note_dict)
     
+    # 更新全文索引
+    await BgTasks.add_task(NoteSearchIndex.safe_index_note, mongodb, note_obj, note_dict["content"])
+    
     return Success(msg="笔记更新成功")
 
 
@@ -336,34 +534,50 @@ async def delete_note(
     user_id = CTX_USER_ID.get()
     if note.user_id != user_id:
         raise HTTPException(status_code=403, detail="无权限删除此笔记")
+    await _check_knowledge_base_active(redis, note.knowledge_bases_id)
     
     # 删除MongoDB中的内容
     await mongodb.note_contents.delete_one({"key": note.content})
+    await NoteContentCodec.cleanup_chunks(mongodb, note.content)
     
-    # 删除笔记
+    # 删除笔记及其点赞和收藏记录
     await note.delete()
+    await NoteLike.filter(note_id=note_id).delete()
+    await NoteCollection.filter(note_id=note_id).delete()
     
-    # 清除相关缓存
-    await RedisCache.delete_note_content(redis, note_id)
-    await RedisCache.delete_user_notes(redis, user_id)
-    await RedisCache.delete_knowledge_base_notes(redis, note.knowledge_bases_id)
+    # 删除全文索引和历史版本记录
+    await BgTasks.add_task(NoteSearchIndex.safe_remove_notes, mongodb, [note_id])
+    await BgTasks.add_task(NoteRevisionStore.remove_notes, mongodb, [note_id])
+    
+    # 清除相关缓存，删除点赞集合并移出热门排行
+    await RedisCache.clear_note_cache(redis, user_id, note.knowledge_bases_id, note_id, deleted=True)
 
     return Success(msg="笔记删除成功")
 
 
 @router.post("/update_note_content", summary="更新笔记正文", dependencies=[DependAuth])
 async def update_note_content(
-    note_id: int = Query(..., description="笔记ID"),
-    content: str = Query(..., description="笔记内容"),
+    body: Optional[NoteContentUpdate] = None,
+    note_id: Optional[int] = Query(None, description="笔记ID(已废弃, 请使用请求体)", deprecated=True),
+    content: Optional[str] = Query(None, description="笔记内容(已废弃, 请使用请求体)", deprecated=True),
     mongodb: AsyncIOMotorDatabase = DependMongoDB,
     redis: Redis = Depends(RedisControl.get_redis)
 ):
     """
     更新笔记正文
     内容存储在 MongoDB 中
+    
+    请求体中传入 content 全量覆盖正文，或传入 base_hash 和 patches 进行增量更新；
+    base_hash 与服务端当前版本不一致时返回409，客户端需重新获取正文
     """
+    # 兼容旧版通过查询参数传递正文的调用方式
+    if body is None:
+        if note_id is None or content is None:
+            raise HTTPException(status_code=400, detail="缺少笔记ID或笔记内容")
+        body = NoteContentUpdate(note_id=note_id, content=content)
+    
     # 检查笔记是否存在
-    note = await Note.filter(id=note_id).first()
+    note = await Note.filter(id=body.note_id).first()
     if not note:
         raise HTTPException(status_code=400, detail="笔记不存在")
     
@@ -371,39 +585,181 @@ async def update_note_content(
     user_id = CTX_USER_ID.get()
     if note.user_id != user_id:
         raise HTTPException(status_code=403, detail="无权限修改此笔记")
+    # 正在删除的知识库不再写入正文，避免重新创建已被删除的正文文档、索引和历史版本
+    await _check_knowledge_base_active(redis, note.knowledge_bases_id)
+    
+    if body.patches is not None:
+        # 增量模式：校验基准版本后在服务端应用补丁
+        if not body.base_hash:
+            raise HTTPException(status_code=400, detail="增量更新需要提供base_hash")
+        content_doc = await mongodb.note_contents.find_one({"key": note.content}, {**CONTENT_PROJECTION, "hash": 1})
+        base_content = await NoteContentCodec.load(mongodb, content_doc)
+        if content_hash(base_content) != body.base_hash:
+            raise HTTPException(status_code=409, detail="正文版本不一致，请重新获取后再提交")
+        try:
+            new_content = apply_patches(base_content, body.patches)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # 仅当库中仍是基准版本时才写入，防止并发覆盖
+        if content_doc and "hash" in content_doc:
+            match = {"key": note.content, "hash": body.base_hash}
+        else:
+            match = {"key": note.content, "hash": {"$exists": False}}
+        upsert = content_doc is None
+    elif body.content is not None:
+        new_content = body.content
+        match = {"key": note.content}
+        upsert = True
+    else:
+        raise HTTPException(status_code=400, detail="content和patches不能同时为空")
     
-    # 更新MongoDB中的内容
-    result = await mongodb.note_contents.update_one(
-        {"key": note.content},
-        {
-            "$set": {
-                "content": content,
-                "updated_at": datetime.now()
-            }
-        }
-    )
+    # 更新MongoDB中的内容，内容不存在时重新创建
+    new_hash = await note_controller.save_content(mongodb, note, new_content, match, upsert)
+    if new_hash is None:
+        raise HTTPException(status_code=409, detail="正文版本不一致，请重新获取后再提交")
     
-    if result.modified_count == 0:
-        # 如果没有更新成功，可能是内容不存在，需要重新创建
-        await mongodb.note_contents.insert_one({
-            "key": note.content,
-            "content": content,
-            "created_at": datetime.now(),
-            "updated_at": datetime.now()
-        })
-    
-    # 更新笔记内容缓存
-    note_dict = await note.to_dict()
-    # 处理 Decimal 类型
-    if 'price' in note_dict:
-        note_dict['price'] = str(note_dict['price'])
-    note_dict["content"] = content
-    await RedisCache.set_note_content(redis, note_id, note_dict)
+    # 清除笔记内容缓存，下次读取时重新加载
+    await RedisCache.delete_note_content(redis, note.id)
+    
+    # 更新全文索引，追加历史版本
+    await BgTasks.add_task(NoteSearchIndex.safe_index_note, mongodb, note, new_content)
+    await BgTasks.add_task(NoteRevisionStore.safe_append, mongodb, note.id, user_id, new_content, datetime.now())
+    
+    return Success(data={"content_hash": new_hash}, msg="笔记内容更新成功")
+
+
+@router.get("/note_revisions", summary="获取笔记历史版本列表", dependencies=[DependAuth])
+async def get_note_revisions(
+    note_id: int = Query(..., description="笔记ID"),
+    page: int = Query(1, description="页码"),
+    page_size: int = Query(10, description="每页数量"),
+    mongodb: AsyncIOMotorDatabase = DependMongoDB,
+):
+    """获取笔记历史版本列表，按时间倒序"""
+    note = await Note.filter(id=note_id).first()
+    if not note:
+        raise HTTPException(status_code=400, detail="笔记不存在")
+    if note.user_id != CTX_USER_ID.get():
+        raise HTTPException(status_code=403, detail="无权限查看此笔记的历史版本")
+    
+    total, data = await NoteRevisionStore.list_revisions(mongodb, note_id, page, page_size)
+    return SuccessExtra(data=data, total=total, page=page, page_size=page_size)
+
+
+@router.get("/note_revision", summary="获取笔记历史版本", dependencies=[DependAuth])
+async def get_note_revision(
+    note_id: int = Query(..., description="笔记ID"),
+    hash: str = Query(..., description="版本哈希"),
+    mongodb: AsyncIOMotorDatabase = DependMongoDB,
+):
+    """获取笔记某个历史版本的正文"""
+    note = await Note.filter(id=note_id).first()
+    if not note:
+        raise HTTPException(status_code=400, detail="笔记不存在")
+    if note.user_id != CTX_USER_ID.get():
+        raise HTTPException(status_code=403, detail="无权限查看此笔记的历史版本")
     
-    return Success(msg="笔记内容更新成功")
+    content = await NoteRevisionStore.get(mongodb, note_id, hash)
+    if content is None:
+        raise HTTPException(status_code=400, detail="历史版本不存在")
+    return Success(data={"note_id": note_id, "hash": hash, "content": content})
+
+
+@router.post("/restore_note_revision", summary="恢复笔记历史版本", dependencies=[DependAuth])
+async def restore_note_revision(
+    revision: NoteRevisionRestore,
+    mongodb: AsyncIOMotorDatabase = DependMongoDB,
+    redis: Redis = Depends(RedisControl.get_redis)
+):
+    """将笔记正文恢复为某个历史版本，恢复操作本身也会记录为一个新版本"""
+    note = await Note.filter(id=revision.note_id).first()
+    if not note:
+        raise HTTPException(status_code=400, detail="笔记不存在")
+    user_id = CTX_USER_ID.get()
+    if note.user_id != user_id:
+        raise HTTPException(status_code=403, detail="无权限修改此笔记")
+    await _check_knowledge_base_active(redis, note.knowledge_bases_id)
+    
+    content = await NoteRevisionStore.get(mongodb, note.id, revision.hash)
+    if content is None:
+        raise HTTPException(status_code=400, detail="历史版本不存在")
+    
+    new_hash = await note_controller.save_content(mongodb, note, content)
+    
+    # 清除笔记内容缓存，更新全文索引，追加历史版本
+    await RedisCache.delete_note_content(redis, note.id)
+    await BgTasks.add_task(NoteSearchIndex.safe_index_note, mongodb, note, content)
+    await BgTasks.add_task(NoteRevisionStore.safe_append, mongodb, note.id, user_id, content, datetime.now())
+    
+    return Success(data={"content_hash": new_hash}, msg="笔记已恢复到历史版本")
+
+
+async def _check_note_visible(note_id: int) -> None:
+    """检查笔记存在且当前用户可见(公开或自己的笔记)"""
+    note = await IdentityMap.current().get(Note, note_id)
+    if not note:
+        raise HTTPException(status_code=400, detail="笔记不存在")
+    if note.status != 1 and note.user_id != CTX_USER_ID.get():
+        raise HTTPException(status_code=403, detail="无权限访问此笔记")
+
+
+@router.post("/like", summary="点赞笔记", dependencies=[DependAuth])
+async def like_note(
+    note_id: int = Query(..., description="笔记ID"),
+    redis: Redis = Depends(RedisControl.get_redis)
+):
+    """点赞笔记，点赞数由后台批量回写"""
+    await _check_note_visible(note_id)
+    changed = await note_controller.set_liked(redis, note_id, CTX_USER_ID.get(), True)
+    return Success(data={"liked": True, "changed": changed}, msg="点赞成功")
+
+
+@router.post("/unlike", summary="取消点赞", dependencies=[DependAuth])
+async def unlike_note(
+    note_id: int = Query(..., description="笔记ID"),
+    redis: Redis = Depends(RedisControl.get_redis)
+):
+    """取消点赞，点赞数由后台批量回写"""
+    changed = await note_controller.set_liked(redis, note_id, CTX_USER_ID.get(), False)
+    return Success(data={"liked": False, "changed": changed}, msg="已取消点赞")
+
+
+@router.post("/collect", summary="收藏笔记", dependencies=[DependAuth])
+async def collect_note(
+    note_id: int = Query(..., description="笔记ID"),
+    redis: Redis = Depends(RedisControl.get_redis)
+):
+    """收藏笔记，收藏记录由后台批量写入数据库"""
+    await _check_note_visible(note_id)
+    changed = await note_controller.set_collected(redis, CTX_USER_ID.get(), note_id, True)
+    return Success(data={"collected": True, "changed": changed}, msg="收藏成功")
+
+
+@router.post("/uncollect", summary="取消收藏", dependencies=[DependAuth])
+async def uncollect_note(
+    note_id: int = Query(..., description="笔记ID"),
+    redis: Redis = Depends(RedisControl.get_redis)
+):
+    """取消收藏，收藏记录由后台批量从数据库删除"""
+    changed = await note_controller.set_collected(redis, CTX_USER_ID.get(), note_id, False)
+    return Success(data={"collected": False, "changed": changed}, msg="已取消收藏")
+
+
+@router.get("/note_interaction", summary="获取笔记点赞收藏状态", dependencies=[DependAuth])
+async def get_note_interaction(
+    note_id: int = Query(..., description="笔记ID"),
+    redis: Redis = Depends(RedisControl.get_redis)
+):
+    """获取当前用户对笔记的点赞和收藏状态"""
+    data = await note_controller.interaction_state(redis, CTX_USER_ID.get(), note_id)
+    return Success(data=data)
 
 
 @router.get("/list", summary="获取笔记列表")
+@ResponseCache.cached(
+    "notes_list", expire=300, tags=[CacheTag.NOTES_LIST],
+    skip_if=lambda query: bool(query["cursor"])
+)
 async def get_notes(
     page: int = Query(1, description="页码"),
     page_size: int = Query(10, description="每页数量"),
@@ -411,22 +767,15 @@ async def get_notes(
     status: Optional[int] = Query(1, description="状态: 0-私有 1-公开 2-审核中"),
     min_price: Optional[float] = Query(None, description="最小价格"),
     max_price: Optional[float] = Query(None, description="最大价格"),
-    redis: Redis = Depends(RedisControl.get_redis)
+    cursor: Optional[str] = Query(None, description="游标(传入空字符串开启游标分页, 之后传入上一页返回的next_cursor)")
 ):
     """获取所有笔记列表
     
     支持按类型、状态、价格范围筛选
     返回数据包含作者名称和知识库名称
-    使用Redis缓存查询结果
+    响应按查询参数缓存5分钟，笔记变更时失效
+    传入cursor时使用游标分页，不统计总数，返回next_cursor；游标翻页不缓存
     """
-    # 构建缓存键
-    cache_key = f"notes_list_{page}_{page_size}_{type}_{status}_{min_price}_{max_price}"
-    
-    # 尝试从缓存获取
-    cached_data = await RedisUtils.cache_get(redis, cache_key)
-    if cached_data:
-        return SuccessExtra(**json.loads(cached_data))
-    
     # 构建查询条件
     query = Q()
     if type is not None:
@@ -438,45 +787,141 @@ async def get_notes(
     if max_price is not None:
         query &= Q(price__lte=max_price)
     
-    total = await Note.filter(query).count()
-    
-    notes = await Note.filter(query).offset((page - 1) * page_size).limit(page_size).all()
+    next_cursor = None
+    if cursor is not None:
+        # 游标分页模式，不统计总数
+        total = 0
+        notes, next_cursor = await keyset_paginate(Note.filter(query), cursor, page_size)
+    else:
+        total = await Note.filter(query).count()
+        notes = await Note.filter(query).offset((page - 1) * page_size).limit(page_size).all()
     
     data = []
     for note in notes:
         # 获取笔记基本信息，排除content字段
         note_dict = await note.to_dict(exclude_fields=["content"])
         
-        # 获取作者信息
-        user = await User.get_or_none(id=note.user_id)
-        note_dict["author_name"] = user.username if user else ""
-        note_dict["author_avatar"] = user.avatar if user else ""
-        
-        # 获取知识库信息
-        kb = await KnowledgeBases.get_or_none(id=note.knowledge_bases_id)
-        note_dict["knowledge_base_name"] = kb.name if kb else ""
-        
         # 处理价格字段
         if 'price' in note_dict:
             note_dict['price'] = float(note_dict['price'])
             
         data.append(note_dict)
     
+    # 批量填充作者和知识库信息
+    await note_controller.fill_relations(data)
+    
     result = {
         "data": data,
         "total": total,
         "page": page,
         "page_size": page_size
     }
-    
-    # 写入缓存，设置5分钟过期
-    await RedisUtils.cache_set(redis, cache_key, json.dumps(result), expire=300)
+    if cursor is not None:
+        result["next_cursor"] = next_cursor
     
     return SuccessExtra(**result)
 
 
+@router.get("/hot", summary="获取热门笔记")
+async def get_hot_notes(
+    limit: int = Query(20, ge=1, le=100, description="返回数量"),
+    redis: Redis = Depends(RedisControl.get_redis)
+):
+    """获取热门笔记
+    
+    热度由浏览、点赞和购买累加并随时间指数衰减，
+    直接从Redis排行读取，只返回公开笔记
+    """
+    data = await note_controller.hot_notes(redis, limit)
+    return Success(data=data)
 
 
+@router.get("/feed", summary="获取关注动态", dependencies=[DependAuth])
+async def get_feed(
+    before_id: Optional[int] = Query(None, description="只返回ID小于该值的笔记，传入上一页返回的next_before_id翻页"),
+    page_size: int = Query(20, ge=1, le=50, description="每页数量"),
+    redis: Redis = Depends(RedisControl.get_redis)
+):
+    """获取关注用户发布的公开笔记，按发布时间倒序"""
+    data, next_before_id = await feed_controller.read(redis, CTX_USER_ID.get(), before_id, page_size)
+    return SuccessExtra(data=data, page_size=page_size, next_before_id=next_before_id)
 
 
-
+@router.get("/search", summary="全文搜索笔记")
+async def search_notes(
+    keyword: str = Query(..., min_length=1, description="搜索关键词"),
+    page: int = Query(1, ge=1, description="页码"),
+    page_size: int = Query(10, ge=1, le=50, description="每页数量"),
+    knowledge_bases_id: Optional[int] = Query(None, description="知识库ID"),
+    mongodb: AsyncIOMotorDatabase = DependMongoDB,
+):
+    """全文搜索公开笔记
+    
+    基于倒排索引检索标题、简介和正文，按BM25得分排序
+    返回数据包含高亮后的标题、简介和正文片段
+    """
+    filters = {"status": 1}
+    if knowledge_bases_id is not None:
+        filters["knowledge_bases_id"] = knowledge_bases_id
+    return await _search_notes(mongodb, keyword, filters, page, page_size)
+
+
+@router.get("/search_mine", summary="全文搜索自己的笔记", dependencies=[DependAuth])
+async def search_my_notes(
+    keyword: str = Query(..., min_length=1, description="搜索关键词"),
+    page: int = Query(1, ge=1, description="页码"),
+    page_size: int = Query(10, ge=1, le=50, description="每页数量"),
+    knowledge_bases_id: Optional[int] = Query(None, description="知识库ID"),
+    status: Optional[int] = Query(None, description="状态: 0-私有 1-公开 2-审核中"),
+    mongodb: AsyncIOMotorDatabase = DependMongoDB,
+):
+    """全文搜索当前用户自己的笔记，可按状态筛选(包括私有笔记)"""
+    filters = {"user_id": CTX_USER_ID.get()}
+    if knowledge_bases_id is not None:
+        filters["knowledge_bases_id"] = knowledge_bases_id
+    if status is not None:
+        filters["status"] = status
+    return await _search_notes(mongodb, keyword, filters, page, page_size)
+
+
+async def _search_notes(
+    mongodb: AsyncIOMotorDatabase,
+    keyword: str,
+    filters: dict,
+    page: int,
+    page_size: int,
+) -> SuccessExtra:
+    """按筛选条件检索笔记，返回当前页的笔记和高亮片段"""
+    scored, terms = await NoteSearchIndex.search(mongodb, keyword, filters)
+    total = len(scored)
+    page_items = scored[(page - 1) * page_size: page * page_size]
+    
+    # 批量获取当前页笔记并保持得分顺序
+    note_ids = [note_id for note_id, _ in page_items]
+    notes = {note.id: note for note in await Note.filter(id__in=note_ids)}
+    content_docs = await mongodb.note_contents.find(
+        {"key": {"$in": [note.content for note in notes.values()]}}, CONTENT_PROJECTION
+    ).to_list(None)
+    contents = {doc["key"]: await NoteContentCodec.load(mongodb, doc) for doc in content_docs}
+    
+    data = []
+    for note_id, score in page_items:
+        note = notes.get(note_id)
+        # 索引更新有延迟，以数据库中的当前状态为准再筛选一次
+        if not note or any(getattr(note, field) != value for field, value in filters.items()):
+            continue
+        note_dict = await note.to_dict(exclude_fields=["content"])
+        if 'price' in note_dict:
+            note_dict['price'] = float(note_dict['price'])
+        note_dict["score"] = round(score, 4)
+        note_dict["highlight"] = {
+            "title": highlight(note.title, terms),
+            "introduction": highlight(note.introduction, terms),
+            "content": snippet(contents.get(note.content, ""), terms),
+        }
+        data.append(note_dict)
+    
+    # 批量填充作者和知识库信息
+    await note_controller.fill_relations(data)
+    
+    return SuccessExtra(data=data, total=total, page=page, page_size=page_size)
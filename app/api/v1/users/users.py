@@ -11,14 +11,19 @@
 """
 
 import logging
-from fastapi import APIRouter, Body, Query
+from fastapi import APIRouter, Body, Depends, Query
+from fastapi.exceptions import HTTPException
+from redis import Redis
 from tortoise.expressions import Q
 from typing import Optional, List
 from datetime import datetime
 
 from app.controllers.user import user_controller
+from app.core.dependency import RedisControl
+from app.models.admin import User
 from app.schemas.base import Fail, Success, SuccessExtra
 from app.schemas.users import *
+from app.utils.redis_cache import RedisCache
 
 # 创建日志记录器
 logger = logging.getLogger(__name__)
@@ -105,6 +110,7 @@ async def list_user(
 @router.post("/create", summary="创建用户")
 async def create_user(
     user_in: UserCreate,
+    redis: Redis = Depends(RedisControl.get_redis)
 ):
     """创建新用户
     
@@ -138,11 +144,14 @@ async def create_user(
     new_user = await user_controller.create_user(obj_in=user_in)
     # 更新用户角色
     await user_controller.update_roles(new_user, user_in.role_ids)
+    # 清除相关缓存(包括新ID的不存在标记)
+    await RedisCache.clear_user_cache(redis, new_user.id)
     return Success(msg="Created Successfully")
 
 @router.get("/get", summary="查看用户")
 async def get_user(
     user_id: int = Query(..., description="用户ID"),
+    redis: Redis = Depends(RedisControl.get_redis)
 ):
     """获取单个用户详情
     
@@ -152,8 +161,13 @@ async def get_user(
     Returns:
         Success: 包含用户详情的响应对象
             - data: 用户详细信息(不包含密码字段)
+            
+    Note:
+        不存在的用户ID短期缓存不存在标记, 期间不再查询数据库
     """
-    user_obj = await user_controller.get(id=user_id)
+    user_obj = await RedisCache.load_user(redis, user_id, lambda: User.get_or_none(id=user_id))
+    if not user_obj:
+        raise HTTPException(status_code=404, detail="用户不存在")
     user_dict = await user_obj.to_dict(exclude_fields=["password"])
     return Success(data=user_dict)
 
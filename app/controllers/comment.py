@@ -0,0 +1,167 @@
+"""
+评论控制器模块
+
+提供评论相关的业务逻辑处理, 包括:
+- 评论的创建和删除
+- 分页获取根评论, 每条根评论附带前N条回复组成的评论树
+- 分页获取某条根评论下的回复
+"""
+
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from tortoise.functions import Count
+
+from app.core.crud import CRUDBase
+from app.core.identity_map import IdentityMap
+from app.models.admin import Comment, User
+from app.schemas.comments import CommentCreate, CommentUpdate
+
+
+class CommentController(CRUDBase[Comment, CommentCreate, CommentUpdate]):
+    """评论控制器类
+
+    继承自CRUDBase, 整页评论树的回复通过一次 root_id 查询加载后在内存中组装
+    """
+    def __init__(self):
+        """初始化评论控制器,设置操作的模型为Comment"""
+        super().__init__(model=Comment)
+
+    async def _to_dicts(self, comments: List[Comment]) -> List[dict]:
+        """转换为字典并批量填充评论用户信息"""
+        users = await IdentityMap.current().load_many(User, (comment.user_id for comment in comments))
+        data = []
+        for comment in comments:
+            comment_dict = await comment.to_dict()
+            user = users.get(comment.user_id)
+            comment_dict["user_name"] = user.username if user else ""
+            comment_dict["user_avatar"] = user.avatar if user else ""
+            data.append(comment_dict)
+        return data
+
+    async def list_threads(
+        self,
+        note_id: int,
+        page: int,
+        page_size: int,
+        reply_limit: int,
+    ) -> Tuple[int, List[dict]]:
+        """
+        分页获取笔记的根评论及其回复
+
+        整页根评论的回复通过一次 root_id IN 查询加载, 查询内用 ROW_NUMBER() 按根评论分区,
+        每条根评论只返回最早的 reply_limit 条; 回复总数通过一次按 root_id 分组的计数查询得到;
+        回复按 parent_id 组装为树, 父评论不在保留范围内的回复挂在根评论下
+
+        Args:
+            note_id: 笔记ID
+            page: 页码
+            page_size: 每页根评论数
+            reply_limit: 每条根评论附带的回复数
+
+        Returns:
+            Tuple[int, List[dict]]: (根评论总数, 根评论列表), 根评论包含 children 和 reply_count
+        """
+        query = self.model.filter(note_id=note_id, parent_id__isnull=True)
+        total = await query.count()
+        roots = await query.order_by("-created_at", "-id").offset((page - 1) * page_size).limit(page_size)
+        if not roots:
+            return total, []
+
+        root_ids = [root.id for root in roots]
+        reply_counts = dict(
+            await self.model.filter(root_id__in=root_ids)
+            .annotate(count=Count("id"))
+            .group_by("root_id")
+            .values_list("root_id", "count")
+        )
+        kept = await self._first_replies([root_id for root_id in root_ids if reply_counts.get(root_id)], reply_limit)
+
+        nodes = {node["id"]: node for node in await self._to_dicts(list(roots) + kept)}
+        for node in nodes.values():
+            node["children"] = []
+
+        for reply in kept:
+            parent = nodes.get(reply.parent_id) or nodes[reply.root_id]
+            parent["children"].append(nodes[reply.id])
+
+        data = []
+        for root in roots:
+            node = nodes[root.id]
+            node["reply_count"] = reply_counts.get(root.id, 0)
+            data.append(node)
+        return total, data
+
+    async def _first_replies(self, root_ids: List[int], limit: int) -> List[Comment]:
+        """一次查询取出每条根评论最早的 limit 条回复(MySQL 8 窗口函数), 按时间正序"""
+        if not root_ids or not limit:
+            return []
+        table = self.model._meta.db_table
+        # 参数均为整数, 格式化前再次转换, 不会拼接外部输入
+        ids = ",".join(str(int(root_id)) for root_id in root_ids)
+        return await self.model.raw(
+            f"SELECT * FROM ("
+            f"SELECT *, ROW_NUMBER() OVER (PARTITION BY `root_id` ORDER BY `created_at`, `id`) AS `reply_rank` "
+            f"FROM `{table}` WHERE `root_id` IN ({ids})"
+            f") AS `replies` WHERE `reply_rank` <= {int(limit)} ORDER BY `created_at`, `id`"
+        )
+
+    async def list_replies(self, root_id: int, page: int, page_size: int) -> Tuple[int, List[dict]]:
+        """
+        分页获取根评论下的回复, 按时间正序
+
+        Returns:
+            Tuple[int, List[dict]]: (回复总数, 回复列表)
+        """
+        query = self.model.filter(root_id=root_id)
+        total = await query.count()
+        replies = await query.order_by("created_at", "id").offset((page - 1) * page_size).limit(page_size)
+        return total, await self._to_dicts(replies)
+
+    async def create_comment(self, user_id: int, obj_in: CommentCreate) -> Comment:
+        """
+        创建评论, 回复时根据父评论确定根评论
+
+        Raises:
+            ValueError: 父评论不存在或不属于同一笔记
+        """
+        root_id = None
+        if obj_in.parent_id is not None:
+            parent = await self.model.filter(id=obj_in.parent_id).first()
+            if not parent or parent.note_id != obj_in.note_id:
+                raise ValueError("回复的评论不存在")
+            root_id = parent.root_id or parent.id
+        return await self.model.create(
+            note_id=obj_in.note_id,
+            user_id=user_id,
+            content=obj_in.content,
+            parent_id=obj_in.parent_id,
+            root_id=root_id,
+        )
+
+    async def delete_comment(self, comment: Comment) -> List[int]:
+        """
+        删除评论及其所有下级回复
+
+        同一评论树的回复通过一次 root_id 查询加载, 在内存中找出全部下级
+
+        Returns:
+            List[int]: 删除的评论ID
+        """
+        if comment.root_id is None:
+            ids = [comment.id] + await self.model.filter(root_id=comment.id).values_list("id", flat=True)
+        else:
+            children: Dict[int, List[int]] = defaultdict(list)
+            for reply_id, parent_id in await self.model.filter(root_id=comment.root_id).values_list("id", "parent_id"):
+                children[parent_id].append(reply_id)
+            ids, stack = [], [comment.id]
+            while stack:
+                current = stack.pop()
+                ids.append(current)
+                stack.extend(children[current])
+        await self.model.filter(id__in=ids).delete()
+        return ids
+
+
+# 创建评论控制器实例
+comment_controller = CommentController()
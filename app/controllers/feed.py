@@ -0,0 +1,129 @@
+"""
+关注动态控制器模块
+
+写扩散的时间线: 公开笔记发布时将笔记ID推入每个粉丝的Redis时间线;
+粉丝数超过 FEED_FANOUT_MAX_FOLLOWERS 的作者不推送, 读取时从数据库拉取后合并
+"""
+
+from typing import List, Optional, Tuple
+
+from redis.asyncio import Redis
+
+from app.controllers.note import note_controller
+from app.core.config import settings
+from app.log import logger
+from app.models.admin import Note, UserFollow
+from app.utils.redis_cache import RedisCache
+
+
+class FeedController:
+    """关注动态控制器类"""
+
+    async def fan_out(self, redis: Redis, author_id: int, note_ids: List[int]) -> None:
+        """
+        将作者新发布的公开笔记推送到粉丝的时间线
+
+        粉丝按ID分批读取, 每批使用一次pipeline推送
+
+        Args:
+            redis: Redis连接
+            author_id: 作者ID
+            note_ids: 笔记ID列表
+        """
+        if not note_ids:
+            return
+        follower_count = await UserFollow.filter(followed_id=author_id).count()
+        big = follower_count > settings.FEED_FANOUT_MAX_FOLLOWERS
+        await RedisCache.set_feed_big_author(redis, author_id, big)
+        if big:
+            return
+
+        note_ids = sorted(note_ids)
+        last_id = 0
+        while True:
+            rows = await UserFollow.filter(followed_id=author_id, id__gt=last_id).order_by("id").limit(
+                settings.FEED_FANOUT_BATCH_SIZE
+            ).values_list("id", "user_id")
+            if not rows:
+                break
+            await RedisCache.push_feeds(redis, [row[1] for row in rows], note_ids)
+            last_id = rows[-1][0]
+
+    async def safe_fan_out(self, redis: Redis, author_id: int, note_ids: List[int]) -> None:
+        """推送笔记, 失败只记录日志, 供后台任务使用"""
+        try:
+            await self.fan_out(redis, author_id, note_ids)
+        except Exception as e:
+            logger.error(f"作者 {author_id} 的笔记 {note_ids} 推送失败: {e}")
+
+    async def _rebuild(self, followed_ids: List[int]) -> List[int]:
+        """从数据库重建用户时间线, 读取时拉取的作者不写入时间线"""
+        if not followed_ids:
+            return []
+        return await Note.filter(user_id__in=followed_ids, status=1).order_by("-id").limit(
+            settings.FEED_MAX_LENGTH
+        ).values_list("id", flat=True)
+
+    async def read(
+        self,
+        redis: Redis,
+        user_id: int,
+        before_id: Optional[int],
+        page_size: int,
+    ) -> Tuple[List[dict], Optional[int]]:
+        """
+        读取关注动态
+
+        推送的时间线与粉丝过多作者的最新笔记按ID倒序合并, 笔记信息一次批量加载
+
+        Args:
+            redis: Redis连接
+            user_id: 用户ID
+            before_id: 只返回ID小于该值的笔记, 用于翻页
+            page_size: 每页数量
+
+        Returns:
+            Tuple[List[dict], Optional[int]]: (笔记列表, 下一页的before_id)
+        """
+        followed_ids = await UserFollow.filter(user_id=user_id).values_list("followed_id", flat=True)
+        big_authors = await RedisCache.get_feed_big_authors(redis)
+        pulled_authors = [author_id for author_id in followed_ids if author_id in big_authors]
+
+        pushed_authors = [author_id for author_id in followed_ids if author_id not in big_authors]
+        timeline = await RedisCache.get_feed(
+            redis, user_id, loader=lambda: self._rebuild(pushed_authors)
+        )
+
+        candidates = set(note_id for note_id in timeline if before_id is None or note_id < before_id)
+        if pulled_authors:
+            query = Note.filter(user_id__in=pulled_authors, status=1)
+            if before_id is not None:
+                query = query.filter(id__lt=before_id)
+            candidates.update(await query.order_by("-id").limit(page_size).values_list("id", flat=True))
+
+        # 多取一些, 过滤已删除或已改为非公开的笔记
+        note_ids = sorted(candidates, reverse=True)[:page_size * 2]
+        if not note_ids:
+            return [], None
+        notes = {note.id: note for note in await Note.filter(id__in=note_ids, status=1)}
+
+        data = []
+        for note_id in note_ids:
+            note = notes.get(note_id)
+            if not note:
+                continue
+            note_dict = await note.to_dict(exclude_fields=["content"])
+            if 'price' in note_dict:
+                note_dict['price'] = float(note_dict['price'])
+            data.append(note_dict)
+            if len(data) >= page_size:
+                break
+        await note_controller.fill_view_counts(redis, data)
+        await note_controller.fill_relations(data)
+
+        next_before_id = data[-1]["id"] if len(data) >= page_size else None
+        return data, next_before_id
+
+
+# 创建关注动态控制器实例
+feed_controller = FeedController()
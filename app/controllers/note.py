@@ -0,0 +1,589 @@
+"""
+笔记控制器模块
+
+提供笔记相关的业务逻辑处理, 包括:
+- 笔记的基本CRUD操作
+- 列表数据的作者、知识库信息批量填充
+- 浏览次数的Redis计数与批量回写
+- 正文写入MongoDB
+- 从归档批量导入笔记
+- 后台分批删除知识库
+- 热门笔记排行
+- 点赞和收藏的Redis记录与批量回写
+"""
+
+import asyncio
+import itertools
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from redis.asyncio import Redis
+from tortoise.expressions import F, Q
+
+from app.core.config import settings
+from app.core.crud import CRUDBase
+from app.core.identity_map import IdentityMap
+from app.log import logger
+from app.models.admin import KnowledgeBases, Note, NoteCollection, NoteLike, User
+from app.schemas.notes import NoteCreate, NoteUpdate
+from app.utils.content_codec import CODEC_CHUNKED, CONTENT_PROJECTION, NoteContentCodec
+from app.utils.note_import import iter_archive, parse_markdown
+from app.utils.redis_cache import RedisCache
+from app.utils.revision import NoteRevisionStore
+from app.utils.search import NoteSearchIndex
+from app.utils.text_patch import content_hash
+
+# 各类事件对笔记热度的贡献
+HOT_EVENT_WEIGHTS = {
+    "view": settings.HOT_NOTES_WEIGHT_VIEW,
+    "like": settings.HOT_NOTES_WEIGHT_LIKE,
+    "purchase": settings.HOT_NOTES_WEIGHT_PURCHASE,
+}
+
+
+class NoteController(CRUDBase[Note, NoteCreate, NoteUpdate]):
+    """笔记控制器类
+
+    继承自CRUDBase, 提供笔记的基本CRUD操作和列表数据填充
+    """
+    def __init__(self):
+        """初始化笔记控制器,设置操作的模型为Note"""
+        super().__init__(model=Note)
+
+    async def fill_relations(self, data: List[dict]) -> List[dict]:
+        """
+        批量填充笔记的作者和知识库信息
+
+        收集整页数据中的用户ID和知识库ID,通过请求级身份映射
+        各发起一次 id__in 查询,再从内存映射中填充字段
+
+        Args:
+            data: 笔记字典列表,需包含 user_id 和 knowledge_bases_id
+
+        Returns:
+            List[dict]: 填充了 author_name、author_avatar、knowledge_base_name 的列表
+        """
+        identity_map = IdentityMap.current()
+        users = await identity_map.load_many(User, (d.get("user_id") for d in data))
+        knowledge_bases = await identity_map.load_many(
+            KnowledgeBases, (d.get("knowledge_bases_id") for d in data)
+        )
+
+        for note_dict in data:
+            user = users.get(note_dict.get("user_id"))
+            note_dict["author_name"] = user.username if user else ""
+            note_dict["author_avatar"] = user.avatar if user else ""
+
+            kb = knowledge_bases.get(note_dict.get("knowledge_bases_id"))
+            note_dict["knowledge_base_name"] = kb.name if kb else ""
+        return data
+
+    async def fill_view_counts(self, redis: Redis, data: List[dict]) -> List[dict]:
+        """
+        用Redis中的实时浏览次数覆盖整页笔记的 view_count
+
+        数据库中的浏览次数定期回写, 会落后于实时计数; 所有笔记的计数一次 MGET 读取
+
+        Args:
+            redis: Redis连接
+            data: 笔记字典列表, 需包含 id
+        """
+        counts = await RedisCache.get_note_view_counts(redis, [d["id"] for d in data])
+        for note_dict in data:
+            if note_dict["id"] in counts:
+                note_dict["view_count"] = counts[note_dict["id"]]
+        return data
+
+    async def save_content(
+        self,
+        mongodb: AsyncIOMotorDatabase,
+        note: Note,
+        content: str,
+        match: Optional[dict] = None,
+        upsert: bool = True,
+    ) -> Optional[str]:
+        """
+        写入笔记正文
+
+        Args:
+            mongodb: MongoDB数据库实例
+            note: 笔记实例
+            content: 新正文
+            match: 额外的写入条件, 用于乐观并发控制, 默认只按key匹配
+            upsert: 正文文档不存在时是否创建
+
+        Returns:
+            Optional[str]: 新正文哈希, 写入条件不满足时返回None
+        """
+        new_hash = content_hash(content)
+        now = datetime.now()
+        encoded = await NoteContentCodec.encode_for_store(mongodb, note.content, content)
+        previous = await mongodb.note_contents.find_one_and_update(
+            match or {"key": note.content},
+            {
+                "$set": {
+                    **encoded,
+                    "hash": new_hash,
+                    "updated_at": now
+                },
+                "$setOnInsert": {"created_at": now},
+                "$unset": {"codec_error": ""}
+            },
+            projection={"codec": 1, "chunk_rev": 1},
+            upsert=upsert,
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous is None and not upsert:
+            # 正文已被其他请求修改，丢弃本次写入的分片
+            if encoded.get("chunk_rev"):
+                await NoteContentCodec.cleanup_chunks(mongodb, note.content, encoded["chunk_rev"])
+            return None
+        # 标记被替换版本的分片, 宽限期后再删除, 避免正在读取旧版本的请求读到不完整的正文
+        if previous and previous.get("codec") == CODEC_CHUNKED:
+            await NoteContentCodec.retire_chunks(mongodb, note.content, previous["chunk_rev"])
+        return new_hash
+
+    async def import_archive(
+        self,
+        mongodb: AsyncIOMotorDatabase,
+        user_id: int,
+        knowledge_bases_id: int,
+        status: int,
+        fileobj: BinaryIO,
+        filename: str,
+    ) -> Tuple[List[int], List[str]]:
+        """
+        从zip或tar归档批量导入markdown笔记
+
+        归档在线程池中逐批解压解析, 每批正文使用一次 insert_many 写入MongoDB,
+        笔记使用一次 bulk_create 写入MySQL; 中途失败时删除已写入的笔记后重新抛出异常
+
+        Args:
+            mongodb: MongoDB数据库实例
+            user_id: 作者ID
+            knowledge_bases_id: 目标知识库ID
+            status: 导入笔记的状态
+            fileobj: 归档文件对象
+            filename: 归档文件名
+
+        Returns:
+            Tuple[List[int], List[str]]: (导入的笔记ID, 因超出大小限制或大小不符跳过的文件)
+
+        Raises:
+            ArchiveError: 归档格式不支持或文件数超出限制
+        """
+        entries = iter_archive(
+            fileobj, filename, settings.NOTE_IMPORT_MAX_FILES, settings.NOTE_IMPORT_MAX_FILE_SIZE
+        )
+
+        def next_batch():
+            return list(itertools.islice(entries, settings.NOTE_IMPORT_BATCH_SIZE))
+
+        note_ids, skipped, content_keys = [], [], []
+        try:
+            while True:
+                batch = await asyncio.to_thread(next_batch)
+                if not batch:
+                    break
+                parsed = []
+                for path, text in batch:
+                    if text is None:
+                        skipped.append(path)
+                    else:
+                        parsed.append(parse_markdown(path, text))
+                if parsed:
+                    note_ids.extend(await self._import_batch(
+                        mongodb, user_id, knowledge_bases_id, status, parsed, content_keys
+                    ))
+        except Exception:
+            # 导入中途失败时删除已写入的笔记和正文，不留下未建立索引的部分导入结果
+            await self._discard_imported(mongodb, content_keys)
+            raise
+        return note_ids, skipped
+
+    async def _import_batch(
+        self,
+        mongodb: AsyncIOMotorDatabase,
+        user_id: int,
+        knowledge_bases_id: int,
+        status: int,
+        items: List[dict],
+        content_keys: List[str],
+    ) -> List[int]:
+        """写入一批解析后的笔记, 返回新笔记ID; 正文key在写入前追加到 content_keys, 供失败时清理"""
+        now = datetime.now()
+        docs, notes = [], []
+        for item in items:
+            content_key = str(uuid.uuid4())
+            content_keys.append(content_key)
+            docs.append({
+                "key": content_key,
+                **(await NoteContentCodec.encode_for_store(mongodb, content_key, item["content"])),
+                "hash": content_hash(item["content"]),
+                "created_at": now,
+                "updated_at": now
+            })
+            notes.append(self.model(
+                user_id=user_id,
+                knowledge_bases_id=knowledge_bases_id,
+                title=item["title"],
+                introduction=item["introduction"],
+                content=content_key,
+                status=status,
+            ))
+        await mongodb.note_contents.insert_many(docs, ordered=False)
+        await self.model.bulk_create(notes)
+
+        # MySQL批量插入不返回自增ID，按正文key回查
+        return await self.model.filter(
+            knowledge_bases_id=knowledge_bases_id,
+            content__in=[doc["key"] for doc in docs],
+        ).values_list("id", flat=True)
+
+    async def _discard_imported(self, mongodb: AsyncIOMotorDatabase, content_keys: List[str]) -> None:
+        """删除导入失败时已写入的笔记、正文和分片"""
+        size = settings.NOTE_IMPORT_BATCH_SIZE
+        for start in range(0, len(content_keys), size):
+            keys = content_keys[start:start + size]
+            await self.model.filter(content__in=keys).delete()
+            await mongodb.note_contents.delete_many({"key": {"$in": keys}})
+            await mongodb.note_content_chunks.delete_many({"key": {"$in": keys}})
+
+    async def index_imported(self, mongodb: AsyncIOMotorDatabase, user_id: int, note_ids: List[int]) -> None:
+        """
+        为导入的笔记分批建立全文索引并记录初始版本, 供后台任务使用
+
+        每批重新从数据库读取笔记和正文, 不在任务参数中持有正文
+        """
+        batch_size = settings.NOTE_IMPORT_BATCH_SIZE
+        for start in range(0, len(note_ids), batch_size):
+            notes = await self.model.filter(id__in=note_ids[start:start + batch_size])
+            docs = await mongodb.note_contents.find(
+                {"key": {"$in": [note.content for note in notes]}}, CONTENT_PROJECTION
+            ).to_list(None)
+            contents = {doc["key"]: doc for doc in docs}
+            for note in notes:
+                content = await NoteContentCodec.load(mongodb, contents.get(note.content))
+                await NoteSearchIndex.safe_index_note(mongodb, note, content)
+                await NoteRevisionStore.safe_append(mongodb, note.id, user_id, content, note.created_at)
+
+    async def record_view(self, redis: Redis, note_id: int) -> int:
+        """
+        记录一次笔记浏览
+
+        浏览只在Redis中计数,由周期任务批量回写数据库
+
+        Args:
+            redis: Redis连接
+            note_id: 笔记ID
+
+        Returns:
+            int: 实时浏览次数(数据库已落库次数 + 待回写增量)
+        """
+        count = await RedisCache.incr_note_view(redis, note_id)
+        if count is None:
+            # 实时计数键不存在或已过期，用数据库值加待回写增量初始化，并发初始化只有一个生效；
+            # 读取数据库前记录回写代数，期间发生回写时不写入计数，避免重复计入已落库的增量
+            epoch = await RedisCache.get_view_flush_epoch(redis, note_id)
+            view_count = await self.model.filter(id=note_id).first().values_list("view_count", flat=True)
+            count = await RedisCache.seed_note_view_count(redis, note_id, view_count or 0, epoch)
+        await self.record_hot(redis, note_id, "view")
+        return count
+
+    async def record_hot(self, redis: Redis, note_id: int, event: str) -> None:
+        """
+        按事件增加笔记热度, 失败只记录日志, 不影响主流程
+
+        Args:
+            redis: Redis连接
+            note_id: 笔记ID
+            event: 事件类型, view、like 或 purchase
+        """
+        try:
+            await RedisCache.incr_hot_note(redis, note_id, HOT_EVENT_WEIGHTS[event])
+        except Exception as e:
+            logger.error(f"笔记 {note_id} 更新热度失败: {e}")
+
+    async def hot_notes(self, redis: Redis, limit: int) -> List[dict]:
+        """
+        获取热门笔记
+
+        从热门排行中按热度取出笔记ID, 一次 id__in 查询加载笔记,
+        过滤掉非公开的笔记后按排行顺序返回
+
+        Args:
+            redis: Redis连接
+            limit: 返回数量
+
+        Returns:
+            List[dict]: 笔记字典列表, 已填充作者和知识库信息
+        """
+        # 排行中可能有非公开笔记, 多取一些用于过滤
+        note_ids = await RedisCache.get_hot_notes(redis, limit * 2)
+        if not note_ids:
+            return []
+        notes = await self.model.filter(id__in=note_ids, status=1)
+        notes_by_id = {note.id: note for note in notes}
+
+        data = []
+        for note_id in note_ids:
+            note = notes_by_id.get(note_id)
+            if not note:
+                continue
+            note_dict = await note.to_dict(exclude_fields=["content"])
+            if 'price' in note_dict:
+                note_dict['price'] = float(note_dict['price'])
+            data.append(note_dict)
+            if len(data) >= limit:
+                break
+        await self.fill_view_counts(redis, data)
+        return await self.fill_relations(data)
+
+    async def flush_view_counts(self, redis: Redis) -> int:
+        """
+        将Redis中累积的浏览增量批量回写数据库
+
+        相同增量的笔记合并为 view_count = view_count + delta 的UPDATE, 每组写入后立即确认,
+        中途失败重试时只回写未确认的笔记; 每组写入后延长回写锁, 锁失效时停止本次回写
+
+        Returns:
+            int: 本次回写的笔记数量
+        """
+        token = await RedisCache.acquire_view_flush_lock(redis)
+        if not token:
+            return 0
+        flushed = 0
+        size = settings.NOTE_VIEW_FLUSH_BATCH_SIZE
+        try:
+            for shard in range(settings.NOTE_VIEW_SHARDS):
+                deltas = await RedisCache.take_note_view_deltas(redis, shard)
+                if not deltas:
+                    continue
+                groups: Dict[int, List[int]] = defaultdict(list)
+                for note_id, delta in deltas.items():
+                    groups[delta].append(note_id)
+                for delta, note_ids in groups.items():
+                    for start in range(0, len(note_ids), size):
+                        batch = note_ids[start:start + size]
+                        if delta:
+                            await self.model.filter(id__in=batch).update(view_count=F("view_count") + delta)
+                        await RedisCache.ack_note_view_group(redis, shard, batch)
+                        flushed += len(batch)
+                        if not await RedisCache.refresh_view_flush_lock(redis, token):
+                            logger.warning("浏览计数回写锁已失效，停止本次回写")
+                            return flushed
+                await RedisCache.ack_note_view_deltas(redis, shard)
+        finally:
+            await RedisCache.release_view_flush_lock(redis, token)
+            if flushed:
+                logger.info(f"回写笔记浏览次数 {flushed} 条")
+        return flushed
+
+    async def purge_knowledge_base(
+        self,
+        mongodb: AsyncIOMotorDatabase,
+        redis: Redis,
+        knowledge_bases_id: int,
+    ) -> bool:
+        """
+        分批删除已标记为删除中的知识库及其笔记
+
+        每批按ID顺序取出一段笔记, 先删除MongoDB中的正文、全文索引和历史版本,
+        再删除笔记行; 中途崩溃后重新执行会从剩余笔记的最小ID继续,
+        知识库记录在全部笔记删除后才删除
+
+        Args:
+            mongodb: MongoDB数据库实例
+            redis: Redis连接
+            knowledge_bases_id: 知识库ID
+
+        Returns:
+            bool: 是否完成删除, 知识库未标记删除、其他worker正在删除或删除锁失效时返回False
+        """
+        token = await RedisCache.acquire_purge_lock(redis, knowledge_bases_id)
+        if not token:
+            return False
+        try:
+            knowledge_base = await KnowledgeBases.filter(id=knowledge_bases_id, deleting=True).first()
+            if not knowledge_base:
+                return False
+
+            if not await RedisCache.get_purge_progress(redis, knowledge_bases_id):
+                # 进度丢失(如Redis重启)时按剩余笔记数重新统计
+                total = await self.model.filter(knowledge_bases_id=knowledge_bases_id).count()
+                await RedisCache.set_purge_progress(redis, knowledge_bases_id, total=total, deleted=0, done=0)
+
+            while True:
+                rows = await self.model.filter(knowledge_bases_id=knowledge_bases_id).order_by("id").limit(
+                    settings.KNOWLEDGE_BASE_PURGE_BATCH_SIZE
+                ).values_list("id", "content")
+                if not rows:
+                    break
+                note_ids = [row[0] for row in rows]
+                content_keys = [row[1] for row in rows]
+
+                await mongodb.note_contents.delete_many({"key": {"$in": content_keys}})
+                await mongodb.note_content_chunks.delete_many({"key": {"$in": content_keys}})
+                await NoteSearchIndex.remove_notes(mongodb, note_ids)
+                await NoteRevisionStore.remove_notes(mongodb, note_ids)
+                await self.model.filter(id__in=note_ids).delete()
+                await NoteLike.filter(note_id__in=note_ids).delete()
+                await NoteCollection.filter(note_id__in=note_ids).delete()
+                await RedisCache.clear_deleted_notes_cache(redis, note_ids)
+
+                await RedisCache.incr_purge_progress(redis, knowledge_bases_id, len(note_ids))
+                if not await RedisCache.refresh_purge_lock(redis, knowledge_bases_id, token):
+                    # 锁已过期并可能被其他worker取得，交给持有者继续删除
+                    logger.warning(f"知识库 {knowledge_bases_id} 删除锁已失效，停止本次删除")
+                    return False
+
+            await knowledge_base.delete()
+            await RedisCache.set_purge_progress(redis, knowledge_bases_id, expire=3600, done=1)
+            await RedisCache.clear_knowledge_base_cache(redis, knowledge_base.user_id, knowledge_bases_id)
+            logger.info(f"知识库 {knowledge_bases_id} 删除完成")
+            return True
+        finally:
+            await RedisCache.release_purge_lock(redis, knowledge_bases_id, token)
+
+    async def safe_purge_knowledge_base(
+        self,
+        mongodb: AsyncIOMotorDatabase,
+        redis: Redis,
+        knowledge_bases_id: int,
+    ) -> None:
+        """删除知识库, 失败只记录日志, 由周期任务稍后继续, 供后台任务使用"""
+        try:
+            await self.purge_knowledge_base(mongodb, redis, knowledge_bases_id)
+        except Exception as e:
+            logger.error(f"知识库 {knowledge_bases_id} 删除失败: {e}")
+
+    async def _ensure_likes_loaded(self, redis: Redis, note_id: int) -> None:
+        """笔记点赞用户集合不在Redis中时从数据库加载"""
+        if not await RedisCache.note_likes_loaded(redis, note_id):
+            user_ids = await NoteLike.filter(note_id=note_id).values_list("user_id", flat=True)
+            await RedisCache.load_note_likes(redis, note_id, user_ids)
+
+    async def set_liked(self, redis: Redis, note_id: int, user_id: int, liked: bool) -> bool:
+        """
+        点赞或取消点赞
+
+        点赞关系以 note_like 表为准, Redis集合作为缓存;
+        点赞记录和点赞数增量由周期任务批量回写数据库
+
+        Returns:
+            bool: 点赞关系是否发生变化
+        """
+        await self._ensure_likes_loaded(redis, note_id)
+        changed = await RedisCache.set_note_like(redis, note_id, user_id, liked)
+        if changed and liked:
+            await self.record_hot(redis, note_id, "like")
+        return changed
+
+    async def _ensure_collections_loaded(self, redis: Redis, user_id: int) -> None:
+        """用户收藏集合不在Redis中时从数据库加载"""
+        if not await RedisCache.user_collections_loaded(redis, user_id):
+            note_ids = await NoteCollection.filter(user_id=user_id).values_list("note_id", flat=True)
+            await RedisCache.load_user_collections(redis, user_id, note_ids)
+
+    async def set_collected(self, redis: Redis, user_id: int, note_id: int, collected: bool) -> bool:
+        """
+        收藏或取消收藏
+
+        收藏关系记录在Redis集合中, 由周期任务批量回写 note_collection 表
+
+        Returns:
+            bool: 收藏关系是否发生变化
+        """
+        await self._ensure_collections_loaded(redis, user_id)
+        return await RedisCache.set_note_collection(redis, user_id, note_id, collected)
+
+    async def interaction_state(self, redis: Redis, user_id: int, note_id: int) -> dict:
+        """获取用户对笔记的点赞和收藏状态"""
+        await asyncio.gather(
+            self._ensure_likes_loaded(redis, note_id),
+            self._ensure_collections_loaded(redis, user_id),
+        )
+        liked, collected = await asyncio.gather(
+            RedisCache.is_note_liked(redis, note_id, user_id),
+            RedisCache.is_note_collected(redis, user_id, note_id),
+        )
+        return {"liked": liked, "collected": collected}
+
+    async def _flush_memberships(self, model, changes: Dict[Tuple[int, int], bool]) -> None:
+        """
+        回写点赞或收藏关系
+
+        新增关系使用一次忽略冲突的批量插入, 取消的关系合并为一次DELETE;
+        笔记在回写前已被删除时丢弃新增的关系
+        """
+        note_ids = list({note_id for _, note_id in changes})
+        existing = set(await self.model.filter(id__in=note_ids).values_list("id", flat=True))
+        added = [pair for pair, state in changes.items() if state and pair[1] in existing]
+        removed = [pair for pair, state in changes.items() if not state]
+        if added:
+            await model.bulk_create(
+                [model(user_id=user_id, note_id=note_id) for user_id, note_id in added],
+                ignore_conflicts=True,
+            )
+        if removed:
+            query = Q(*[Q(user_id=user_id, note_id=note_id) for user_id, note_id in removed], join_type="OR")
+            await model.filter(query).delete()
+
+    async def flush_interactions(self, redis: Redis) -> int:
+        """
+        将Redis中累积的点赞增量、点赞记录和收藏记录批量回写数据库
+
+        相同增量的笔记合并为一条 like_count = like_count + delta 的UPDATE;
+        点赞和收藏关系见 _flush_memberships
+
+        Returns:
+            int: 本次回写的记录数量
+        """
+        token = await RedisCache.acquire_interaction_flush_lock(redis)
+        if not token:
+            return 0
+        flushed = 0
+        try:
+            for shard in range(settings.NOTE_INTERACTION_SHARDS):
+                deltas = await RedisCache.take_note_like_deltas(redis, shard)
+                if deltas:
+                    groups: Dict[int, List[int]] = defaultdict(list)
+                    for note_id, delta in deltas.items():
+                        if delta:
+                            groups[delta].append(note_id)
+                    for delta, note_ids in groups.items():
+                        await self.model.filter(id__in=note_ids).update(like_count=F("like_count") + delta)
+                    await RedisCache.ack_note_like_deltas(redis, shard)
+                    flushed += len(deltas)
+
+                likes = await RedisCache.take_note_like_changes(redis, shard)
+                if likes:
+                    await self._flush_memberships(NoteLike, likes)
+                    await RedisCache.ack_note_like_changes(redis, shard)
+                    flushed += len(likes)
+
+                changes = await RedisCache.take_note_collection_changes(redis, shard)
+                if changes:
+                    await self._flush_memberships(NoteCollection, changes)
+                    await RedisCache.ack_note_collection_changes(redis, shard)
+                    flushed += len(changes)
+
+                # 变更已落库，恢复相关集合的过期时间
+                await RedisCache.expire_interaction_sets(
+                    redis,
+                    list({note_id for _, note_id in likes}),
+                    list({user_id for user_id, _ in changes}),
+                )
+        finally:
+            await RedisCache.release_interaction_flush_lock(redis, token)
+        if flushed:
+            logger.info(f"回写笔记点赞和收藏 {flushed} 条")
+        return flushed
+
+
+# 创建笔记控制器实例
+note_controller = NoteController()
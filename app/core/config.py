@@ -46,7 +46,70 @@ class Settings(BaseSettings):
     REDIS_SOCKET_TIMEOUT: int = 5
     REDIS_RETRY_ON_TIMEOUT: bool = True
     REDIS_URL: str = f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
-    
+    REDIS_CODEC: str = "json"                 # 缓存值编码: json(安装orjson时使用orjson) 或 msgpack(需要安装msgpack)
+    REDIS_COMPRESS_THRESHOLD: int = 1024      # 序列化后超过该字节数才压缩
+    REDIS_COMPRESS_LEVEL: int = 1             # zlib压缩级别
+
+    # 进程内一级缓存配置
+    LOCAL_CACHE_ENABLED: bool = True
+    LOCAL_CACHE_MAX_ENTRY_BYTES: int = 256 * 1024    # 超过该字节数的数据不进入一级缓存
+    LOCAL_CACHE_FAMILIES: dict = {                   # 键族 -> 容量上限(字节)和过期时间(秒)
+        "note_content": {"max_bytes": 32 * 1024 * 1024, "ttl": 30},
+        "user_permissions": {"max_bytes": 4 * 1024 * 1024, "ttl": 60},
+        "response": {"max_bytes": 16 * 1024 * 1024, "ttl": 30},
+        "response_generation": {"max_bytes": 1024 * 1024, "ttl": 5, "max_entry_bytes": 64},
+    }
+
+    # 缓存回源配置
+    SINGLE_FLIGHT_LOCK_EXPIRE: int = 5        # 跨worker回源锁过期时间(秒)
+    SINGLE_FLIGHT_WAIT: float = 3             # 未抢到锁时等待其他worker回源的最长时间(秒)
+    SINGLE_FLIGHT_POLL_INTERVAL: float = 0.05  # 等待期间轮询缓存的间隔(秒)
+    CACHE_STALE_TTL: int = 300                # 缓存软过期后仍返回旧数据并在后台刷新的时间(秒)
+    NEGATIVE_CACHE_TTL: int = 60              # 实体不存在标记的过期时间(秒), 期间不再查询数据库
+    CACHE_METRICS_FLUSH_INTERVAL: int = 10    # 各worker的缓存指标合并到Redis的间隔(秒)
+
+    # 笔记浏览计数回写配置
+    NOTE_VIEW_SHARDS: int = 16                # 浏览增量分片数
+    NOTE_VIEW_FLUSH_INTERVAL: int = 60        # 回写数据库间隔(秒)
+    NOTE_VIEW_FLUSH_BATCH_SIZE: int = 500     # 每条UPDATE回写的笔记数
+    NOTE_INTERACTION_FLUSH_INTERVAL: int = 10  # 点赞和收藏回写数据库间隔(秒)
+    NOTE_INTERACTION_SHARDS: int = 16         # 点赞和收藏待回写数据分片数
+    NOTE_INTERACTION_CACHE_TTL: int = 86400   # 点赞用户集合和收藏集合在没有待回写变更时的过期时间(秒)
+
+    # 笔记正文压缩配置
+    NOTE_CONTENT_CODEC: str = "zlib"                 # 压缩算法: zlib 或 zstd
+    NOTE_CONTENT_COMPRESS_THRESHOLD: int = 4096      # 超过该字节数才压缩
+    NOTE_CONTENT_COMPRESS_LEVEL: int = 6             # 压缩级别
+    NOTE_CONTENT_MIGRATE_INTERVAL: int = 30          # 旧文档压缩迁移间隔(秒)
+    NOTE_CONTENT_CHUNK_THRESHOLD: int = 1024 * 1024  # 超过该字节数分片存储
+    NOTE_CONTENT_CHUNK_SIZE: int = 256 * 1024        # 每个分片/流式片段的字符数
+    NOTE_CONTENT_CHUNK_GC_GRACE: int = 600           # 被替换的分片版本保留时间(秒), 供正在读取的请求读完
+    NOTE_CONTENT_CHUNK_GC_INTERVAL: int = 60         # 回收被替换分片的间隔(秒)
+    NOTE_REVISION_MAX_CHAIN: int = 20                # 历史版本差量链最大长度
+
+    # 笔记批量导入配置
+    NOTE_IMPORT_MAX_FILES: int = 10000               # 单个归档最多导入的文件数
+    NOTE_IMPORT_MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 单个文件最大字节数
+    NOTE_IMPORT_BATCH_SIZE: int = 200                # 每批写入的笔记数
+    NOTE_EXPORT_BATCH_SIZE: int = 200                # 导出时每批读取的笔记数
+    KNOWLEDGE_BASE_PURGE_BATCH_SIZE: int = 500       # 后台删除知识库时每批删除的笔记数
+    KNOWLEDGE_BASE_PURGE_INTERVAL: int = 60          # 检查未完成的知识库删除任务的间隔(秒)
+
+    # 热门笔记排行配置
+    HOT_NOTES_HALF_LIFE: int = 86400          # 热度半衰期(秒)
+    HOT_NOTES_MAX_SIZE: int = 10000           # 排行最多保留的笔记数
+    HOT_NOTES_PRUNE_INTERVAL: int = 300       # 裁剪排行的间隔(秒)
+    HOT_NOTES_REBASE_HALF_LIVES: int = 32     # 基准时间落后多少个半衰期后重新缩放分数, 防止分数溢出
+    HOT_NOTES_WEIGHT_VIEW: float = 1          # 一次浏览的热度
+    HOT_NOTES_WEIGHT_LIKE: float = 5          # 一次点赞的热度
+    HOT_NOTES_WEIGHT_PURCHASE: float = 20     # 一次购买的热度
+
+    # 关注动态配置
+    FEED_MAX_LENGTH: int = 800                # 每个用户时间线最多保留的笔记数
+    FEED_EXPIRE: int = 7 * 86400              # 时间线过期时间(秒), 不活跃用户的时间线过期后不再推送
+    FEED_FANOUT_MAX_FOLLOWERS: int = 5000     # 粉丝数超过该值的作者不推送, 读取时拉取
+    FEED_FANOUT_BATCH_SIZE: int = 1000        # 推送时每批处理的粉丝数
+
     # 日期时间格式
     DATETIME_FORMAT: str = "%Y-%m-%d %H:%M:%S"  # 日期时间格式化字符串
 
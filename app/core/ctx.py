@@ -10,3 +10,13 @@ CTX_USER_ID: contextvars.ContextVar[int] = contextvars.ContextVar("user_id", def
 # 用于存储当前请求的后台任务队列
 # default=None 表示默认没有后台任务
 CTX_BG_TASKS: contextvars.ContextVar[BackgroundTasks] = contextvars.ContextVar("bg_task", default=None)
+
+# 请求级身份映射上下文变量
+# 用于在一次请求内缓存已加载的模型实例,避免重复查询
+# default=None 表示默认没有身份映射
+CTX_IDENTITY_MAP: contextvars.ContextVar["IdentityMap"] = contextvars.ContextVar("identity_map", default=None)
+
+# 条件请求上下文变量
+# 用于存储当前请求的 If-None-Match 请求头,供响应判断是否返回304
+# default=None 表示请求未携带该请求头
+CTX_IF_NONE_MATCH: contextvars.ContextVar[str] = contextvars.ContextVar("if_none_match", default=None)
@@ -0,0 +1,40 @@
+"""
+ETag 条件请求
+
+响应通过 etag 参数声明实体标签, 请求头 If-None-Match 与之匹配时返回 304 且不序列化响应体
+"""
+
+import hashlib
+from typing import Union
+
+from .ctx import CTX_IF_NONE_MATCH
+
+
+def make_etag(payload: Union[str, bytes]) -> str:
+    """
+    根据序列化后的数据生成强ETag
+
+    Args:
+        payload: 序列化后的响应数据
+
+    Returns:
+        str: 带引号的ETag, 如 "9f86d081884c7d65"
+    """
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return f'"{hashlib.sha256(payload).hexdigest()[:32]}"'
+
+
+def etag_matches(etag: str) -> bool:
+    """
+    判断当前请求的 If-None-Match 是否与ETag匹配
+
+    按RFC 7232使用弱比较, 支持 * 和逗号分隔的多个标签
+    """
+    header = CTX_IF_NONE_MATCH.get()
+    if not header or not etag:
+        return False
+    if header.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
@@ -0,0 +1,70 @@
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set, Type, TypeVar
+
+from tortoise.models import Model
+
+from .ctx import CTX_IDENTITY_MAP
+
+ModelType = TypeVar("ModelType", bound=Model)
+
+
+class IdentityMap:
+    """
+    请求级身份映射
+    在一次请求内按 (模型, ID) 缓存已加载的实例,
+    同一批ID只发起一次 id__in 查询,避免列表接口逐条查询造成的 N+1 问题
+    """
+
+    def __init__(self) -> None:
+        self._objects: Dict[Type[Model], Dict[int, Model]] = defaultdict(dict)
+        # 记录已确认不存在的ID,避免重复查询
+        self._missing: Dict[Type[Model], Set[int]] = defaultdict(set)
+
+    @classmethod
+    async def init_identity_map(cls) -> None:
+        """实例化身份映射，并设置到上下文"""
+        CTX_IDENTITY_MAP.set(cls())
+
+    @classmethod
+    def current(cls) -> "IdentityMap":
+        """从上下文中获取身份映射实例,不存在时(如后台任务中)创建新实例"""
+        identity_map = CTX_IDENTITY_MAP.get()
+        if identity_map is None:
+            identity_map = cls()
+            CTX_IDENTITY_MAP.set(identity_map)
+        return identity_map
+
+    def add(self, obj: Model) -> None:
+        """将已加载的实例放入身份映射"""
+        self._objects[type(obj)][obj.pk] = obj
+        self._missing[type(obj)].discard(obj.pk)
+
+    async def load_many(self, model: Type[ModelType], ids: Iterable[Optional[int]]) -> Dict[int, ModelType]:
+        """
+        批量加载模型实例
+
+        Args:
+            model: 模型类
+            ids: ID集合,None会被忽略
+
+        Returns:
+            Dict[int, ModelType]: ID到实例的映射,不存在的ID不会出现在结果中
+        """
+        ids = {int(i) for i in ids if i is not None}
+        loaded = self._objects[model]
+        missing = self._missing[model]
+
+        # 只查询尚未加载过的ID
+        to_fetch = ids - loaded.keys() - missing
+        if to_fetch:
+            for obj in await model.filter(id__in=list(to_fetch)):
+                loaded[obj.pk] = obj
+            missing.update(to_fetch - loaded.keys())
+
+        return {i: loaded[i] for i in ids if i in loaded}
+
+    async def get(self, model: Type[ModelType], id: Optional[int]) -> Optional[ModelType]:
+        """加载单个模型实例,不存在时返回None"""
+        if id is None:
+            return None
+        return (await self.load_many(model, [id])).get(int(id))
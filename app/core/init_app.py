@@ -1,3 +1,4 @@
+import asyncio
 import shutil
 
 from aerich import Command
@@ -26,8 +27,17 @@ from app.log import logger
 from app.models.admin import Api, Menu, Role
 from app.models.enums import MenuType
 from app.core.config import settings
+from app.core.dependency import MongoDBControl
+from app.utils.content_codec import NoteContentCodec
+from app.utils.revision import NoteRevisionStore
+from app.utils.search import NoteSearchIndex
 
-from .middlewares import BackGroundTaskMiddleware, HttpAuditLogMiddleware
+from .middlewares import (
+    BackGroundTaskMiddleware,
+    ConditionalRequestMiddleware,
+    HttpAuditLogMiddleware,
+    IdentityMapMiddleware,
+)
 
 
 
@@ -49,6 +59,10 @@ def make_middlewares():
         ),
         # 后台任务中间件：处理异步任务
         Middleware(BackGroundTaskMiddleware),
+        # 身份映射中间件：请求级实例缓存
+        Middleware(IdentityMapMiddleware),
+        # 条件请求中间件：支持ETag/If-None-Match
+        Middleware(ConditionalRequestMiddleware),
         # HTTP审计日志中间件：记录请求日志
         Middleware(
             HttpAuditLogMiddleware,
@@ -243,6 +257,16 @@ async def init_apis():
 
 
 
+async def init_mongo_indexes():
+    """初始化笔记正文、全文索引和历史版本所需的MongoDB索引"""
+    mongodb = await MongoDBControl.get_mongo_pool()
+    await NoteContentCodec.ensure_indexes(mongodb)
+    await NoteSearchIndex.ensure_indexes(mongodb)
+    await NoteRevisionStore.ensure_indexes(mongodb)
+    # 索引为空或版本过旧时在后台为已有笔记建立索引，不阻塞启动
+    asyncio.create_task(NoteSearchIndex.rebuild_if_outdated(mongodb))
+
+
 async def init_data():
     """系统初始化主函数"""
     # 按顺序执行初始化操作
@@ -250,4 +274,5 @@ async def init_data():
     await init_menus()
     await init_roles()
     await init_apis()
+    await init_mongo_indexes()
     
@@ -0,0 +1,77 @@
+"""
+周期任务定义
+
+在此注册的任务会在应用启动时由 PeriodicTasks 统一启动,
+标记 run_on_shutdown 的回写任务在应用关闭时再执行一次
+"""
+
+from app.controllers.note import note_controller
+from app.core.config import settings
+from app.core.dependency import MongoDBControl, RedisControl
+from app.log import logger
+from app.models.admin import KnowledgeBases
+from app.utils.cache_metrics import CacheMetrics
+from app.utils.content_codec import NoteContentCodec
+from app.utils.redis_cache import RedisCache
+
+from .periodic import PeriodicTasks
+
+
+@PeriodicTasks.register(interval=settings.NOTE_VIEW_FLUSH_INTERVAL, run_on_shutdown=True)
+async def flush_note_views():
+    """回写笔记浏览次数"""
+    redis = await RedisControl.get_redis_pool()
+    await note_controller.flush_view_counts(redis)
+
+
+@PeriodicTasks.register(interval=settings.NOTE_INTERACTION_FLUSH_INTERVAL, run_on_shutdown=True)
+async def flush_note_interactions():
+    """回写笔记点赞数和收藏记录"""
+    redis = await RedisControl.get_redis_pool()
+    await note_controller.flush_interactions(redis)
+
+
+@PeriodicTasks.register(interval=settings.NOTE_CONTENT_MIGRATE_INTERVAL)
+async def migrate_note_contents():
+    """逐批压缩旧的笔记正文文档,每次最多处理10批"""
+    mongodb = await MongoDBControl.get_mongo_pool()
+    for _ in range(10):
+        if not await NoteContentCodec.migrate_batch(mongodb):
+            break
+
+
+@PeriodicTasks.register(interval=settings.NOTE_CONTENT_CHUNK_GC_INTERVAL)
+async def gc_note_content_chunks():
+    """删除超过宽限期的被替换正文分片"""
+    mongodb = await MongoDBControl.get_mongo_pool()
+    removed = await NoteContentCodec.gc_chunks(mongodb)
+    if removed:
+        logger.info(f"回收 {removed} 个被替换的正文分片")
+
+
+@PeriodicTasks.register(interval=settings.KNOWLEDGE_BASE_PURGE_INTERVAL)
+async def purge_knowledge_bases():
+    """继续执行未完成的知识库删除(如删除过程中进程重启)"""
+    knowledge_bases_ids = await KnowledgeBases.filter(deleting=True).values_list("id", flat=True)
+    if not knowledge_bases_ids:
+        return
+    mongodb = await MongoDBControl.get_mongo_pool()
+    redis = await RedisControl.get_redis_pool()
+    for knowledge_bases_id in knowledge_bases_ids:
+        await note_controller.purge_knowledge_base(mongodb, redis, knowledge_bases_id)
+
+
+@PeriodicTasks.register(interval=settings.HOT_NOTES_PRUNE_INTERVAL)
+async def prune_hot_notes():
+    """裁剪热门笔记排行,保持排行大小有界"""
+    redis = await RedisControl.get_redis_pool()
+    removed = await RedisCache.prune_hot_notes(redis)
+    if removed:
+        logger.info(f"热门笔记排行移除 {removed} 篇笔记")
+
+
+@PeriodicTasks.register(interval=settings.CACHE_METRICS_FLUSH_INTERVAL, run_on_shutdown=True)
+async def flush_cache_metrics():
+    """合并本worker的缓存指标到Redis"""
+    redis = await RedisControl.get_redis_pool()
+    await CacheMetrics.flush(redis)
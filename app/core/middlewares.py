@@ -12,6 +12,8 @@ from app.core.dependency import AuthControl
 from app.models.admin import AuditLog, User
 
 from .bgtask import BgTasks
+from .ctx import CTX_IF_NONE_MATCH
+from .identity_map import IdentityMap
 
 
 class SimpleBaseMiddleware:
@@ -73,6 +75,26 @@ class BackGroundTaskMiddleware(SimpleBaseMiddleware):
         await BgTasks.execute_tasks()
 
 
+class IdentityMapMiddleware(SimpleBaseMiddleware):
+    """
+    身份映射中间件
+    为每个请求初始化独立的身份映射,保证实例缓存只在单次请求内有效
+    """
+    async def before_request(self, request):
+        """请求前初始化身份映射"""
+        await IdentityMap.init_identity_map()
+
+
+class ConditionalRequestMiddleware(SimpleBaseMiddleware):
+    """
+    条件请求中间件
+    将 If-None-Match 请求头写入上下文,供声明了ETag的响应判断是否返回304
+    """
+    async def before_request(self, request):
+        """请求前记录 If-None-Match 请求头"""
+        CTX_IF_NONE_MATCH.set(request.headers.get("if-none-match"))
+
+
 class HttpAuditLogMiddleware(BaseHTTPMiddleware):
     """
     HTTP审计日志中间件
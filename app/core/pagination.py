@@ -0,0 +1,76 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple, TypeVar
+
+from fastapi.exceptions import HTTPException
+from tortoise.expressions import Q
+from tortoise.models import Model
+from tortoise.queryset import QuerySet
+
+ModelType = TypeVar("ModelType", bound=Model)
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    """
+    将 (created_at, id) 编码为不透明的游标字符串
+
+    Args:
+        created_at: 当前页最后一条记录的创建时间
+        id: 当前页最后一条记录的ID
+
+    Returns:
+        str: URL安全的base64游标
+    """
+    raw = json.dumps([created_at.isoformat(), id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    解析游标字符串
+
+    Raises:
+        HTTPException: 游标格式不正确时返回400
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="无效的游标")
+
+
+async def keyset_paginate(
+    queryset: QuerySet[ModelType],
+    cursor: Optional[str],
+    page_size: int,
+) -> Tuple[List[ModelType], Optional[str]]:
+    """
+    基于 (created_at, id) 的游标分页
+
+    按 created_at、id 倒序返回,使用索引范围条件代替 OFFSET,
+    翻页耗时与页深无关
+
+    Args:
+        queryset: 已应用筛选条件的查询集
+        cursor: 上一页返回的 next_cursor,为空字符串或None时从第一页开始
+        page_size: 每页数量
+
+    Returns:
+        Tuple[List[ModelType], Optional[str]]: (当前页数据, 下一页游标),没有更多数据时游标为None
+    """
+    if cursor:
+        created_at, id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | (Q(created_at=created_at) & Q(id__lt=id))
+        )
+
+    # 多取一条用于判断是否还有下一页
+    items = await queryset.order_by("-created_at", "-id").limit(page_size + 1)
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return items, next_cursor
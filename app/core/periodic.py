@@ -0,0 +1,64 @@
+import asyncio
+from typing import Awaitable, Callable, List, Tuple
+
+from app.log import logger
+
+
+class PeriodicTasks:
+    """周期任务统一管理"""
+
+    _jobs: List[Tuple[Callable[[], Awaitable[None]], float, bool]] = []  # (任务函数, 执行间隔秒, 关闭时是否执行)
+    _tasks: List[asyncio.Task] = []
+
+    @classmethod
+    def register(cls, interval: float, run_on_shutdown: bool = False):
+        """
+        注册周期任务的装饰器
+
+        Args:
+            interval: 执行间隔(秒)
+            run_on_shutdown: 应用关闭时是否再执行一次, 只用于回写内存或Redis中未落库数据的任务
+        """
+        def decorator(func: Callable[[], Awaitable[None]]):
+            cls._jobs.append((func, interval, run_on_shutdown))
+            return func
+        return decorator
+
+    @classmethod
+    async def _run(cls, func: Callable[[], Awaitable[None]], interval: float) -> None:
+        """循环执行任务,单次失败只记录日志,不影响后续执行"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await func()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"周期任务 {func.__name__} 执行失败: {e}")
+
+    @classmethod
+    async def start(cls) -> None:
+        """启动所有已注册的周期任务,应用启动时调用"""
+        for func, interval, _ in cls._jobs:
+            cls._tasks.append(asyncio.create_task(cls._run(func, interval)))
+
+    @classmethod
+    async def stop(cls, run_once: bool = True) -> None:
+        """
+        停止所有周期任务,应用关闭时调用
+
+        Args:
+            run_once: 停止后是否再执行一次注册时标记了 run_on_shutdown 的任务,用于关闭前回写未落库的数据
+        """
+        for task in cls._tasks:
+            task.cancel()
+        await asyncio.gather(*cls._tasks, return_exceptions=True)
+        cls._tasks.clear()
+        if run_once:
+            for func, _, run_on_shutdown in cls._jobs:
+                if not run_on_shutdown:
+                    continue
+                try:
+                    await func()
+                except Exception as e:
+                    logger.error(f"周期任务 {func.__name__} 执行失败: {e}")
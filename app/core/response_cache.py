@@ -0,0 +1,288 @@
+"""
+接口响应缓存
+
+以装饰器声明路由的响应缓存:
+- 缓存键由校验后的查询参数规范化生成, 可按当前用户区分
+- 缓存内容为序列化后的响应体, 命中时直接返回字节, 并支持ETag条件请求
+- 每个缓存可关联多个失效范围(标签), 每个标签有一个代数计数器并写入缓存键,
+  失效时只需对计数器执行一次 INCR, 旧代数的缓存不再被读取, 由过期时间自然清理
+- 并发的未命中只执行一次接口, 见 SingleFlight
+- 缓存有软、硬两个过期时间: 软过期后硬过期前仍直接返回旧响应, 同时在后台任务中重新执行接口刷新缓存
+- 代数和响应体同时放入进程内一级缓存, 缓存键包含代数, 响应体不需要单独失效,
+  代数变化时通过发布订阅通知各worker
+- 命中率、读写延迟等指标以 "resp:命名空间" 为键族计入 CacheMetrics
+- skip_if 对取值无界的查询(关键词搜索、游标翻页)不使用缓存, 避免缓存键数量无界
+
+用法:
+    @router.get("/list")
+    @ResponseCache.cached("notes_list", expire=300, tags=[CacheTag.NOTES_LIST])
+    async def get_notes(page: int = Query(1)):
+        ...
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import params
+from fastapi.responses import JSONResponse, Response
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+
+from app.core.config import settings
+from app.log import logger
+from app.utils.cache_metrics import CacheMetrics
+from app.utils.local_cache import LocalCache
+from app.utils.single_flight import SingleFlight
+
+from .ctx import CTX_USER_ID
+from .dependency import RedisControl
+from .etag import etag_matches, make_etag
+
+
+class CacheTag:
+    """缓存标签(失效范围)定义, 花括号中的字段取自查询参数, current_user_id 为当前登录用户"""
+    NOTES_LIST = "notes_list"
+    KNOWLEDGE_BASES = "knowledge_bases:{user_id}"
+    KNOWLEDGE_BASE_NOTES = "knowledge_base_notes:{knowledge_bases_id}"
+    USER_MENUS = "user_menus:{current_user_id}"
+
+
+class ResponseCache:
+    """接口响应缓存"""
+
+    KEY_PREFIX = "resp_cache"
+    GENERATION_PREFIX = "resp_gen"
+
+    @staticmethod
+    def make_key(
+        namespace: str,
+        query: Dict[str, Any],
+        user_id: Optional[int] = None,
+        generations: Iterable[int] = (),
+    ) -> str:
+        """
+        生成规范化的缓存键
+
+        值为None的参数视为未传, 其余参数按名称排序后序列化并取哈希,
+        参数顺序和未传的可选参数不影响缓存键
+
+        Args:
+            namespace: 缓存命名空间, 通常为接口名
+            query: 查询参数
+            user_id: 按用户区分时的用户ID
+            generations: 关联标签的当前代数
+        """
+        normalized = {name: value for name, value in query.items() if value is not None}
+        digest = hashlib.sha1(
+            json.dumps(normalized, sort_keys=True, default=str, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:20]
+        scope = f"u{user_id}:" if user_id is not None else ""
+        generation = "g" + "-".join(str(g) for g in generations) + ":" if generations else ""
+        return f"{ResponseCache.KEY_PREFIX}:{namespace}:{scope}{generation}{digest}"
+
+    @staticmethod
+    def metrics_family(key: str) -> str:
+        """缓存键对应的指标键族"""
+        return f"resp:{key.split(':', 2)[1]}"
+
+    @staticmethod
+    def _generation_key(tag: str) -> str:
+        return f"{ResponseCache.GENERATION_PREFIX}:{tag}"
+
+    @staticmethod
+    async def generations(redis: Redis, tags: List[str]) -> List[int]:
+        """一次读取多个标签的当前代数, 未失效过的标签为0; 优先读取一级缓存"""
+        if not tags:
+            return []
+        keys = [ResponseCache._generation_key(tag) for tag in tags]
+        local = LocalCache.family("response_generation")
+        found: Dict[str, int] = {}
+        if local:
+            token = local.token()
+            for key in keys:
+                generation = local.get(key)
+                if generation is not None:
+                    found[key] = generation
+        missing = [key for key in keys if key not in found]
+        if missing:
+            values = await redis.mget(missing)
+            for key, value in zip(missing, values):
+                found[key] = int(value or 0)
+                if local:
+                    local.set(key, found[key], len(key), token=token)
+        return [found[key] for key in keys]
+
+    @staticmethod
+    async def get(redis: Redis, key: str) -> Optional[Tuple[str, str, float]]:
+        """
+        读取缓存的响应
+
+        Returns:
+            Optional[Tuple[str, str, float]]: (ETag, 响应体, 软过期时间戳), 未命中返回None
+        """
+        local = LocalCache.family("response")
+        if local:
+            cached = local.get(key)
+            if cached is not None:
+                return cached
+        start = time.perf_counter()
+        value = await redis.get(key)
+        CacheMetrics.record_get(
+            ResponseCache.metrics_family(key), time.perf_counter() - start, len(value) if value else None
+        )
+        if not value:
+            return None
+        parts = value.split("\n", 2)
+        if len(parts) != 3:
+            return None
+        etag, fresh_until, body = parts
+        try:
+            cached = (etag, body, float(fresh_until))
+        except ValueError:
+            return None
+        ResponseCache._set_local(key, cached)
+        return cached
+
+    @staticmethod
+    def _set_local(key: str, cached: Tuple[str, str, float]) -> None:
+        """写入一级缓存, 只缓存到软过期, 软过期后从Redis读取, 以便读到后台刷新的结果"""
+        local = LocalCache.family("response")
+        ttl = cached[2] - time.time()
+        if local and ttl > 0:
+            # 缓存键包含标签代数, 内容只会被刷新不会失效, 不需要令牌
+            local.set(key, cached, len(cached[1]), ttl=ttl)
+
+    @staticmethod
+    async def set(redis: Redis, key: str, body: bytes, expire: int, stale: int = 0) -> Tuple[str, str, float]:
+        """
+        写入响应缓存
+
+        Args:
+            redis: Redis连接
+            key: 缓存键(已包含标签代数)
+            body: 序列化后的响应体
+            expire: 软过期时间(秒)
+            stale: 软过期后仍可返回旧响应的时间(秒), 硬过期时间为两者之和
+
+        Returns:
+            Tuple[str, str, float]: (ETag, 响应体, 软过期时间戳)
+        """
+        etag = make_etag(body)
+        text = body.decode("utf-8")
+        fresh_until = time.time() + expire
+        start = time.perf_counter()
+        await redis.set(key, f"{etag}\n{fresh_until}\n{text}", ex=expire + stale)
+        CacheMetrics.record_set(ResponseCache.metrics_family(key), time.perf_counter() - start, len(body))
+        cached = (etag, text, fresh_until)
+        ResponseCache._set_local(key, cached)
+        return cached
+
+    @staticmethod
+    async def invalidate(redis: Redis, *tags: str) -> None:
+        """按标签失效缓存, 每个标签只执行一次 INCR, 并通知各worker丢弃一级缓存中的代数"""
+        if not tags:
+            return
+        async with redis.pipeline(transaction=False) as pipe:
+            ResponseCache.queue_invalidate(pipe, tags)
+            await pipe.execute()
+
+    @staticmethod
+    def queue_invalidate(pipe: Pipeline, tags: Iterable[str]) -> None:
+        """把标签失效命令加入pipeline, 与其他缓存操作一起发送"""
+        keys = [ResponseCache._generation_key(tag) for tag in tags]
+        for key in keys:
+            pipe.incr(key)
+        LocalCache.queue_invalidate(pipe, "response_generation", keys)
+
+    @staticmethod
+    def respond(etag: str, body: str | bytes) -> Response:
+        """根据ETag返回304或缓存的响应体"""
+        if etag_matches(etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+    @staticmethod
+    def cached(
+        namespace: str,
+        expire: int = 300,
+        stale: Optional[int] = None,
+        vary_by_user: bool = False,
+        tags: Iterable[str] = (),
+        skip_if: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ):
+        """
+        路由响应缓存装饰器, 放在路由装饰器之下
+
+        只缓存状态码为200的JSON响应; Redis不可用时直接执行接口
+
+        Args:
+            namespace: 缓存命名空间
+            expire: 软过期时间(秒)
+            stale: 软过期后仍返回旧响应并在后台刷新的时间(秒), 默认为 CACHE_STALE_TTL, 0表示不使用
+            vary_by_user: 是否按当前登录用户区分缓存
+            tags: 失效标签, 可使用查询参数和 current_user_id 作为格式化字段;
+                标签的代数写入缓存键, 标签失效后旧缓存不再命中
+            skip_if: 接收查询参数, 返回True时直接执行接口, 不读写缓存
+        """
+        tags = tuple(tags)
+        stale = settings.CACHE_STALE_TTL if stale is None else stale
+
+        def decorator(func):
+            # 依赖注入的参数(Redis、MongoDB等)不参与缓存键
+            query_names = [
+                name for name, parameter in inspect.signature(func).parameters.items()
+                if not isinstance(parameter.default, params.Depends)
+            ]
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                query = {name: kwargs.get(name) for name in query_names}
+                if skip_if is not None and skip_if(query):
+                    return await func(*args, **kwargs)
+                user_id = CTX_USER_ID.get()
+                resolved_tags = [tag.format(current_user_id=user_id, **query) for tag in tags]
+
+                try:
+                    redis = await RedisControl.get_redis_pool()
+                    generations = await ResponseCache.generations(redis, resolved_tags)
+                    key = ResponseCache.make_key(
+                        namespace, query, user_id if vary_by_user else None, generations
+                    )
+                    cached = await ResponseCache.get(redis, key)
+                except Exception as e:
+                    logger.warning(f"读取响应缓存 {namespace} 失败: {e}")
+                    CacheMetrics.incr(f"resp:{namespace}", "errors")
+                    return await func(*args, **kwargs)
+
+                async def load():
+                    response = await func(*args, **kwargs)
+                    if not isinstance(response, JSONResponse) or response.status_code != 200:
+                        return response
+                    try:
+                        return await ResponseCache.set(redis, key, response.body, expire, stale)
+                    except Exception as e:
+                        logger.warning(f"写入响应缓存 {key} 失败: {e}")
+                        CacheMetrics.incr(f"resp:{namespace}", "errors")
+                        return response
+
+                is_stale = bool(cached) and cached[2] <= time.time()
+                CacheMetrics.record_lookup(f"resp:{namespace}", bool(cached), is_stale)
+                if cached:
+                    etag, body, _ = cached
+                    if is_stale:
+                        await SingleFlight.schedule_refresh(redis, key, load)
+                    return ResponseCache.respond(etag, body)
+
+                # 并发的未命中只执行一次接口
+                result = await SingleFlight.load(redis, key, lambda: ResponseCache.get(redis, key), load)
+                if isinstance(result, Response):
+                    return result
+                etag, body, _ = result
+                return ResponseCache.respond(etag, body)
+
+            return wrapper
+        return decorator
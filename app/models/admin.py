@@ -99,6 +99,7 @@ class KnowledgeBases(BaseModel, TimestampMixin):
     user_id = fields.IntField(description="用户ID", index=True)
     name = fields.CharField(max_length=200, description="标题")
     type = fields.IntField(description="类型: 0-私有 1-公开", default=0)
+    deleting = fields.BooleanField(default=False, description="是否正在后台删除")
     
     class Meta:
         table = "knowledge_bases"
@@ -136,6 +137,16 @@ class NoteCollection(BaseModel, TimestampMixin):
         unique_together = ("user_id", "note_id")
 
 
+class NoteLike(BaseModel, TimestampMixin):
+    """笔记点赞表"""
+    user_id = fields.IntField(description="用户ID", index=True)
+    note_id = fields.IntField(description="笔记ID", index=True)
+    
+    class Meta:
+        table = "note_like"
+        unique_together = ("user_id", "note_id")
+
+
 class Account(BaseModel, TimestampMixin):
     """账户表 - 用户资金账户"""
     user_id = fields.IntField(description="用户ID", unique=True, index=True)
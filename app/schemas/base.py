@@ -2,8 +2,35 @@ from typing import Any, Optional
 
 from fastapi.responses import JSONResponse
 
+from app.core.etag import etag_matches
 
-class Success(JSONResponse):
+
+class ConditionalJSONResponse(JSONResponse):
+    """
+    支持ETag的JSON响应类
+    传入etag时设置ETag响应头,若与请求的If-None-Match匹配则返回304且不序列化响应内容
+    """
+    def __init__(
+        self,
+        content: Any,
+        status_code: int = 200,
+        etag: Optional[str] = None,         # 实体标签,为None时不做条件判断
+    ):
+        headers = None
+        if etag is not None:
+            headers = {"ETag": etag}
+            if status_code == 200 and etag_matches(etag):
+                status_code = 304
+        super().__init__(content=content, status_code=status_code, headers=headers)
+
+    def render(self, content: Any) -> bytes:
+        """304响应不包含响应体"""
+        if self.status_code == 304:
+            return b""
+        return super().render(content)
+
+
+class Success(ConditionalJSONResponse):
     """
     成功响应类
     继承自FastAPI的JSONResponse,用于返回成功的API响应
@@ -13,6 +40,7 @@ class Success(JSONResponse):
         code: int = 200,                    # 状态码,默认200
         msg: Optional[str] = "OK",          # 响应消息,默认"OK"
         data: Optional[Any] = None,         # 响应数据,默认None
+        etag: Optional[str] = None,         # ETag,传入时支持304条件响应
         **kwargs,                           # 其他可选参数
     ):
         # 构建响应内容字典
@@ -24,7 +52,7 @@ class Success(JSONResponse):
         # 更新其他可选参数
         content.update(kwargs)
         # 调用父类构造函数,设置响应内容和状态码
-        super().__init__(content=content, status_code=code)
+        super().__init__(content=content, status_code=code, etag=etag)
 
 
 class Fail(JSONResponse):
@@ -51,7 +79,7 @@ class Fail(JSONResponse):
         super().__init__(content=content, status_code=code)
 
 
-class SuccessExtra(JSONResponse):
+class SuccessExtra(ConditionalJSONResponse):
     """
     带分页信息的成功响应类
     继承自FastAPI的JSONResponse,用于返回带分页信息的API响应
@@ -65,6 +93,7 @@ class SuccessExtra(JSONResponse):
         total: int = 0,                     # 数据总数
         page: int = 1,                      # 当前页码
         page_size: int = 20,                # 每页数据量
+        etag: Optional[str] = None,         # ETag,传入时支持304条件响应
         **kwargs,                           # 其他可选参数
     ):
         # 构建响应内容字典,包含分页信息
@@ -79,4 +108,4 @@ class SuccessExtra(JSONResponse):
         # 更新其他可选参数
         content.update(kwargs)
         # 调用父类构造函数,设置响应内容和状态码
-        super().__init__(content=content, status_code=code)
+        super().__init__(content=content, status_code=code, etag=etag)
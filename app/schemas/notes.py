@@ -5,6 +5,8 @@
 - BaseNote: 笔记基础模型, 用于笔记信息的展示
 - NoteCreate: 笔记创建模型, 用于创建新笔记
 - NoteUpdate: 笔记更新模型, 用于更新已有笔记
+- NoteContentUpdate: 笔记正文更新模型, 支持全量和增量补丁
+- NoteRevisionRestore: 恢复笔记历史版本模型
 """
 
 from datetime import datetime
@@ -84,3 +86,29 @@ class NoteUpdate(BaseModel):
     
     
 
+
+
+class TextPatch(BaseModel):
+    """正文补丁: 将基准正文的 [start, end) 区间替换为 text, 偏移量按Unicode字符计算"""
+    start: int = Field(..., ge=0, description="起始偏移")
+    end: int = Field(..., ge=0, description="结束偏移(不包含)")
+    text: str = Field('', description="替换文本")
+
+
+class NoteContentUpdate(BaseModel):
+    """更新笔记正文请求模型
+    
+    content 与 patches 二选一:
+    - content: 全量覆盖正文
+    - patches: 基于 base_hash 对应版本的增量补丁, 版本不一致时拒绝
+    """
+    note_id: int = Field(..., description="笔记ID")
+    content: Optional[str] = Field(None, description="笔记全文")
+    base_hash: Optional[str] = Field(None, description="补丁基准版本的sha256")
+    patches: Optional[List[TextPatch]] = Field(None, description="增量补丁列表")
+
+
+class NoteRevisionRestore(BaseModel):
+    """恢复笔记历史版本请求模型"""
+    note_id: int = Field(..., description="笔记ID")
+    hash: str = Field(..., description="版本哈希")
@@ -0,0 +1,176 @@
+"""
+缓存指标
+
+按键族统计缓存的命中、未命中、软过期命中、写入、删除、错误次数, 读写字节数,
+以及读写延迟和缓存值大小的分布(直方图):
+- 键族: RedisCache 的键取 "名称_ID" 中的名称(如 note_123 -> note), 响应缓存使用命名空间, 其余键归入 other
+- 各worker在内存中累加增量, 由周期任务合并到Redis的hash中, 查询时得到所有worker的汇总
+- 支持导出为 Prometheus 文本格式
+"""
+
+import bisect
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from redis.asyncio import Redis
+
+from app.log import logger
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)  # 秒
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)  # 字节
+
+COUNTERS = ("hits", "misses", "stale_hits", "sets", "deletes", "errors", "bytes_read", "bytes_written")
+HISTOGRAMS = {
+    "get_latency_seconds": LATENCY_BUCKETS,
+    "set_latency_seconds": LATENCY_BUCKETS,
+    "value_bytes": SIZE_BUCKETS,
+}
+
+_FAMILY_PATTERN = re.compile(r"^([a-z]+(?:_[a-z]+)*)_\d+(?::|$)")
+
+
+def _format_value(value: float) -> str:
+    """格式化导出的数值, 整数按整数输出, 其余使用 repr 保留完整精度, 不使用科学计数法截断"""
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class CacheMetrics:
+    """缓存指标统计"""
+
+    KEY = "cache_metrics"  # 汇总的hash, 字段为 "键族|指标"
+
+    _pending: Dict[str, float] = defaultdict(float)
+
+    @staticmethod
+    def family_of(key: str) -> str:
+        """根据缓存键得到键族, 不是 "名称_ID" 或 "名称_ID:字段" 格式的键归入other, 避免键族数量无界"""
+        match = _FAMILY_PATTERN.match(key)
+        return match.group(1) if match else "other"
+
+    @classmethod
+    def incr(cls, family: str, counter: str, amount: float = 1) -> None:
+        cls._pending[f"{family}|{counter}"] += amount
+
+    @classmethod
+    def observe(cls, family: str, histogram: str, value: float) -> None:
+        """记录直方图观测值, 各区间分别计数, 导出时再累加"""
+        buckets = HISTOGRAMS[histogram]
+        index = bisect.bisect_left(buckets, value)
+        le = str(buckets[index]) if index < len(buckets) else "+Inf"
+        cls._pending[f"{family}|{histogram}_bucket|{le}"] += 1
+        cls._pending[f"{family}|{histogram}_sum"] += value
+        cls._pending[f"{family}|{histogram}_count"] += 1
+
+    @classmethod
+    def record_get(cls, family: str, seconds: float, size: Optional[int] = None) -> None:
+        """记录一次Redis读取的延迟和读取字节数"""
+        cls.observe(family, "get_latency_seconds", seconds)
+        if size:
+            cls.incr(family, "bytes_read", size)
+            cls.observe(family, "value_bytes", size)
+
+    @classmethod
+    def record_set(cls, family: str, seconds: float, size: int) -> None:
+        """记录一次写入的延迟和写入字节数"""
+        cls.incr(family, "sets")
+        cls.incr(family, "bytes_written", size)
+        cls.observe(family, "set_latency_seconds", seconds)
+        cls.observe(family, "value_bytes", size)
+
+    @classmethod
+    def record_lookup(cls, family: str, hit: bool, stale: bool = False) -> None:
+        """记录一次缓存查找的结果"""
+        cls.incr(family, "hits" if hit else "misses")
+        if stale:
+            cls.incr(family, "stale_hits")
+
+    @classmethod
+    async def flush(cls, redis: Redis) -> None:
+        """把本worker累加的增量合并到Redis, 失败时保留增量等待下次合并"""
+        pending, cls._pending = cls._pending, defaultdict(float)
+        if not pending:
+            return
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                for field, amount in pending.items():
+                    pipe.hincrbyfloat(cls.KEY, field, amount)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"合并缓存指标失败: {e}")
+            for field, amount in pending.items():
+                cls._pending[field] += amount
+
+    @classmethod
+    async def snapshot(cls, redis: Redis) -> Dict[str, Dict[str, float]]:
+        """
+        读取所有worker汇总的指标, 包含本worker尚未合并的增量
+
+        Returns:
+            Dict[str, Dict[str, float]]: 键族 -> 指标字段 -> 值
+        """
+        totals: Dict[str, float] = defaultdict(float)
+        for field, value in (await redis.hgetall(cls.KEY)).items():
+            totals[field] += float(value)
+        for field, value in cls._pending.items():
+            totals[field] += value
+
+        families: Dict[str, Dict[str, float]] = defaultdict(dict)
+        for field, value in totals.items():
+            family, _, metric = field.partition("|")
+            families[family][metric] = value
+        return dict(families)
+
+    @staticmethod
+    def summarize(snapshot: Dict[str, Dict[str, float]]) -> Dict[str, dict]:
+        """把指标整理为便于阅读的统计: 计数、命中率、平均延迟和平均大小"""
+        result = {}
+        for family, metrics in sorted(snapshot.items()):
+            stats = {counter: int(metrics.get(counter, 0)) for counter in COUNTERS}
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+            for histogram in HISTOGRAMS:
+                count = metrics.get(f"{histogram}_count", 0)
+                stats[f"avg_{histogram}"] = round(metrics.get(f"{histogram}_sum", 0) / count, 6) if count else 0.0
+            result[family] = stats
+        return result
+
+    @staticmethod
+    def exposition(snapshot: Dict[str, Dict[str, float]], local_stats: Dict[str, dict], worker: str) -> str:
+        """
+        生成 Prometheus 文本格式
+
+        Args:
+            snapshot: snapshot 返回的汇总指标
+            local_stats: 本worker的一级缓存统计, 见 LocalCache.stats
+            worker: 本worker标识
+        """
+        lines: List[str] = []
+        for counter in COUNTERS:
+            name = f"notemate_cache_{counter}_total"
+            lines.append(f"# TYPE {name} counter")
+            for family, metrics in sorted(snapshot.items()):
+                lines.append(f'{name}{{family="{family}"}} {_format_value(metrics.get(counter, 0))}')
+
+        for histogram, buckets in HISTOGRAMS.items():
+            name = f"notemate_cache_{histogram}"
+            lines.append(f"# TYPE {name} histogram")
+            for family, metrics in sorted(snapshot.items()):
+                cumulative = 0.0
+                for le in [str(bucket) for bucket in buckets] + ["+Inf"]:
+                    cumulative += metrics.get(f"{histogram}_bucket|{le}", 0)
+                    lines.append(f'{name}_bucket{{family="{family}",le="{le}"}} {_format_value(cumulative)}')
+                lines.append(f'{name}_sum{{family="{family}"}} {_format_value(metrics.get(f"{histogram}_sum", 0))}')
+                lines.append(f'{name}_count{{family="{family}"}} {_format_value(metrics.get(f"{histogram}_count", 0))}')
+
+        # 一级缓存的条目数和字节数是当前值, 命中、未命中和淘汰次数只增不减
+        local_metrics = [(metric, "gauge", "") for metric in ("entries", "bytes")]
+        local_metrics += [(metric, "counter", "_total") for metric in ("hits", "misses", "evictions")]
+        for metric, metric_type, suffix in local_metrics:
+            name = f"notemate_local_cache_{metric}{suffix}"
+            lines.append(f"# TYPE {name} {metric_type}")
+            for family, stats in sorted(local_stats.items()):
+                lines.append(f'{name}{{family="{family}",worker="{worker}"}} {_format_value(stats[metric])}')
+        return "\n".join(lines) + "\n"
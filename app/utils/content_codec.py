@@ -0,0 +1,277 @@
+"""
+笔记正文存储编解码
+
+正文超过阈值时压缩后以二进制存入MongoDB, 文档中的 codec 字段标记编码方式:
+- plain: 原始字符串
+- zlib: zlib压缩
+- zstd: zstd压缩(需要安装 zstandard)
+- chunked: 超大正文, 按片段存入 note_content_chunks, 每个片段单独压缩;
+  被替换的分片版本先标记 retired_at, 保留 NOTE_CONTENT_CHUNK_GC_GRACE 秒后由周期任务删除
+
+没有 codec 字段的旧文档按 plain 读取, 由后台迁移任务逐批压缩
+"""
+
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING
+
+from app.core.config import settings
+from app.log import logger
+
+try:
+    import zstandard
+except ImportError:  # zstd为可选依赖,未安装时退化为zlib
+    zstandard = None
+
+CODEC_PLAIN = "plain"
+CODEC_ZLIB = "zlib"
+CODEC_ZSTD = "zstd"
+CODEC_CHUNKED = "chunked"
+
+# 读取正文时需要的字段
+CONTENT_PROJECTION = {"key": 1, "content": 1, "codec": 1, "chunk_rev": 1, "chunks": 1}
+# 只读取正文元信息, 不加载正文
+CONTENT_META_PROJECTION = {"key": 1, "codec": 1, "chunk_rev": 1, "chunks": 1, "raw_size": 1, "hash": 1}
+# 读取分片时发现版本不完整的重试次数
+CHUNK_READ_RETRIES = 3
+# 已提示过不可用的压缩算法配置, 每个配置只警告一次
+_WARNED_CODECS = set()
+
+
+class ContentChunksMissing(RuntimeError):
+    """读取到的分片与主文档记录的数量不一致(分片版本已被回收)"""
+
+
+class NoteContentCodec:
+    """笔记正文编解码"""
+
+    @staticmethod
+    def default_codec() -> str:
+        """当前配置的压缩算法, 配置的算法不可用(未知或zstandard未安装)时使用zlib并记录警告"""
+        name = settings.NOTE_CONTENT_CODEC
+        if name == CODEC_ZSTD and zstandard is not None:
+            return CODEC_ZSTD
+        if name != CODEC_ZLIB and name not in _WARNED_CODECS:
+            _WARNED_CODECS.add(name)
+            logger.warning(f"NOTE_CONTENT_CODEC={name} 不可用(未知算法或未安装依赖), 正文改用zlib压缩")
+        return CODEC_ZLIB
+
+    @staticmethod
+    def encode(content: Optional[str]) -> dict:
+        """
+        编码正文
+
+        Args:
+            content: 正文
+
+        Returns:
+            dict: 需要写入文档的字段 {content, codec, raw_size}
+        """
+        raw = (content or "").encode("utf-8")
+        if len(raw) < settings.NOTE_CONTENT_COMPRESS_THRESHOLD:
+            return {"content": content or "", "codec": CODEC_PLAIN, "raw_size": len(raw)}
+
+        codec = NoteContentCodec.default_codec()
+        if codec == CODEC_ZSTD:
+            data = zstandard.ZstdCompressor(level=settings.NOTE_CONTENT_COMPRESS_LEVEL).compress(raw)
+        else:
+            data = zlib.compress(raw, settings.NOTE_CONTENT_COMPRESS_LEVEL)
+        return {"content": data, "codec": codec, "raw_size": len(raw)}
+
+    @staticmethod
+    def decode(doc: Optional[dict]) -> str:
+        """
+        从MongoDB文档中解码正文, 不处理分片存储的正文(请使用 load)
+
+        Args:
+            doc: note_contents 或 note_content_chunks 文档, None时返回空字符串
+        """
+        if not doc:
+            return ""
+        content = doc.get("content") or ""
+        codec = doc.get("codec", CODEC_PLAIN)
+        if codec == CODEC_CHUNKED:
+            raise ValueError("分片存储的正文需要通过 load 读取")
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(content).decode("utf-8")
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("读取zstd压缩的正文需要安装 zstandard")
+            return zstandard.ZstdDecompressor().decompress(content).decode("utf-8")
+        return content
+
+    @staticmethod
+    async def encode_for_store(mongodb: AsyncIOMotorDatabase, key: str, content: Optional[str]) -> dict:
+        """
+        编码正文, 超大正文先写入分片集合
+
+        每次写入生成新的分片版本, 主文档切换到新版本后调用 retire_chunks 标记被替换的版本,
+        宽限期过后才由 gc_chunks 删除, 正在读取旧版本的请求仍能读完;
+        读取方按主文档记录的 chunks 校验分片数量, 不会把不完整的版本当作正文返回
+
+        Args:
+            mongodb: MongoDB数据库实例
+            key: 正文key
+            content: 正文
+
+        Returns:
+            dict: 需要写入主文档的字段, 分片存储时包含 chunk_rev
+        """
+        content = content or ""
+        raw_size = len(content.encode("utf-8"))
+        if raw_size < settings.NOTE_CONTENT_CHUNK_THRESHOLD:
+            return NoteContentCodec.encode(content)
+
+        size = settings.NOTE_CONTENT_CHUNK_SIZE
+        rev = uuid.uuid4().hex
+        docs = [
+            {"key": key, "rev": rev, "seq": seq, **NoteContentCodec.encode(content[start:start + size])}
+            for seq, start in enumerate(range(0, len(content), size))
+        ]
+        await mongodb.note_content_chunks.insert_many(docs)
+        return {"content": "", "codec": CODEC_CHUNKED, "chunk_rev": rev, "chunks": len(docs), "raw_size": raw_size}
+
+    @staticmethod
+    async def cleanup_chunks(mongodb: AsyncIOMotorDatabase, key: str, rev: Optional[str] = None) -> None:
+        """删除正文的分片, rev 指定只删除某个版本, 为None时删除全部"""
+        query = {"key": key}
+        if rev:
+            query["rev"] = rev
+        await mongodb.note_content_chunks.delete_many(query)
+
+    @staticmethod
+    async def retire_chunks(mongodb: AsyncIOMotorDatabase, key: str, rev: str) -> None:
+        """标记被替换的分片版本, 宽限期过后由 gc_chunks 删除"""
+        await mongodb.note_content_chunks.update_many(
+            {"key": key, "rev": rev, "retired_at": {"$exists": False}},
+            {"$set": {"retired_at": datetime.now()}},
+        )
+
+    @staticmethod
+    async def gc_chunks(mongodb: AsyncIOMotorDatabase) -> int:
+        """
+        删除超过宽限期的被替换分片
+
+        Returns:
+            int: 删除的分片数量
+        """
+        deadline = datetime.now() - timedelta(seconds=settings.NOTE_CONTENT_CHUNK_GC_GRACE)
+        result = await mongodb.note_content_chunks.delete_many({"retired_at": {"$lt": deadline}})
+        return result.deleted_count
+
+    @staticmethod
+    async def iter_chunks(mongodb: AsyncIOMotorDatabase, doc: Optional[dict]) -> AsyncIterator[str]:
+        """
+        按片段迭代正文
+
+        分片存储的正文逐片从MongoDB读取, 不会同时持有完整正文;
+        其他正文解码后按 NOTE_CONTENT_CHUNK_SIZE 切片
+
+        分片的序号或数量与主文档不一致时, 如果尚未输出任何片段则重新读取主文档后重试,
+        已经输出部分片段时抛出 ContentChunksMissing, 不会静默返回截断的正文
+
+        Args:
+            mongodb: MongoDB数据库实例
+            doc: note_contents 文档(可以只包含元信息字段)
+        """
+        if not doc:
+            return
+        for _ in range(CHUNK_READ_RETRIES):
+            if doc.get("codec") != CODEC_CHUNKED:
+                break
+            seq = 0
+            cursor = mongodb.note_content_chunks.find(
+                {"key": doc["key"], "rev": doc["chunk_rev"]}, {"seq": 1, "content": 1, "codec": 1}
+            ).sort("seq", 1).batch_size(1)
+            async for chunk in cursor:
+                if chunk["seq"] != seq:
+                    break
+                yield NoteContentCodec.decode(chunk)
+                seq += 1
+            else:
+                # 旧文档没有记录 chunks 时无法校验数量, 按读到的分片为准
+                if doc.get("chunks") in (None, seq):
+                    return
+            if seq:
+                raise ContentChunksMissing(f"正文 {doc['key']} 的分片版本 {doc['chunk_rev']} 不完整")
+            # 主文档已切换到新版本, 重新读取
+            doc = await mongodb.note_contents.find_one({"key": doc["key"]}, CONTENT_PROJECTION)
+            if not doc:
+                return
+        else:
+            raise ContentChunksMissing(f"正文 {doc['key']} 多次读取到不完整的分片版本")
+
+        if "content" not in doc:
+            doc = await mongodb.note_contents.find_one({"_id": doc["_id"]}, CONTENT_PROJECTION)
+        content = NoteContentCodec.decode(doc)
+        size = settings.NOTE_CONTENT_CHUNK_SIZE
+        for start in range(0, len(content), size):
+            yield content[start:start + size]
+
+    @staticmethod
+    async def load(mongodb: AsyncIOMotorDatabase, doc: Optional[dict]) -> str:
+        """读取完整正文, 兼容分片存储; 读取过程中分片版本被回收时重新读取主文档"""
+        for _ in range(CHUNK_READ_RETRIES):
+            if not doc or doc.get("codec") != CODEC_CHUNKED:
+                return NoteContentCodec.decode(doc)
+            try:
+                return "".join([chunk async for chunk in NoteContentCodec.iter_chunks(mongodb, doc)])
+            except ContentChunksMissing:
+                key = doc["key"]
+                doc = await mongodb.note_contents.find_one({"key": key}, CONTENT_PROJECTION)
+        raise ContentChunksMissing(f"正文 {key} 多次读取到不完整的分片版本")
+
+    @staticmethod
+    async def ensure_indexes(mongodb: AsyncIOMotorDatabase) -> None:
+        """创建正文集合所需的索引"""
+        await mongodb.note_contents.create_index("key")
+        await mongodb.note_contents.create_index("codec")
+        await mongodb.note_content_chunks.create_index(
+            [("key", ASCENDING), ("rev", ASCENDING), ("seq", ASCENDING)], unique=True
+        )
+        await mongodb.note_content_chunks.create_index("retired_at", sparse=True)
+
+    @staticmethod
+    async def migrate_batch(mongodb: AsyncIOMotorDatabase, batch_size: int = 200) -> int:
+        """
+        压缩一批旧文档
+
+        处理没有 codec 字段的文档, 以及压缩算法与当前配置不一致的文档;
+        更新时以原编码为条件, 多个worker并发执行或中途崩溃都不会损坏数据;
+        无法解码的文档标记 codec_error 后不再被选中, 避免每批都是同一批损坏文档, 正文重新写入时清除标记
+
+        Returns:
+            int: 本批处理的文档数量
+        """
+        codec = NoteContentCodec.default_codec()
+        docs = await mongodb.note_contents.find(
+            {
+                "$or": [
+                    {"codec": {"$exists": False}},
+                    {"codec": {"$nin": [CODEC_PLAIN, CODEC_CHUNKED, codec]}},
+                ],
+                "codec_error": {"$exists": False},
+            },
+            CONTENT_PROJECTION,
+        ).limit(batch_size).to_list(None)
+
+        for doc in docs:
+            try:
+                encoded = await NoteContentCodec.encode_for_store(
+                    mongodb, doc["key"], NoteContentCodec.decode(doc)
+                )
+            except Exception as e:
+                logger.error(f"正文 {doc.get('key')} 重新编码失败: {e}")
+                await mongodb.note_contents.update_one({"_id": doc["_id"]}, {"$set": {"codec_error": str(e)}})
+                continue
+            old_codec = doc.get("codec")
+            match = {"_id": doc["_id"], "codec": old_codec if old_codec else {"$exists": False}}
+            result = await mongodb.note_contents.update_one(match, {"$set": encoded})
+            if encoded["codec"] == CODEC_CHUNKED and result.matched_count == 0:
+                # 文档已被并发修改，丢弃本次写入的分片
+                await NoteContentCodec.cleanup_chunks(mongodb, doc["key"], encoded["chunk_rev"])
+        return len(docs)
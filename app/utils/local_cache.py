@@ -0,0 +1,211 @@
+"""
+进程内一级缓存
+
+位于Redis之前, 缓存体积小、读取频繁的数据, 命中时不再访问Redis和反序列化:
+- 按键族划分, 每个键族有独立的容量上限(按数据字节数估算)和过期时间, 超出容量时淘汰最久未使用的条目
+- 数据变更时通过Redis发布订阅通知所有worker删除对应条目, 订阅断开期间可能漏掉通知,
+  重新订阅时清空全部一级缓存; 过期时间作为兜底, 限制最长的不一致时间
+- 读取Redis前取得键族的令牌, 写入时令牌已变化说明期间有失效通知, 放弃写入, 避免旧数据回填
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+
+from app.core.config import settings
+from app.log import logger
+
+
+class LocalCacheFamily:
+    """单个键族的LRU缓存"""
+
+    def __init__(self, name: str, max_bytes: int, ttl: float, max_entry_bytes: int):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()  # key -> (过期时间, 字节数, 数据)
+        self._bytes = 0
+        self._token = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def token(self) -> int:
+        """读取Redis前获取, 写入时传回, 用于判断期间是否有失效"""
+        return self._token
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] <= time.monotonic():
+            self._pop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def set(self, key: str, value: Any, size: int, ttl: Optional[float] = None, token: Optional[int] = None) -> bool:
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 数据, 调用方不应再修改
+            size: 数据字节数(估算)
+            ttl: 过期时间(秒), 不超过键族的过期时间
+            token: 读取前获取的令牌, 已失效时放弃写入
+
+        Returns:
+            bool: 是否写入
+        """
+        if token is not None and token != self._token:
+            return False
+        if size > self.max_entry_bytes or size > self.max_bytes:
+            return False
+        self._pop(key)
+        expire = min(ttl, self.ttl) if ttl is not None else self.ttl
+        self._entries[key] = (time.monotonic() + expire, size, value)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._pop(oldest)
+            self.evictions += 1
+        return True
+
+    def delete(self, key: str) -> None:
+        self._token += 1
+        self._pop(key)
+
+    def clear(self) -> None:
+        self._token += 1
+        self._entries.clear()
+        self._bytes = 0
+
+    def _pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class LocalCache:
+    """进程内一级缓存管理, 各键族的容量和过期时间见配置 LOCAL_CACHE_FAMILIES"""
+
+    CHANNEL = "local_cache_invalidate"
+
+    _families: Dict[str, LocalCacheFamily] = {
+        name: LocalCacheFamily(
+            name,
+            max_bytes=config["max_bytes"],
+            ttl=config["ttl"],
+            max_entry_bytes=config.get("max_entry_bytes", settings.LOCAL_CACHE_MAX_ENTRY_BYTES),
+        )
+        for name, config in settings.LOCAL_CACHE_FAMILIES.items()
+    }
+    _task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def family(cls, name: str) -> Optional[LocalCacheFamily]:
+        """获取键族, 未启用一级缓存或未配置的键族返回None"""
+        if not settings.LOCAL_CACHE_ENABLED:
+            return None
+        return cls._families.get(name)
+
+    @classmethod
+    async def invalidate(cls, redis: Redis, name: str, *keys: str) -> None:
+        """删除本进程的缓存条目, 并通知其他worker删除"""
+        if cls.family(name) is None or not keys:
+            return
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                cls.queue_invalidate(pipe, name, keys)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"发布一级缓存失效通知 {name} 失败: {e}")
+
+    @classmethod
+    def queue_invalidate(cls, pipe: Pipeline, name: str, keys: Iterable[str]) -> None:
+        """删除本进程的缓存条目, 并把失效通知加入pipeline, 与其他命令一起发送"""
+        family = cls.family(name)
+        if family is None:
+            return
+        for key in keys:
+            family.delete(key)
+            pipe.publish(cls.CHANNEL, f"{name}\n{key}")
+
+    @classmethod
+    def _on_message(cls, message: str) -> None:
+        name, _, key = message.partition("\n")
+        family = cls._families.get(name)
+        if family is not None:
+            family.delete(key)
+
+    @classmethod
+    def clear(cls) -> None:
+        for family in cls._families.values():
+            family.clear()
+
+    @classmethod
+    async def _listen(cls, redis: Redis) -> None:
+        """订阅失效通知, 连接断开后重新订阅并清空缓存"""
+        while True:
+            pubsub = redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(cls.CHANNEL)
+                # 订阅生效前可能漏掉通知
+                cls.clear()
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        data = message["data"]
+                        cls._on_message(data.decode() if isinstance(data, bytes) else data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"一级缓存失效通知订阅中断: {e}")
+                cls.clear()
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    @classmethod
+    async def start(cls, redis: Redis) -> None:
+        """启动失效通知订阅, 应用启动时调用"""
+        if settings.LOCAL_CACHE_ENABLED and cls._task is None:
+            cls._task = asyncio.create_task(cls._listen(redis))
+
+    @classmethod
+    async def stop(cls) -> None:
+        """停止订阅, 应用关闭时调用"""
+        if cls._task is not None:
+            cls._task.cancel()
+            await asyncio.gather(cls._task, return_exceptions=True)
+            cls._task = None
+        cls.clear()
+
+    @classmethod
+    def stats(cls) -> Dict[str, Dict[str, Any]]:
+        """各键族的条目数、占用字节和命中率"""
+        return {name: family.stats() for name, family in cls._families.items()}
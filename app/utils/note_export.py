@@ -0,0 +1,97 @@
+"""
+知识库导出
+
+按ID游标分批读取笔记, 正文按批使用 $in 查询, 逐个写入zip并立即输出;
+分片存储的正文逐片读取, 内存占用不超过一批笔记的存储正文
+"""
+
+import io
+import re
+import zipfile
+from typing import AsyncIterator, List, Set
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.config import settings
+from app.log import logger
+from app.models.admin import Note
+from app.utils.content_codec import CONTENT_PROJECTION, ContentChunksMissing, NoteContentCodec
+
+_UNSAFE_RE = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+class _ZipStream(io.RawIOBase):
+    """只写且不可随机访问的缓冲区, zipfile会以流式模式(数据描述符)写入"""
+
+    def __init__(self) -> None:
+        self._parts: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def pop(self) -> bytes:
+        """取出已写入的数据"""
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _file_name(title: str, used: Set[str]) -> str:
+    """根据标题生成不重复的文件名"""
+    base = _UNSAFE_RE.sub("_", title or "").strip(" .") or "untitled"
+    name, index = f"{base}.md", 1
+    while name in used:
+        index += 1
+        name = f"{base}({index}).md"
+    used.add(name)
+    return name
+
+
+async def export_knowledge_base(mongodb: AsyncIOMotorDatabase, knowledge_bases_id: int) -> AsyncIterator[bytes]:
+    """
+    以zip格式流式导出知识库中的全部笔记
+
+    Args:
+        mongodb: MongoDB数据库实例
+        knowledge_bases_id: 知识库ID
+
+    Yields:
+        bytes: zip数据片段
+    """
+    stream = _ZipStream()
+    used: Set[str] = set()
+    batch_size = settings.NOTE_EXPORT_BATCH_SIZE
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        last_id = 0
+        while True:
+            notes = await Note.filter(
+                knowledge_bases_id=knowledge_bases_id, id__gt=last_id
+            ).order_by("id").limit(batch_size)
+            if not notes:
+                break
+            last_id = notes[-1].id
+
+            docs = await mongodb.note_contents.find(
+                {"key": {"$in": [note.content for note in notes]}}, CONTENT_PROJECTION
+            ).to_list(None)
+            contents = {doc["key"]: doc for doc in docs}
+
+            for note in notes:
+                info = zipfile.ZipInfo(_file_name(note.title, used), date_time=note.updated_at.timetuple()[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                try:
+                    with archive.open(info, "w") as entry:
+                        async for chunk in NoteContentCodec.iter_chunks(mongodb, contents.pop(note.content, None)):
+                            entry.write(chunk.encode("utf-8"))
+                            yield stream.pop()
+                except ContentChunksMissing as e:
+                    # 部分数据已经发出, 无法再返回错误响应; 抛出异常使连接直接中断,
+                    # 客户端收到不完整的分块传输而不是一个缺少内容的zip
+                    logger.error(f"导出知识库 {knowledge_bases_id} 时笔记 {note.id} 的正文读取失败, 中断导出: {e}")
+                    raise
+                yield stream.pop()
+    yield stream.pop()
@@ -0,0 +1,140 @@
+"""
+笔记批量导入
+
+从zip或tar归档中逐个读取markdown文件, 解析出标题、简介和正文;
+归档成员逐个解压, 任意时刻只持有当前一个文件的内容
+"""
+
+import os
+import re
+import tarfile
+import zipfile
+import zlib
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+MARKDOWN_SUFFIXES = (".md", ".markdown", ".txt")
+
+_FRONT_MATTER_RE = re.compile(r"\A---\s*\n(.*?)\n---\s*\n", re.S)
+_FRONT_MATTER_TITLE_RE = re.compile(r"^title:\s*[\"']?(.+?)[\"']?\s*$", re.M)
+_HEADING_RE = re.compile(r"^#\s+(.+?)\s*#*\s*$", re.M)
+
+
+class ArchiveError(ValueError):
+    """归档格式不支持或内容超出限制"""
+
+
+def _is_markdown(path: str) -> bool:
+    """是否为需要导入的markdown文件, 忽略隐藏文件和macOS元数据"""
+    parts = path.replace("\\", "/").split("/")
+    if any(part.startswith(".") or part == "__MACOSX" for part in parts):
+        return False
+    return path.lower().endswith(MARKDOWN_SUFFIXES)
+
+
+def _decode(data: bytes) -> str:
+    """解码文件内容, 优先utf-8, 失败时按gb18030解码"""
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("gb18030", errors="replace")
+
+
+def iter_archive(
+    fileobj: BinaryIO,
+    filename: str,
+    max_files: int,
+    max_file_size: int,
+) -> Iterator[Tuple[str, Optional[str]]]:
+    """
+    逐个读取归档中的markdown文件
+
+    读取第一个文件前先统计文件数, 超出限制时在产出任何文件前抛出异常
+
+    Args:
+        fileobj: 可随机读取的归档文件对象
+        filename: 上传的文件名, 用于判断格式
+        max_files: 最多导入的文件数
+        max_file_size: 单个文件的最大字节数
+
+    Yields:
+        Tuple[str, Optional[str]]: (文件路径, 文本内容), 超出大小限制或实际大小与声明不符的文件内容为None
+
+    Raises:
+        ArchiveError: 归档格式不支持或文件数超出限制
+    """
+    if filename.lower().endswith(".zip"):
+        try:
+            archive = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile:
+            raise ArchiveError("无效的zip文件")
+        with archive:
+            infos = [info for info in archive.infolist() if not info.is_dir() and _is_markdown(info.filename)]
+            if len(infos) > max_files:
+                raise ArchiveError(f"文件数量超过限制 {max_files}")
+            for info in infos:
+                if info.file_size > max_file_size:
+                    yield info.filename, None
+                    continue
+                try:
+                    with archive.open(info) as member:
+                        data = member.read(info.file_size + 1)
+                except (zipfile.BadZipFile, EOFError, zlib.error):
+                    # 实际内容比声明的短或已损坏
+                    yield info.filename, None
+                    continue
+                if len(data) != info.file_size:
+                    # 声明的大小与实际不符, 跳过而不是截断
+                    yield info.filename, None
+                    continue
+                yield info.filename, _decode(data)
+        return
+
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode="r:*")
+    except tarfile.TarError:
+        raise ArchiveError("仅支持zip或tar格式的归档")
+    with archive:
+        try:
+            infos = [info for info in archive.getmembers() if info.isfile() and _is_markdown(info.name)]
+        except tarfile.TarError:
+            raise ArchiveError("无效的tar文件")
+        if len(infos) > max_files:
+            raise ArchiveError(f"文件数量超过限制 {max_files}")
+        for info in infos:
+            if info.size > max_file_size:
+                yield info.name, None
+                continue
+            member = archive.extractfile(info)
+            yield info.name, _decode(member.read()) if member else ""
+
+
+def parse_markdown(path: str, text: str) -> dict:
+    """
+    解析markdown文件
+
+    标题优先取 front matter 中的 title, 其次取第一个一级标题, 最后使用文件名;
+    简介取正文第一段, 最长200字
+
+    Returns:
+        dict: {title, introduction, content}
+    """
+    title = None
+    body = text
+    front_matter = _FRONT_MATTER_RE.match(text)
+    if front_matter:
+        body = text[front_matter.end():]
+        match = _FRONT_MATTER_TITLE_RE.search(front_matter.group(1))
+        if match:
+            title = match.group(1)
+    if not title:
+        match = _HEADING_RE.search(body)
+        title = match.group(1) if match else os.path.splitext(os.path.basename(path))[0]
+
+    introduction = None
+    for paragraph in re.split(r"\n\s*\n", body):
+        paragraph = paragraph.strip()
+        if paragraph and not paragraph.startswith(("#", "```", "!", "|", ">")):
+            introduction = paragraph[:200]
+            break
+
+    return {"title": title[:200], "introduction": introduction, "content": body}
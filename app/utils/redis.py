@@ -1,9 +1,164 @@
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional, Union
 import json
+import time
+import zlib
+from abc import ABC, abstractmethod
 from redis.asyncio import Redis
+from redis.client import NEVER_DECODE
+
+from app.core.config import settings
+from app.log import logger
+from app.utils.cache_metrics import CacheMetrics
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖,未安装时使用标准库json
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack为可选依赖,未安装时退化为json
+    msgpack = None
+
+
+# 缓存值格式: 1字节版本头 + 序列化数据
+# 版本头最高位为1, 与旧格式(JSON文本, 首字节为ASCII)区分; 0x40 表示数据经过zlib压缩; 低4位为编码器ID
+HEADER_MARK = 0x80
+HEADER_COMPRESSED = 0x40
+HEADER_CODEC_MASK = 0x0F
+
+
+class RedisCodec(ABC):
+    """缓存值序列化方式"""
+    codec_id = 0
+    
+    @abstractmethod
+    def dumps(self, value: Any) -> bytes:
+        """序列化"""
+    
+    @abstractmethod
+    def loads(self, data: bytes) -> Any:
+        """反序列化"""
+
+
+class JsonCodec(RedisCodec):
+    """JSON序列化, 安装了orjson时使用orjson"""
+    codec_id = 1
+    
+    def dumps(self, value: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    
+    def loads(self, data: bytes) -> Any:
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+
+class MsgpackCodec(RedisCodec):
+    """MessagePack序列化(需要安装 msgpack)"""
+    codec_id = 2
+    
+    def dumps(self, value: Any) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+    
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False)
+
+
+CODECS = {"json": JsonCodec(), "msgpack": MsgpackCodec()}
+CODECS_BY_ID = {codec.codec_id: codec for codec in CODECS.values()}
+# 已提示过不可用的编码器配置, 每个配置只警告一次
+_WARNED_CODECS = set()
+
 
 class RedisUtils:
-    """Redis工具类 - 提供Redis缓存操作的高级封装"""
+    """Redis工具类 - 提供Redis缓存操作的高级封装
+    
+    缓存值按 REDIS_CODEC 序列化为二进制, 超过 REDIS_COMPRESS_THRESHOLD 字节时压缩,
+    首字节记录编码器和是否压缩, 切换编码器后旧数据仍能读取;
+    没有版本头的旧格式(JSON文本)按JSON读取, 旧数据在过期或被重新写入后迁移为新格式;
+    读写的延迟、字节数和错误按键族计入 CacheMetrics
+    """
+    
+    @staticmethod
+    def default_codec() -> RedisCodec:
+        """当前配置的编码器, 配置的编码器不可用(未知或msgpack未安装)时使用json并记录警告"""
+        name = settings.REDIS_CODEC
+        if name == "msgpack" and msgpack is not None:
+            return CODECS["msgpack"]
+        if name != "json" and name not in _WARNED_CODECS:
+            _WARNED_CODECS.add(name)
+            logger.warning(f"REDIS_CODEC={name} 不可用(未知编码或未安装依赖), 缓存值改用json编码")
+        return CODECS["json"]
+    
+    @staticmethod
+    def encode(value: Any) -> bytes:
+        """序列化缓存值"""
+        codec = RedisUtils.default_codec()
+        data = codec.dumps(value)
+        header = HEADER_MARK | codec.codec_id
+        if len(data) >= settings.REDIS_COMPRESS_THRESHOLD:
+            compressed = zlib.compress(data, settings.REDIS_COMPRESS_LEVEL)
+            if len(compressed) < len(data):
+                data = compressed
+                header |= HEADER_COMPRESSED
+        return bytes([header]) + data
+    
+    @staticmethod
+    def decode(raw: Union[bytes, str]) -> Any:
+        """
+        反序列化缓存值
+        
+        Raises:
+            ValueError: 数据无法解析
+        """
+        if isinstance(raw, str):
+            raw = raw.encode("utf-8")
+        if not raw:
+            return None
+        header = raw[0]
+        if not header & HEADER_MARK:
+            # 旧格式: JSON文本, 不是JSON时原样返回字符串
+            text = raw.decode("utf-8")
+            try:
+                return json.loads(text)
+            except json.JSONDecodeError:
+                return text
+        codec = CODECS_BY_ID.get(header & HEADER_CODEC_MASK)
+        if codec is None or (codec.codec_id == MsgpackCodec.codec_id and msgpack is None):
+            raise ValueError(f"不支持的缓存编码: {header:#x}")
+        data = raw[1:]
+        if header & HEADER_COMPRESSED:
+            data = zlib.decompress(data)
+        return codec.loads(data)
+    
+    @staticmethod
+    async def cache_set_raw(redis: Redis, key: str, data: bytes, expire: int = 3600) -> bool:
+        """写入已序列化的二进制数据"""
+        family = CacheMetrics.family_of(key)
+        start = time.perf_counter()
+        try:
+            await redis.set(key, data, ex=expire)
+        except Exception:
+            CacheMetrics.incr(family, "errors")
+            return False
+        CacheMetrics.record_set(family, time.perf_counter() - start, len(data))
+        return True
+    
+    @staticmethod
+    async def cache_get_raw(redis: Redis, key: str) -> Optional[bytes]:
+        """读取二进制数据, 不受连接的 decode_responses 影响"""
+        family = CacheMetrics.family_of(key)
+        start = time.perf_counter()
+        try:
+            value = await redis.execute_command("GET", key, **{NEVER_DECODE: True})
+        except Exception:
+            CacheMetrics.incr(family, "errors")
+            return None
+        CacheMetrics.record_get(family, time.perf_counter() - start, len(value) if value else None)
+        return value
     
     @staticmethod
     async def cache_set(
@@ -18,18 +173,18 @@ class RedisUtils:
         Args:
             redis: Redis客户端实例
             key: 缓存键名
-            value: 要缓存的值(会被JSON序列化)
+            value: 要缓存的值(按 REDIS_CODEC 序列化, 调用方不需要预先序列化)
             expire: 过期时间(秒)
             
         Returns:
             bool: 设置成功返回True,失败返回False
         """
         try:
-            value_str = json.dumps(value)  # 将值序列化为JSON字符串
-            await redis.set(key, value_str, ex=expire)  # 设置键值对和过期时间
-            return True
+            data = RedisUtils.encode(value)
         except Exception:
+            CacheMetrics.incr(CacheMetrics.family_of(key), "errors")
             return False
+        return await RedisUtils.cache_set_raw(redis, key, data, expire=expire)  # 设置键值对和过期时间
 
     @staticmethod
     async def cache_get(
@@ -46,21 +201,139 @@ class RedisUtils:
             default: 获取失败时的默认返回值
             
         Returns:
-            Optional[Any]: 返回缓存的值(JSON反序列化后)或默认值
+            Optional[Any]: 返回缓存的值(反序列化后)或默认值
+        """
+        value = await RedisUtils.cache_get_raw(redis, key)  # 获取缓存值
+        if not value:
+            return default
+        try:
+            return RedisUtils.decode(value)
+        except Exception:
+            CacheMetrics.incr(CacheMetrics.family_of(key), "errors")
+            return default
+    
+    @staticmethod
+    async def cache_hget(
+        redis: Redis,
+        key: str,
+        field: str,
+        default: Any = None
+    ) -> Optional[Any]:
+        """
+        获取hash字段中缓存的值
+        
+        Args:
+            redis: Redis客户端实例
+            key: hash键名
+            field: 字段名
+            default: 获取失败时的默认返回值
         """
+        family = CacheMetrics.family_of(key)
+        start = time.perf_counter()
         try:
-            value = await redis.get(key)  # 获取缓存值
+            value = await redis.execute_command("HGET", key, field, **{NEVER_DECODE: True})
+            CacheMetrics.record_get(family, time.perf_counter() - start, len(value) if value else None)
             if not value:
                 return default
-            try:
-                # 尝试 JSON 反序列化
-                return json.loads(value)
-            except json.JSONDecodeError:
-                # 如果不是 JSON 格式，直接返回字符串
-                return value.decode() if isinstance(value, bytes) else value
+            return RedisUtils.decode(value)
         except Exception:
+            CacheMetrics.incr(family, "errors")
             return default
         
+    @staticmethod
+    async def cache_mget(
+        redis: Redis,
+        keys: List[str],
+        default: Any = None
+    ) -> List[Any]:
+        """
+        批量获取缓存, 一次 MGET
+        
+        Args:
+            redis: Redis客户端实例
+            keys: 缓存键名列表
+            default: 未命中或解析失败时的值
+            
+        Returns:
+            List[Any]: 与keys顺序一致的缓存值
+        """
+        if not keys:
+            return []
+        family = CacheMetrics.family_of(keys[0])
+        start = time.perf_counter()
+        try:
+            values = await redis.execute_command("MGET", *keys, **{NEVER_DECODE: True})
+        except Exception:
+            CacheMetrics.incr(family, "errors")
+            return [default] * len(keys)
+        CacheMetrics.record_get(family, time.perf_counter() - start, sum(len(value) for value in values if value))
+        result = []
+        for value in values:
+            try:
+                result.append(RedisUtils.decode(value) if value else default)
+            except Exception:
+                CacheMetrics.incr(family, "errors")
+                result.append(default)
+        return result
+    
+    @staticmethod
+    async def cache_mset(
+        redis: Redis,
+        mapping: Dict[str, Any],
+        expire: int = 3600
+    ) -> bool:
+        """
+        批量设置缓存并设置过期时间, 在一个pipeline中执行
+        
+        Args:
+            redis: Redis客户端实例
+            mapping: 缓存键名 -> 缓存值
+            expire: 过期时间(秒)
+            
+        Returns:
+            bool: 设置成功返回True,失败返回False
+        """
+        if not mapping:
+            return True
+        start = time.perf_counter()
+        sizes = {}
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                for key, value in mapping.items():
+                    data = RedisUtils.encode(value)
+                    sizes[key] = len(data)
+                    pipe.set(key, data, ex=expire)
+                await pipe.execute()
+        except Exception:
+            CacheMetrics.incr(CacheMetrics.family_of(next(iter(mapping))), "errors")
+            return False
+        elapsed = time.perf_counter() - start
+        for key, size in sizes.items():
+            CacheMetrics.record_set(CacheMetrics.family_of(key), elapsed, size)
+        return True
+    
+    @staticmethod
+    async def cache_mdelete(
+        redis: Redis,
+        keys: List[str]
+    ) -> int:
+        """
+        批量删除缓存, 一次 DEL
+        
+        Returns:
+            int: 删除的键数量,失败返回0
+        """
+        if not keys:
+            return 0
+        family = CacheMetrics.family_of(keys[0])
+        try:
+            deleted = await redis.delete(*keys)
+        except Exception:
+            CacheMetrics.incr(family, "errors")
+            return 0
+        CacheMetrics.incr(family, "deletes", len(keys))
+        return deleted
+    
     @staticmethod
     async def cache_delete(
         redis: Redis,
@@ -78,6 +351,52 @@ class RedisUtils:
         """
         try:
             await redis.delete(key)
-            return True
         except Exception:
-            return False    
+            CacheMetrics.incr(CacheMetrics.family_of(key), "errors")
+            return False
+        CacheMetrics.incr(CacheMetrics.family_of(key), "deletes")
+        return True
+
+    @staticmethod
+    async def cache_incr(
+        redis: Redis,
+        key: str,
+        amount: int = 1
+    ) -> int:
+        """
+        自增计数
+        
+        Args:
+            redis: Redis客户端实例
+            key: 缓存键名
+            amount: 自增步长
+            
+        Returns:
+            int: 自增后的值,失败返回0
+        """
+        try:
+            return await redis.incrby(key, amount)
+        except Exception:
+            return 0
+
+    @staticmethod
+    async def cache_expire(
+        redis: Redis,
+        key: str,
+        expire: int
+    ) -> bool:
+        """
+        设置过期时间
+        
+        Args:
+            redis: Redis客户端实例
+            key: 缓存键名
+            expire: 过期时间(秒)
+            
+        Returns:
+            bool: 设置成功返回True,失败返回False
+        """
+        try:
+            return bool(await redis.expire(key, expire))
+        except Exception:
+            return False
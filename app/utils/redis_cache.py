@@ -1,7 +1,18 @@
-from typing import Any, List, Optional, Union
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
 import json
+import time
+import uuid
 from redis import Redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ResponseError
+
+from app.core.config import settings
+from app.core.etag import make_etag
+from app.core.response_cache import CacheTag, ResponseCache
+from app.utils.cache_metrics import CacheMetrics
+from app.utils.local_cache import LocalCache
 from app.utils.redis import RedisUtils
+from app.utils.single_flight import RELEASE_LOCK_SCRIPT, SingleFlight
 
 class RedisCacheKey:
     """Redis缓存键定义"""
@@ -10,25 +21,355 @@ class RedisCacheKey:
     
     # 用户相关
     USER_PERMISSIONS = "permissions_{}"  # user_id
-    USER_MENUS = "menus_{}"  # user_id
+    
+    # 实体不存在标记(负缓存), 与实体数据使用不同的键, 实体创建时删除
+    MISSING_USER = "missing_user_{}"  # user_id
+    MISSING_NOTE = "missing_note_{}"  # note_id
+    MISSING_KNOWLEDGE_BASE = "missing_knowledge_base_{}"  # knowledge_base_id
+    MISSING_GENERATION = "{}:gen"  # 不存在标记的键, 实体创建时递增的代数, 防止并发读取写入过期的不存在标记
     
     # 接口限流
     RATE_LIMIT = "rate_limit_{}_{}"  # ip, api_path
     USER_LIMIT = "user_limit_{}_{}"  # user_id, operation
     
     # 笔记相关
-    HOT_NOTES = "hot_notes"
+    HOT_NOTES = "hot_notes"  # 热门笔记排行(zset: note_id -> 热度)
+    HOT_NOTES_EPOCH = "hot_notes_epoch"  # 热度分数的基准时间戳
+    NOTE_LIKES = "note_likes_{}"  # note_id, 点赞用户集合(note_like 表的缓存)
+    NOTE_LIKE_DELTA = "note_like_delta_{}"  # shard, 待回写的点赞增量(hash: note_id -> delta)
+    NOTE_LIKE_DELTA_FLUSHING = "note_like_delta_{}_flushing"  # shard, 回写中的点赞增量
+    NOTE_LIKE_PENDING = "note_like_pending_{}"  # shard, 待回写的点赞状态(hash: user_id:note_id -> 0|1)
+    NOTE_LIKE_PENDING_FLUSHING = "note_like_pending_{}_flushing"  # shard, 回写中的点赞状态
+    USER_COLLECTIONS = "user_collections_{}"  # user_id, 收藏笔记集合
+    NOTE_COLLECTION_PENDING = "note_collection_pending_{}"  # shard, 待回写的收藏状态(hash: user_id:note_id -> 0|1)
+    NOTE_COLLECTION_PENDING_FLUSHING = "note_collection_pending_{}_flushing"  # shard, 回写中的收藏状态
+    NOTE_INTERACTION_FLUSH_LOCK = "note_interaction_flush_lock"
     NOTE_CONTENT = "note_{}"  # note_id
     USER_NOTES = "user_notes_{}"  # user_id
-    KNOWLEDGE_BASES = "knowledge_bases_{}"  # user_id
-    KNOWLEDGE_BASE_NOTES = "knowledge_base_notes_{}_{}"  # knowledge_base_id, page
+    NOTE_COMMENTS = "note_comments_{}"  # note_id, 评论分页缓存(hash: 分页参数 -> 评论页)
+    USER_FEED = "user_feed_{}"  # user_id, 关注动态时间线(list: note_id, 新的在前)
+    FEED_BIG_AUTHORS = "feed_big_authors"  # 粉丝过多、读取时拉取的作者集合
+    NOTE_VIEW_COUNT = "note_view_count_{}"  # note_id, 实时浏览次数
+    NOTE_VIEW_DELTA = "note_view_delta_{}"  # shard, 待回写的浏览增量(hash: note_id -> delta)
+    NOTE_VIEW_DELTA_FLUSHING = "note_view_delta_{}_flushing"  # shard, 回写中的浏览增量
+    NOTE_VIEW_FLUSH_LOCK = "note_view_flush_lock"
+    NOTE_VIEW_FLUSH_EPOCH = "note_view_flush_epoch_{}"  # shard, 每确认一组回写递增, 用于判断初始化计数期间是否发生过回写
+    KNOWLEDGE_BASE_PURGE_PROGRESS = "knowledge_base_purge_{}"  # knowledge_base_id, 后台删除进度(hash)
+    KNOWLEDGE_BASE_PURGE_LOCK = "knowledge_base_purge_lock_{}"  # knowledge_base_id
     
     # 系统配置
     SYSTEM_CONFIG = "system_config"
     ROLE_PERMISSIONS = "role_permissions_{}"  # role_id
 
+# 热度按指数衰减: 分数记为 weight * 2^((now - epoch) / half_life)，
+# 等价于所有旧分数随时间衰减，排行顺序只需比较存储的分数
+_HOT_INCR_SCRIPT = """
+local epoch = tonumber(redis.call('GET', KEYS[2]))
+if not epoch then
+    epoch = tonumber(ARGV[3])
+    redis.call('SET', KEYS[2], ARGV[3])
+end
+local score = tonumber(ARGV[2]) * math.pow(2, (tonumber(ARGV[3]) - epoch) / tonumber(ARGV[4]))
+return redis.call('ZINCRBY', KEYS[1], score, ARGV[1])
+"""
+
+# 基准时间过旧时整体缩放分数并前移基准时间，再裁剪排行尾部
+_HOT_PRUNE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local half_life = tonumber(ARGV[2])
+local epoch = tonumber(redis.call('GET', KEYS[2]))
+if epoch and now - epoch > half_life * tonumber(ARGV[3]) then
+    local factor = math.pow(2, (epoch - now) / half_life)
+    redis.call('ZUNIONSTORE', KEYS[1], 1, KEYS[1], 'WEIGHTS', factor)
+    redis.call('SET', KEYS[2], ARGV[1])
+end
+local size = redis.call('ZCARD', KEYS[1])
+local max_size = tonumber(ARGV[4])
+if size > max_size then
+    return redis.call('ZREMRANGEBYRANK', KEYS[1], 0, size - max_size - 1)
+end
+return 0
+"""
+
+
+# 增加浏览计数: 累加待回写增量, 实时计数键存在时同时自增; 返回实时计数, 计数键不存在时返回-1
+# KEYS[1]: 待回写hash  KEYS[2]: 实时计数
+# ARGV: note_id, 实时计数过期时间
+_VIEW_INCR_SCRIPT = """
+redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    local count = redis.call('INCR', KEYS[2])
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+    return count
+end
+return -1
+"""
+
+# 初始化实时计数: 数据库值 + 待回写增量 + 回写中的增量, 只在计数键不存在时写入,
+# 并发初始化时后到者返回已写入的计数; 计数键存在后的浏览都通过 INCR 累加, 不会被覆盖。
+# 笔记的增量正在回写(数据库值可能已包含这部分增量)或读取数据库后发生过回写时,
+# 数据库值与增量无法对齐, 只返回估算值不写入计数键, 由下一次浏览重新初始化
+# KEYS[1]: 待回写hash  KEYS[2]: 回写中的hash  KEYS[3]: 实时计数  KEYS[4]: 回写代数
+# ARGV: note_id, 数据库中的浏览次数, 实时计数过期时间, 读取数据库前的回写代数
+_VIEW_SEED_SCRIPT = """
+local pending = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+local flushing = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+local count = tonumber(ARGV[2]) + pending + flushing
+if flushing ~= 0 or (redis.call('GET', KEYS[4]) or '0') ~= ARGV[4] then
+    return count
+end
+if redis.call('SET', KEYS[3], count, 'NX', 'EX', ARGV[3]) then
+    return count
+end
+return tonumber(redis.call('GET', KEYS[3]) or count)
+"""
+
+# 确认一组浏览增量已写入数据库: 从回写中的hash删除这些笔记并递增回写代数,
+# 重试时不会重复回写已确认的笔记
+# KEYS[1]: 回写中的hash  KEYS[2]: 回写代数
+# ARGV: note_id...
+_VIEW_ACK_SCRIPT = """
+redis.call('HDEL', KEYS[1], unpack(ARGV))
+return redis.call('INCR', KEYS[2])
+"""
+
+# 修改集合成员关系，关系发生变化时在同一个脚本内记录待回写数据，保证两者原子；
+# 有待回写的变更时取消集合的过期时间，回写完成后再恢复，避免集合过期后从数据库加载到旧状态
+# KEYS[1]: 集合  KEYS[2]: 待回写hash
+# ARGV: 成员, 1-加入 0-移除, 待回写命令(hincrby|hset), 待回写字段, 待回写值
+_MEMBERSHIP_SCRIPT = """
+local changed
+if ARGV[2] == '1' then
+    changed = redis.call('SADD', KEYS[1], ARGV[1])
+else
+    changed = redis.call('SREM', KEYS[1], ARGV[1])
+end
+if changed == 1 then
+    redis.call('PERSIST', KEYS[1])
+    redis.call(ARGV[3], KEYS[2], ARGV[4], ARGV[5])
+end
+return changed
+"""
+
+# 点赞或取消点赞，关系发生变化时在同一个脚本内累加点赞增量并记录待回写的点赞状态，
+# 同时取消集合的过期时间，见 _MEMBERSHIP_SCRIPT
+# KEYS[1]: 点赞用户集合  KEYS[2]: 点赞增量hash  KEYS[3]: 点赞状态hash
+# ARGV: 用户ID, 1-点赞 0-取消, 笔记ID
+_LIKE_SCRIPT = """
+local changed
+if ARGV[2] == '1' then
+    changed = redis.call('SADD', KEYS[1], ARGV[1])
+else
+    changed = redis.call('SREM', KEYS[1], ARGV[1])
+end
+if changed == 1 then
+    redis.call('PERSIST', KEYS[1])
+    redis.call('HINCRBY', KEYS[2], ARGV[3], ARGV[2] == '1' and 1 or -1)
+    redis.call('HSET', KEYS[3], ARGV[1] .. ':' .. ARGV[3], ARGV[2])
+end
+return changed
+"""
+
+# 写入不存在标记，只在查询期间实体没有被创建(代数未变化)时写入
+# KEYS[1]: 不存在标记  KEYS[2]: 代数
+# ARGV: 查询前读取的代数, 过期时间
+_MISSING_MARK_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') == ARGV[1] then
+    redis.call('SET', KEYS[1], '1', 'EX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# 延长锁的过期时间，只在锁仍由自己持有时生效
+_REFRESH_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class CachedEntry:
+    """带ETag的缓存数据,数据在首次访问时才反序列化"""
+    __slots__ = ("etag", "payload", "fresh_until", "_data")
+    
+    def __init__(self, etag: str, payload: bytes, fresh_until: float):
+        self.etag = etag
+        self.payload = payload
+        self.fresh_until = fresh_until  # 软过期时间戳
+        self._data = None
+    
+    @property
+    def stale(self) -> bool:
+        """是否已软过期,软过期的数据仍可返回,同时应在后台刷新"""
+        return self.fresh_until <= time.time()
+    
+    @property
+    def fresh_ttl(self) -> float:
+        """距软过期的秒数"""
+        return self.fresh_until - time.time()
+    
+    @property
+    def data(self) -> Any:
+        """反序列化后的缓存数据"""
+        if self._data is None:
+            self._data = RedisUtils.decode(self.payload)
+        return self._data
+
+
+# 缓存未命中时的回源函数，返回要缓存的数据，数据不存在时返回None
+Loader = Callable[[], Awaitable[Any]]
+
+
 class RedisCache:
-    """Redis缓存工具类"""
+    """Redis缓存工具类
+    
+    读取缓存的get_*方法可传入回源函数loader，未命中时并发请求只回源一次并写入缓存，
+    见 SingleFlight
+    """
+    
+    @staticmethod
+    async def _get_or_load(
+        redis: Redis,
+        key: str,
+        read: Callable[[], Awaitable[Any]],
+        loader: Optional[Loader],
+        store: Callable[[Any], Awaitable[Any]],
+        is_stale: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """读取缓存，未命中且传入回源函数时合并回源
+        
+        Args:
+            redis: Redis连接
+            key: 缓存键，用于合并回源
+            read: 读取缓存，未命中返回None
+            loader: 回源函数
+            store: 写入回源的数据，返回与read相同格式的数据
+            is_stale: 判断缓存是否软过期，软过期时仍返回缓存，并在请求结束后后台回源刷新
+        """
+        value = await read()
+        stale = value is not None and is_stale is not None and is_stale(value)
+        CacheMetrics.record_lookup(CacheMetrics.family_of(key), value is not None, stale)
+        if loader is None or (value is not None and not stale):
+            return value
+        
+        async def load():
+            data = await loader()
+            return None if data is None else await store(data)
+        
+        if value is not None:
+            await SingleFlight.schedule_refresh(redis, key, load)
+            return value
+        return await SingleFlight.load(redis, key, read, load)
+    
+    @staticmethod
+    async def _load_existing(redis: Redis, missing_key: str, loader: Loader) -> Optional[Any]:
+        """查询实体，不存在时写入短期的不存在标记，标记过期前不再查询数据库
+        
+        创建实体时递增标记的代数(见 _queue_clear_missing)，查询前后代数不一致时不写入标记
+        
+        Args:
+            redis: Redis连接
+            missing_key: 不存在标记的缓存键
+            loader: 查询实体，不存在时返回None
+        
+        Returns:
+            Optional[Any]: 查询到的实体，不存在或存在不存在标记时返回None
+        """
+        missing = await RedisUtils.cache_get_raw(redis, missing_key)
+        CacheMetrics.record_lookup(CacheMetrics.family_of(missing_key), bool(missing))
+        if missing:
+            return None
+        generation_key = RedisCacheKey.MISSING_GENERATION.format(missing_key)
+        generation = await redis.get(generation_key) or "0"
+        entity = await loader()
+        if entity is None:
+            # 查询期间实体被创建时代数已变化，不再写入标记，避免新实体在标记过期前被当作不存在
+            script = redis.register_script(_MISSING_MARK_SCRIPT)
+            await script(keys=[missing_key, generation_key], args=[generation, settings.NEGATIVE_CACHE_TTL])
+        return entity
+    
+    @staticmethod
+    def _queue_clear_missing(pipe: Pipeline, missing_keys: Sequence[str]) -> None:
+        """删除不存在标记并递增其代数，使创建前开始的查询不能再写入标记"""
+        if not missing_keys:
+            return
+        RedisCache._queue_invalidate(pipe, missing_keys)
+        for missing_key in missing_keys:
+            generation_key = RedisCacheKey.MISSING_GENERATION.format(missing_key)
+            pipe.incr(generation_key)
+            # 代数只需要比一次查询的耗时长，过期后从0重新计数
+            pipe.expire(generation_key, 3600)
+    
+    @staticmethod
+    async def load_user(redis: Redis, user_id: int, loader: Loader) -> Optional[Any]:
+        """查询用户，不存在时短期缓存不存在标记，见 _load_existing"""
+        return await RedisCache._load_existing(redis, RedisCacheKey.MISSING_USER.format(user_id), loader)
+    
+    @staticmethod
+    async def load_note(redis: Redis, note_id: int, loader: Loader) -> Optional[Any]:
+        """查询笔记，不存在时短期缓存不存在标记，见 _load_existing"""
+        return await RedisCache._load_existing(redis, RedisCacheKey.MISSING_NOTE.format(note_id), loader)
+    
+    @staticmethod
+    async def load_knowledge_base(redis: Redis, knowledge_base_id: int, loader: Loader) -> Optional[Any]:
+        """查询未在删除中的知识库，不存在时短期缓存不存在标记，见 _load_existing
+        
+        删除中的知识库不会恢复，同样视为不存在
+        """
+        key = RedisCacheKey.MISSING_KNOWLEDGE_BASE.format(knowledge_base_id)
+        return await RedisCache._load_existing(redis, key, loader)
+    
+    @staticmethod
+    async def delete_missing_notes(redis: Redis, note_ids: List[int]) -> None:
+        """删除笔记的不存在标记(批量创建笔记后调用)，一次往返"""
+        if not note_ids:
+            return
+        async with redis.pipeline(transaction=False) as pipe:
+            RedisCache._queue_clear_missing(pipe, [RedisCacheKey.MISSING_NOTE.format(note_id) for note_id in note_ids])
+            await pipe.execute()
+    
+    @staticmethod
+    def _decode_legacy(value: Any) -> Any:
+        """旧格式的值在写入前已序列化过一次,读取后仍为JSON字符串,再解析一次"""
+        return json.loads(value) if isinstance(value, str) else value
+    
+    @staticmethod
+    async def _set_tagged(redis: Redis, key: str, data: Any, expire: int, stale: int = 0) -> CachedEntry:
+        """写入带ETag的缓存,ETag由序列化后的数据计算并与数据、软过期时间一起存储
+        
+        Args:
+            expire: 软过期时间(秒)
+            stale: 软过期后仍可返回的时间(秒),硬过期时间为两者之和
+        
+        Returns:
+            CachedEntry: 写入的缓存数据
+        """
+        payload = RedisUtils.encode(data)
+        etag = make_etag(payload)
+        fresh_until = time.time() + expire
+        value = f"{etag}\n{fresh_until}\n".encode() + payload
+        await RedisUtils.cache_set_raw(redis, key, value, expire=expire + stale)
+        return CachedEntry(etag, payload, fresh_until)
+    
+    @staticmethod
+    async def _get_tagged(redis: Redis, key: str) -> Optional[CachedEntry]:
+        """读取带ETag的缓存,只拆分ETag和软过期时间不反序列化数据
+        
+        数据部分为JSON文本的旧格式同样可以读取,没有软过期时间的更早格式视为未命中
+        """
+        value = await RedisUtils.cache_get_raw(redis, key)
+        if not value:
+            return None
+        parts = value.split(b"\n", 2)
+        if len(parts) != 3:
+            return None
+        etag, fresh_until, payload = parts
+        try:
+            return CachedEntry(etag.decode(), payload, float(fresh_until))
+        except ValueError:
+            return None
     
     @staticmethod
     async def set_user_permissions(redis: Redis, user_id: int, permissions: List[str], expire: int = 1800) -> bool:
@@ -41,53 +382,108 @@ class RedisCache:
             expire: 过期时间(秒)，默认30分钟
         """
         key = RedisCacheKey.USER_PERMISSIONS.format(user_id)
-        return await RedisUtils.cache_set(redis, key, json.dumps(permissions), expire=expire)
+        payload = RedisUtils.encode(permissions)
+        local = LocalCache.family("user_permissions")
+        if local:
+            local.set(key, permissions, len(payload))
+        return await RedisUtils.cache_set_raw(redis, key, payload, expire=expire)
     
     @staticmethod
-    async def get_user_permissions(redis: Redis, user_id: int) -> Optional[List[str]]:
-        """获取用户权限缓存"""
+    async def get_user_permissions(
+        redis: Redis, user_id: int, loader: Optional[Loader] = None
+    ) -> Optional[List[str]]:
+        """获取用户权限缓存，优先读取一级缓存"""
         key = RedisCacheKey.USER_PERMISSIONS.format(user_id)
-        data = await RedisUtils.cache_get(redis, key)
-        return json.loads(data) if data else None
-    
-    @staticmethod
-    async def set_user_menus(redis: Redis, user_id: int, menus: List[dict], expire: int = 1800) -> bool:
-        """设置用户菜单缓存"""
-        key = RedisCacheKey.USER_MENUS.format(user_id)
-        return await RedisUtils.cache_set(redis, key, json.dumps(menus), expire=expire)
+        local = LocalCache.family("user_permissions")
+        
+        async def read():
+            if local:
+                permissions = local.get(key)
+                if permissions is not None:
+                    return permissions
+                token = local.token()
+            data = await RedisUtils.cache_get_raw(redis, key)
+            if not data:
+                return None
+            permissions = RedisCache._decode_legacy(RedisUtils.decode(data))
+            if local:
+                local.set(key, permissions, len(data), token=token)
+            return permissions
+        
+        async def store(permissions):
+            await RedisCache.set_user_permissions(redis, user_id, permissions)
+            return permissions
+        
+        return await RedisCache._get_or_load(redis, key, read, loader, store)
     
     @staticmethod
-    async def get_user_menus(redis: Redis, user_id: int) -> Optional[List[dict]]:
-        """获取用户菜单缓存"""
-        key = RedisCacheKey.USER_MENUS.format(user_id)
-        data = await RedisUtils.cache_get(redis, key)
-        return json.loads(data) if data else None
+    async def _store_note_content(redis: Redis, note_id: int, content: dict, expire: int = 600) -> CachedEntry:
+        key = RedisCacheKey.NOTE_CONTENT.format(note_id)
+        local = LocalCache.family("note_content")
+        token = local.token() if local else None
+        entry = await RedisCache._set_tagged(redis, key, content, expire, settings.CACHE_STALE_TTL)
+        if local:
+            # 写入期间笔记被修改时令牌已变化，不写入一级缓存
+            local.set(key, entry, len(entry.payload), ttl=entry.fresh_ttl, token=token)
+        return entry
     
     @staticmethod
-    async def set_note_content(redis: Redis, note_id: int, content: dict, expire: int = 600) -> bool:
-        """设置笔记内容缓存"""
-        key = RedisCacheKey.NOTE_CONTENT.format(note_id)
-        return await RedisUtils.cache_set(redis, key, json.dumps(content), expire=expire)
+    async def set_note_content(redis: Redis, note_id: int, content: dict, expire: int = 600) -> str:
+        """设置笔记内容缓存，返回ETag"""
+        entry = await RedisCache._store_note_content(redis, note_id, content, expire)
+        return entry.etag
     
     @staticmethod
-    async def get_note_content(redis: Redis, note_id: int) -> Optional[dict]:
-        """获取笔记内容缓存"""
+    async def get_note_content(
+        redis: Redis, note_id: int, loader: Optional[Loader] = None
+    ) -> Optional[CachedEntry]:
+        """获取笔记内容缓存，优先读取一级缓存；返回的数据在多个请求间共享，不能修改
+        
+        软过期后仍返回旧数据，传入loader时在请求结束后后台刷新
+        """
         key = RedisCacheKey.NOTE_CONTENT.format(note_id)
-        data = await RedisUtils.cache_get(redis, key)
-        return json.loads(data) if data else None
+        local = LocalCache.family("note_content")
+        
+        async def read():
+            if local:
+                entry = local.get(key)
+                if entry is not None:
+                    return entry
+                token = local.token()
+            entry = await RedisCache._get_tagged(redis, key)
+            # 一级缓存只保存到软过期，软过期后从Redis读取后台刷新的结果
+            if entry and local and not entry.stale:
+                local.set(key, entry, len(entry.payload), ttl=entry.fresh_ttl, token=token)
+            return entry
+        
+        async def store(content):
+            return await RedisCache._store_note_content(redis, note_id, content)
+        
+        return await RedisCache._get_or_load(
+            redis, key, read, loader, store, is_stale=lambda entry: entry.stale
+        )
     
     @staticmethod
     async def set_user_notes(redis: Redis, user_id: int, notes: List[dict], expire: int = 300) -> bool:
         """设置用户笔记列表缓存"""
         key = RedisCacheKey.USER_NOTES.format(user_id)
-        return await RedisUtils.cache_set(redis, key, json.dumps(notes), expire=expire)
+        return await RedisUtils.cache_set(redis, key, notes, expire=expire)
     
     @staticmethod
-    async def get_user_notes(redis: Redis, user_id: int) -> Optional[List[dict]]:
+    async def get_user_notes(
+        redis: Redis, user_id: int, loader: Optional[Loader] = None
+    ) -> Optional[List[dict]]:
         """获取用户笔记列表缓存"""
         key = RedisCacheKey.USER_NOTES.format(user_id)
-        data = await RedisUtils.cache_get(redis, key)
-        return json.loads(data) if data else None
+        
+        async def read():
+            return RedisCache._decode_legacy(await RedisUtils.cache_get(redis, key))
+        
+        async def store(notes):
+            await RedisCache.set_user_notes(redis, user_id, notes)
+            return notes
+        
+        return await RedisCache._get_or_load(redis, key, read, loader, store)
     
     @staticmethod
     async def increment_rate_limit(redis: Redis, ip: str, api_path: str, expire: int = 60) -> int:
@@ -106,22 +502,56 @@ class RedisCache:
         return int(count or 0) < limit
         
     @staticmethod
-    async def delete_user_permissions(redis: Redis, user_id: int) -> bool:
+    async def _invalidate(
+        redis: Redis,
+        keys: Sequence[str] = (),
+        tags: Sequence[str] = (),
+        local: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        """在一个pipeline中删除缓存键、失效响应缓存标签并发布一级缓存失效通知
+        
+        Args:
+            redis: Redis连接
+            keys: 要删除的缓存键
+            tags: 要失效的响应缓存标签
+            local: 一级缓存键族 -> 要失效的缓存键
+        """
+        async with redis.pipeline(transaction=False) as pipe:
+            RedisCache._queue_invalidate(pipe, keys, tags, local)
+            await pipe.execute()
+    
+    @staticmethod
+    def _queue_invalidate(
+        pipe: Pipeline,
+        keys: Sequence[str] = (),
+        tags: Sequence[str] = (),
+        local: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        """把 _invalidate 的命令加入已有的pipeline"""
+        if keys:
+            pipe.delete(*keys)
+            for key in keys:
+                CacheMetrics.incr(CacheMetrics.family_of(key), "deletes")
+        ResponseCache.queue_invalidate(pipe, tags)
+        for name, local_keys in (local or {}).items():
+            LocalCache.queue_invalidate(pipe, name, local_keys)
+    
+    @staticmethod
+    async def delete_user_permissions(redis: Redis, user_id: int) -> None:
         """删除用户权限缓存"""
         key = RedisCacheKey.USER_PERMISSIONS.format(user_id)
-        return await RedisUtils.cache_delete(redis, key)
+        await RedisCache._invalidate(redis, keys=[key], local={"user_permissions": [key]})
         
     @staticmethod
-    async def delete_user_menus(redis: Redis, user_id: int) -> bool:
-        """删除用户菜单缓存"""
-        key = RedisCacheKey.USER_MENUS.format(user_id)
-        return await RedisUtils.cache_delete(redis, key)
+    async def delete_user_menus(redis: Redis, user_id: int) -> None:
+        """失效用户菜单缓存"""
+        await ResponseCache.invalidate(redis, CacheTag.USER_MENUS.format(current_user_id=user_id))
         
     @staticmethod
-    async def delete_note_content(redis: Redis, note_id: int) -> bool:
+    async def delete_note_content(redis: Redis, note_id: int) -> None:
         """删除笔记内容缓存"""
         key = RedisCacheKey.NOTE_CONTENT.format(note_id)
-        return await RedisUtils.cache_delete(redis, key)
+        await RedisCache._invalidate(redis, keys=[key], local={"note_content": [key]})
         
     @staticmethod
     async def delete_user_notes(redis: Redis, user_id: int) -> bool:
@@ -131,68 +561,657 @@ class RedisCache:
         
     @staticmethod
     async def clear_user_cache(redis: Redis, user_id: int) -> None:
-        """清除用户所有相关缓存"""
-        await RedisCache.delete_user_permissions(redis, user_id)
-        await RedisCache.delete_user_menus(redis, user_id)
-        await RedisCache.delete_user_notes(redis, user_id)
+        """清除用户所有相关缓存(权限、菜单、笔记列表、不存在标记)，一次往返"""
+        permissions_key = RedisCacheKey.USER_PERMISSIONS.format(user_id)
+        async with redis.pipeline(transaction=False) as pipe:
+            RedisCache._queue_invalidate(
+                pipe,
+                [permissions_key, RedisCacheKey.USER_NOTES.format(user_id)],
+                tags=[CacheTag.USER_MENUS.format(current_user_id=user_id)],
+                local={"user_permissions": [permissions_key]},
+            )
+            RedisCache._queue_clear_missing(pipe, [RedisCacheKey.MISSING_USER.format(user_id)])
+            await pipe.execute()
+    
+    @staticmethod
+    async def clear_note_cache(
+        redis: Redis,
+        user_id: int,
+        knowledge_base_id: int,
+        note_id: Optional[int] = None,
+        deleted: bool = False,
+    ) -> None:
+        """清除笔记写入后失效的所有缓存，一次往返
+        
+        包括作者的笔记列表、知识库笔记列表、全部笔记列表，以及笔记本身的内容缓存和不存在标记
+        
+        Args:
+            redis: Redis连接
+            user_id: 作者ID
+            knowledge_base_id: 笔记所在知识库ID
+            note_id: 笔记ID
+            deleted: 笔记已删除，同时删除点赞集合并移出热门排行
+        """
+        tags = [
+            CacheTag.KNOWLEDGE_BASE_NOTES.format(knowledge_bases_id=knowledge_base_id),
+            CacheTag.NOTES_LIST,
+        ]
+        async with redis.pipeline(transaction=False) as pipe:
+            RedisCache._queue_invalidate(pipe, [RedisCacheKey.USER_NOTES.format(user_id)], tags)
+            if note_id is not None and deleted:
+                RedisCache._queue_remove_notes(pipe, [note_id])
+            elif note_id is not None:
+                content_key = RedisCacheKey.NOTE_CONTENT.format(note_id)
+                RedisCache._queue_invalidate(pipe, [content_key], local={"note_content": [content_key]})
+                RedisCache._queue_clear_missing(pipe, [RedisCacheKey.MISSING_NOTE.format(note_id)])
+            await pipe.execute()
+    
+    @staticmethod
+    def _queue_remove_notes(pipe: Pipeline, note_ids: List[int]) -> None:
+        """删除笔记的内容缓存和点赞集合，并移出热门排行"""
+        content_keys = [RedisCacheKey.NOTE_CONTENT.format(note_id) for note_id in note_ids]
+        like_keys = [RedisCacheKey.NOTE_LIKES.format(note_id) for note_id in note_ids]
+        RedisCache._queue_invalidate(pipe, content_keys + like_keys, local={"note_content": content_keys})
+        pipe.zrem(RedisCacheKey.HOT_NOTES, *note_ids)
+    
+    @staticmethod
+    async def clear_deleted_notes_cache(redis: Redis, note_ids: List[int]) -> None:
+        """清除已删除笔记的内容缓存、点赞集合和热门排行，一次往返"""
+        if not note_ids:
+            return
+        async with redis.pipeline(transaction=False) as pipe:
+            RedisCache._queue_remove_notes(pipe, note_ids)
+            await pipe.execute()
+    
+    @staticmethod
+    async def delete_knowledge_bases(redis: Redis, user_id: int) -> None:
+        """失效用户知识库列表缓存"""
+        await ResponseCache.invalidate(redis, CacheTag.KNOWLEDGE_BASES.format(user_id=user_id))
     
     @staticmethod
-    async def set_knowledge_bases(redis: Redis, user_id: int, knowledge_bases: List[dict], expire: int = 300) -> bool:
-        """设置用户知识库列表缓存"""
-        key = RedisCacheKey.KNOWLEDGE_BASES.format(user_id)
-        return await RedisUtils.cache_set(redis, key, json.dumps(knowledge_bases), expire=expire)
+    async def delete_knowledge_base_notes(redis: Redis, knowledge_base_id: int) -> None:
+        """失效知识库所有笔记列表缓存（当知识库内容变更时调用），所有页和筛选条件一次失效"""
+        tag = CacheTag.KNOWLEDGE_BASE_NOTES.format(knowledge_bases_id=knowledge_base_id)
+        await ResponseCache.invalidate(redis, tag)
     
     @staticmethod
-    async def get_knowledge_bases(redis: Redis, user_id: int) -> Optional[List[dict]]:
-        """获取用户知识库列表缓存"""
-        key = RedisCacheKey.KNOWLEDGE_BASES.format(user_id)
-        data = await RedisUtils.cache_get(redis, key)
-        return json.loads(data) if data else None
+    async def delete_notes_list(redis: Redis) -> None:
+        """失效全部笔记列表缓存（笔记新增、修改或删除时调用）"""
+        await ResponseCache.invalidate(redis, CacheTag.NOTES_LIST)
+    
+    @staticmethod
+    async def set_note_comments(redis: Redis, note_id: int, page_key: str, data: dict, expire: int = 30) -> None:
+        """设置笔记评论分页缓存
+        
+        同一笔记的所有分页存放在一个hash中，评论变更时删除整个hash即可全部失效
+        
+        Args:
+            redis: Redis连接
+            note_id: 笔记ID
+            page_key: 分页参数组成的字段名
+            data: 评论页数据
+            expire: 过期时间(秒)，默认30秒
+        """
+        key = RedisCacheKey.NOTE_COMMENTS.format(note_id)
+        payload = RedisUtils.encode(data)
+        start = time.perf_counter()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, page_key, payload)
+            pipe.expire(key, expire)
+            await pipe.execute()
+        CacheMetrics.record_set(CacheMetrics.family_of(key), time.perf_counter() - start, len(payload))
     
     @staticmethod
-    async def delete_knowledge_bases(redis: Redis, user_id: int) -> bool:
-        """删除用户知识库列表缓存"""
-        key = RedisCacheKey.KNOWLEDGE_BASES.format(user_id)
+    async def get_note_comments(
+        redis: Redis, note_id: int, page_key: str, loader: Optional[Loader] = None
+    ) -> Optional[dict]:
+        """获取笔记评论分页缓存"""
+        key = RedisCacheKey.NOTE_COMMENTS.format(note_id)
+        
+        async def read():
+            return await RedisUtils.cache_hget(redis, key, page_key)
+        
+        async def store(data):
+            await RedisCache.set_note_comments(redis, note_id, page_key, data)
+            return data
+        
+        return await RedisCache._get_or_load(redis, f"{key}:{page_key}", read, loader, store)
+    
+    @staticmethod
+    async def delete_note_comments(redis: Redis, note_id: int) -> bool:
+        """删除笔记的全部评论分页缓存"""
+        key = RedisCacheKey.NOTE_COMMENTS.format(note_id)
         return await RedisUtils.cache_delete(redis, key)
     
     @staticmethod
-    async def set_knowledge_base_notes(
-        redis: Redis, 
-        knowledge_base_id: int, 
-        page: int,
-        notes_data: dict,
-        expire: int = 300
-    ) -> bool:
-        """设置知识库笔记列表缓存
+    async def push_feeds(redis: Redis, user_ids: List[int], note_ids: List[int]) -> None:
+        """将笔记推入用户的时间线
+        
+        只推送到已存在的时间线(LPUSHX)，不活跃用户的时间线在读取时再重建；
+        推送后截断到 FEED_MAX_LENGTH
         
         Args:
             redis: Redis连接
-            knowledge_base_id: 知识库ID
-            page: 页码
-            notes_data: 笔记列表数据，包含分页信息
-            expire: 过期时间(秒)，默认5分钟
+            user_ids: 粉丝ID列表
+            note_ids: 笔记ID列表，按ID升序，最新的最后推入
         """
-        key = RedisCacheKey.KNOWLEDGE_BASE_NOTES.format(knowledge_base_id, page)
-        return await RedisUtils.cache_set(redis, key, json.dumps(notes_data), expire=expire)
+        if not user_ids or not note_ids:
+            return
+        async with redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                key = RedisCacheKey.USER_FEED.format(user_id)
+                pipe.lpushx(key, *note_ids)
+                pipe.ltrim(key, 0, settings.FEED_MAX_LENGTH - 1)
+            await pipe.execute()
     
     @staticmethod
-    async def get_knowledge_base_notes(redis: Redis, knowledge_base_id: int, page: int) -> Optional[dict]:
-        """获取知识库笔记列表缓存"""
-        key = RedisCacheKey.KNOWLEDGE_BASE_NOTES.format(knowledge_base_id, page)
-        data = await RedisUtils.cache_get(redis, key)
-        return json.loads(data) if data else None
+    async def get_feed(
+        redis: Redis, user_id: int, loader: Optional[Loader] = None
+    ) -> Optional[List[int]]:
+        """读取用户时间线并延长过期时间
+        
+        Args:
+            loader: 时间线不存在时的重建函数，返回笔记ID列表(新的在前)
+        
+        Returns:
+            Optional[List[int]]: 笔记ID列表(新的在前)，时间线不存在时返回None
+        """
+        key = RedisCacheKey.USER_FEED.format(user_id)
+        
+        async def read():
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.lrange(key, 0, -1)
+                pipe.expire(key, settings.FEED_EXPIRE)
+                note_ids, _ = await pipe.execute()
+            if not note_ids:
+                return None
+            # 0 是重建时写入的占位元素，用于区分空时间线和不存在的时间线
+            return [int(note_id) for note_id in note_ids if note_id != "0"]
+        
+        async def store(note_ids):
+            await RedisCache.set_feed(redis, user_id, note_ids)
+            return note_ids
+        
+        return await RedisCache._get_or_load(redis, key, read, loader, store)
     
     @staticmethod
-    async def delete_knowledge_base_notes(redis: Redis, knowledge_base_id: int) -> None:
-        """删除知识库所有笔记列表缓存（当知识库内容变更时调用）"""
-        # 由于不知道具体有多少页，我们删除前10页的缓存
-        for page in range(1, 11):
-            key = RedisCacheKey.KNOWLEDGE_BASE_NOTES.format(knowledge_base_id, page)
-            await RedisUtils.cache_delete(redis, key)
+    async def set_feed(redis: Redis, user_id: int, note_ids: List[int]) -> None:
+        """重建用户时间线，末尾追加占位元素0"""
+        key = RedisCacheKey.USER_FEED.format(user_id)
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.rpush(key, *note_ids, 0)
+            pipe.expire(key, settings.FEED_EXPIRE)
+            await pipe.execute()
+    
+    @staticmethod
+    async def delete_feed(redis: Redis, user_id: int) -> bool:
+        """删除用户时间线，关注关系变化时调用，下次读取时重建"""
+        key = RedisCacheKey.USER_FEED.format(user_id)
+        return await RedisUtils.cache_delete(redis, key)
+    
+    @staticmethod
+    async def set_feed_big_author(redis: Redis, author_id: int, big: bool) -> None:
+        """标记作者是否因粉丝过多改为读取时拉取"""
+        if big:
+            await redis.sadd(RedisCacheKey.FEED_BIG_AUTHORS, author_id)
+        else:
+            await redis.srem(RedisCacheKey.FEED_BIG_AUTHORS, author_id)
+    
+    @staticmethod
+    async def get_feed_big_authors(redis: Redis) -> set:
+        """获取读取时拉取的作者ID集合"""
+        return {int(author_id) for author_id in await redis.smembers(RedisCacheKey.FEED_BIG_AUTHORS)}
     
     @staticmethod
     async def clear_knowledge_base_cache(redis: Redis, user_id: int, knowledge_base_id: int) -> None:
-        """清除知识库相关的所有缓存"""
-        await RedisCache.delete_knowledge_bases(redis, user_id)
-        await RedisCache.delete_knowledge_base_notes(redis, knowledge_base_id)
-        await RedisCache.delete_user_notes(redis, user_id) 
\ No newline at end of file
+        """清除知识库相关的所有缓存(包括不存在标记)，一次往返"""
+        async with redis.pipeline(transaction=False) as pipe:
+            RedisCache._queue_invalidate(
+                pipe,
+                [RedisCacheKey.USER_NOTES.format(user_id)],
+                tags=[
+                    CacheTag.KNOWLEDGE_BASES.format(user_id=user_id),
+                    CacheTag.KNOWLEDGE_BASE_NOTES.format(knowledge_bases_id=knowledge_base_id),
+                    CacheTag.NOTES_LIST,
+                ],
+            )
+            RedisCache._queue_clear_missing(pipe, [RedisCacheKey.MISSING_KNOWLEDGE_BASE.format(knowledge_base_id)])
+            await pipe.execute()
+
+    @staticmethod
+    async def incr_note_view(redis: Redis, note_id: int, expire: int = 86400) -> Optional[int]:
+        """增加笔记浏览计数
+        
+        一次往返内原子地累加待回写增量和实时计数
+        
+        Args:
+            redis: Redis连接
+            note_id: 笔记ID
+            expire: 实时计数过期时间(秒)，默认1天
+            
+        Returns:
+            Optional[int]: 实时计数，计数键不存在时返回None，需要调用方用 seed_note_view_count 初始化
+        """
+        shard = note_id % settings.NOTE_VIEW_SHARDS
+        script = redis.register_script(_VIEW_INCR_SCRIPT)
+        count = await script(
+            keys=[RedisCacheKey.NOTE_VIEW_DELTA.format(shard), RedisCacheKey.NOTE_VIEW_COUNT.format(note_id)],
+            args=[note_id, expire],
+        )
+        return None if int(count) < 0 else int(count)
+    
+    @staticmethod
+    async def get_view_flush_epoch(redis: Redis, note_id: int) -> str:
+        """获取笔记所在分片的回写代数，读取数据库中的浏览次数前调用"""
+        shard = note_id % settings.NOTE_VIEW_SHARDS
+        return await redis.get(RedisCacheKey.NOTE_VIEW_FLUSH_EPOCH.format(shard)) or "0"
+    
+    @staticmethod
+    async def seed_note_view_count(
+        redis: Redis, note_id: int, db_count: int, epoch: str, expire: int = 86400
+    ) -> int:
+        """初始化笔记实时浏览计数
+        
+        计数为数据库值加上待回写和回写中的增量，计数键已被其他请求初始化时返回已有计数；
+        增量正在回写或读取数据库后发生过回写时只返回估算值，不写入计数键
+        
+        Args:
+            redis: Redis连接
+            note_id: 笔记ID
+            db_count: 数据库中的浏览次数
+            epoch: 读取数据库前通过 get_view_flush_epoch 获取的回写代数
+            expire: 实时计数过期时间(秒)，默认1天
+        
+        Returns:
+            int: 实时计数
+        """
+        shard = note_id % settings.NOTE_VIEW_SHARDS
+        script = redis.register_script(_VIEW_SEED_SCRIPT)
+        count = await script(
+            keys=[
+                RedisCacheKey.NOTE_VIEW_DELTA.format(shard),
+                RedisCacheKey.NOTE_VIEW_DELTA_FLUSHING.format(shard),
+                RedisCacheKey.NOTE_VIEW_COUNT.format(note_id),
+                RedisCacheKey.NOTE_VIEW_FLUSH_EPOCH.format(shard),
+            ],
+            args=[note_id, db_count, expire, epoch],
+        )
+        return int(count)
+    
+    @staticmethod
+    async def get_note_view_counts(redis: Redis, note_ids: List[int]) -> Dict[int, int]:
+        """批量获取笔记实时浏览计数，一次 MGET
+        
+        Returns:
+            Dict[int, int]: note_id -> 浏览次数，只包含Redis中有计数的笔记
+        """
+        keys = [RedisCacheKey.NOTE_VIEW_COUNT.format(note_id) for note_id in note_ids]
+        counts = await RedisUtils.cache_mget(redis, keys)
+        return {note_id: int(count) for note_id, count in zip(note_ids, counts) if count is not None}
+    
+    @staticmethod
+    async def _acquire_lock(redis: Redis, key: str, expire: int) -> Optional[str]:
+        """获取锁，成功时返回持有者令牌，释放时传回"""
+        token = uuid.uuid4().hex
+        return token if await redis.set(key, token, nx=True, ex=expire) else None
+    
+    @staticmethod
+    async def _refresh_lock(redis: Redis, key: str, token: str, expire: int) -> bool:
+        """延长自己持有的锁的过期时间，锁已过期或被其他worker持有时返回False"""
+        return bool(await redis.register_script(_REFRESH_LOCK_SCRIPT)(keys=[key], args=[token, expire]))
+    
+    @staticmethod
+    async def _release_lock(redis: Redis, key: str, token: str) -> bool:
+        """释放锁，只删除自己持有的锁，避免锁过期后被其他worker抢到时误删"""
+        return bool(await redis.register_script(RELEASE_LOCK_SCRIPT)(keys=[key], args=[token]))
+    
+    @staticmethod
+    async def acquire_view_flush_lock(redis: Redis, expire: int = 30) -> Optional[str]:
+        """获取浏览计数回写锁，保证多个worker中同时只有一个在回写
+        
+        Returns:
+            Optional[str]: 锁令牌，未获取到时返回None
+        """
+        return await RedisCache._acquire_lock(redis, RedisCacheKey.NOTE_VIEW_FLUSH_LOCK, expire)
+    
+    @staticmethod
+    async def refresh_view_flush_lock(redis: Redis, token: str, expire: int = 30) -> bool:
+        """延长浏览计数回写锁，锁已过期或被其他worker持有时返回False"""
+        return await RedisCache._refresh_lock(redis, RedisCacheKey.NOTE_VIEW_FLUSH_LOCK, token, expire)
+    
+    @staticmethod
+    async def release_view_flush_lock(redis: Redis, token: str) -> bool:
+        """释放浏览计数回写锁"""
+        return await RedisCache._release_lock(redis, RedisCacheKey.NOTE_VIEW_FLUSH_LOCK, token)
+    
+    @staticmethod
+    async def _take_pending(redis: Redis, key: str, flushing_key: str) -> Dict[str, str]:
+        """取出待回写的hash
+        
+        先将hash原子地重命名为回写中的键，之后新的写入会进入新的hash；
+        若上次回写中途崩溃遗留了回写中的键，则优先返回遗留数据
+        """
+        if not await redis.exists(flushing_key):
+            try:
+                await redis.rename(key, flushing_key)
+            except ResponseError:
+                # hash不存在，说明没有新的待回写数据
+                return {}
+        return await redis.hgetall(flushing_key)
+    
+    @staticmethod
+    async def take_note_view_deltas(redis: Redis, shard: int) -> Dict[int, int]:
+        """取出一个分片的待回写浏览增量
+        
+        Returns:
+            Dict[int, int]: note_id -> 增量
+        """
+        data = await RedisCache._take_pending(
+            redis,
+            RedisCacheKey.NOTE_VIEW_DELTA.format(shard),
+            RedisCacheKey.NOTE_VIEW_DELTA_FLUSHING.format(shard),
+        )
+        return {int(note_id): int(delta) for note_id, delta in data.items()}
+    
+    @staticmethod
+    async def ack_note_view_group(redis: Redis, shard: int, note_ids: List[int]) -> None:
+        """确认一组笔记的浏览增量已回写数据库，并递增分片的回写代数"""
+        script = redis.register_script(_VIEW_ACK_SCRIPT)
+        await script(
+            keys=[
+                RedisCacheKey.NOTE_VIEW_DELTA_FLUSHING.format(shard),
+                RedisCacheKey.NOTE_VIEW_FLUSH_EPOCH.format(shard),
+            ],
+            args=note_ids,
+        )
+    
+    @staticmethod
+    async def ack_note_view_deltas(redis: Redis, shard: int) -> bool:
+        """确认一个分片的浏览增量已回写数据库"""
+        key = RedisCacheKey.NOTE_VIEW_DELTA_FLUSHING.format(shard)
+        return await RedisUtils.cache_delete(redis, key)
+    
+    @staticmethod
+    async def note_likes_loaded(redis: Redis, note_id: int) -> bool:
+        """笔记点赞用户集合是否已加载到Redis"""
+        return bool(await redis.exists(RedisCacheKey.NOTE_LIKES.format(note_id)))
+    
+    @staticmethod
+    async def load_note_likes(redis: Redis, note_id: int, user_ids: List[int]) -> None:
+        """加载笔记点赞用户集合，集合中的占位成员0用于区分已加载的空集合"""
+        await RedisCache._load_membership_set(redis, RedisCacheKey.NOTE_LIKES.format(note_id), user_ids)
+    
+    @staticmethod
+    async def _load_membership_set(redis: Redis, key: str, members: List[int]) -> None:
+        """加载点赞或收藏集合并设置过期时间，集合不再使用时自动释放"""
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.sadd(key, 0, *members)
+            pipe.expire(key, settings.NOTE_INTERACTION_CACHE_TTL)
+            await pipe.execute()
+    
+    @staticmethod
+    async def expire_interaction_sets(redis: Redis, note_ids: Sequence[int], user_ids: Sequence[int]) -> None:
+        """变更回写数据库后恢复点赞用户集合和收藏集合的过期时间，一次往返"""
+        keys = [RedisCacheKey.NOTE_LIKES.format(note_id) for note_id in note_ids]
+        keys += [RedisCacheKey.USER_COLLECTIONS.format(user_id) for user_id in user_ids]
+        if not keys:
+            return
+        async with redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.expire(key, settings.NOTE_INTERACTION_CACHE_TTL)
+            await pipe.execute()
+    
+    @staticmethod
+    async def set_note_like(redis: Redis, note_id: int, user_id: int, liked: bool) -> bool:
+        """点赞或取消点赞
+        
+        点赞关系记录在笔记的点赞用户集合中，关系发生变化时在同一个脚本内
+        累加待回写的点赞增量并记录待回写的点赞状态
+        
+        Returns:
+            bool: 点赞关系是否发生变化(重复点赞或重复取消返回False)
+        """
+        shard = note_id % settings.NOTE_INTERACTION_SHARDS
+        script = redis.register_script(_LIKE_SCRIPT)
+        changed = await script(
+            keys=[
+                RedisCacheKey.NOTE_LIKES.format(note_id),
+                RedisCacheKey.NOTE_LIKE_DELTA.format(shard),
+                RedisCacheKey.NOTE_LIKE_PENDING.format(shard),
+            ],
+            args=[user_id, 1 if liked else 0, note_id],
+        )
+        return bool(changed)
+    
+    @staticmethod
+    async def delete_note_likes(redis: Redis, note_ids: List[int]) -> int:
+        """删除笔记的点赞用户集合"""
+        if not note_ids:
+            return 0
+        return await RedisUtils.cache_mdelete(redis, [RedisCacheKey.NOTE_LIKES.format(note_id) for note_id in note_ids])
+    
+    @staticmethod
+    async def is_note_liked(redis: Redis, note_id: int, user_id: int) -> bool:
+        """用户是否已点赞笔记"""
+        return bool(await redis.sismember(RedisCacheKey.NOTE_LIKES.format(note_id), user_id))
+    
+    @staticmethod
+    async def take_note_like_deltas(redis: Redis, shard: int) -> Dict[int, int]:
+        """取出一个分片的待回写点赞增量
+        
+        Returns:
+            Dict[int, int]: note_id -> 增量(可能为负)
+        """
+        data = await RedisCache._take_pending(
+            redis,
+            RedisCacheKey.NOTE_LIKE_DELTA.format(shard),
+            RedisCacheKey.NOTE_LIKE_DELTA_FLUSHING.format(shard),
+        )
+        return {int(note_id): int(delta) for note_id, delta in data.items()}
+    
+    @staticmethod
+    async def ack_note_like_deltas(redis: Redis, shard: int) -> bool:
+        """确认一个分片的点赞增量已回写数据库"""
+        key = RedisCacheKey.NOTE_LIKE_DELTA_FLUSHING.format(shard)
+        return await RedisUtils.cache_delete(redis, key)
+    
+    @staticmethod
+    async def _take_membership_changes(redis: Redis, key: str, flushing_key: str) -> Dict[Tuple[int, int], bool]:
+        """取出待回写的关系状态，字段为 user_id:note_id，值为 0|1"""
+        data = await RedisCache._take_pending(redis, key, flushing_key)
+        changes = {}
+        for field, state in data.items():
+            user_id, note_id = field.split(":")
+            changes[(int(user_id), int(note_id))] = state == "1"
+        return changes
+    
+    @staticmethod
+    async def take_note_like_changes(redis: Redis, shard: int) -> Dict[Tuple[int, int], bool]:
+        """取出一个分片的待回写点赞状态
+        
+        Returns:
+            Dict[Tuple[int, int], bool]: (user_id, note_id) -> 是否点赞
+        """
+        return await RedisCache._take_membership_changes(
+            redis,
+            RedisCacheKey.NOTE_LIKE_PENDING.format(shard),
+            RedisCacheKey.NOTE_LIKE_PENDING_FLUSHING.format(shard),
+        )
+    
+    @staticmethod
+    async def ack_note_like_changes(redis: Redis, shard: int) -> bool:
+        """确认一个分片的点赞状态已回写数据库"""
+        key = RedisCacheKey.NOTE_LIKE_PENDING_FLUSHING.format(shard)
+        return await RedisUtils.cache_delete(redis, key)
+    
+    @staticmethod
+    async def user_collections_loaded(redis: Redis, user_id: int) -> bool:
+        """用户收藏集合是否已加载到Redis"""
+        return bool(await redis.exists(RedisCacheKey.USER_COLLECTIONS.format(user_id)))
+    
+    @staticmethod
+    async def load_user_collections(redis: Redis, user_id: int, note_ids: List[int]) -> None:
+        """加载用户收藏集合，集合中的占位成员0用于区分已加载的空集合"""
+        await RedisCache._load_membership_set(redis, RedisCacheKey.USER_COLLECTIONS.format(user_id), note_ids)
+    
+    @staticmethod
+    async def set_note_collection(redis: Redis, user_id: int, note_id: int, collected: bool) -> bool:
+        """收藏或取消收藏
+        
+        收藏关系记录在用户的收藏集合中，关系发生变化时在同一个脚本内记录待回写的最终状态
+        
+        Returns:
+            bool: 收藏关系是否发生变化
+        """
+        shard = note_id % settings.NOTE_INTERACTION_SHARDS
+        script = redis.register_script(_MEMBERSHIP_SCRIPT)
+        changed = await script(
+            keys=[
+                RedisCacheKey.USER_COLLECTIONS.format(user_id),
+                RedisCacheKey.NOTE_COLLECTION_PENDING.format(shard),
+            ],
+            args=[note_id, 1 if collected else 0, "hset", f"{user_id}:{note_id}", 1 if collected else 0],
+        )
+        return bool(changed)
+    
+    @staticmethod
+    async def is_note_collected(redis: Redis, user_id: int, note_id: int) -> bool:
+        """用户是否已收藏笔记"""
+        return bool(await redis.sismember(RedisCacheKey.USER_COLLECTIONS.format(user_id), note_id))
+    
+    @staticmethod
+    async def take_note_collection_changes(redis: Redis, shard: int) -> Dict[Tuple[int, int], bool]:
+        """取出一个分片的待回写收藏变更
+        
+        Returns:
+            Dict[Tuple[int, int], bool]: (user_id, note_id) -> 是否收藏
+        """
+        return await RedisCache._take_membership_changes(
+            redis,
+            RedisCacheKey.NOTE_COLLECTION_PENDING.format(shard),
+            RedisCacheKey.NOTE_COLLECTION_PENDING_FLUSHING.format(shard),
+        )
+    
+    @staticmethod
+    async def ack_note_collection_changes(redis: Redis, shard: int) -> bool:
+        """确认一个分片的收藏变更已回写数据库"""
+        key = RedisCacheKey.NOTE_COLLECTION_PENDING_FLUSHING.format(shard)
+        return await RedisUtils.cache_delete(redis, key)
+    
+    @staticmethod
+    async def acquire_interaction_flush_lock(redis: Redis, expire: int = 30) -> Optional[str]:
+        """获取点赞收藏回写锁，保证多个worker中同时只有一个在回写
+        
+        Returns:
+            Optional[str]: 锁令牌，未获取到时返回None
+        """
+        return await RedisCache._acquire_lock(redis, RedisCacheKey.NOTE_INTERACTION_FLUSH_LOCK, expire)
+    
+    @staticmethod
+    async def release_interaction_flush_lock(redis: Redis, token: str) -> bool:
+        """释放点赞收藏回写锁"""
+        return await RedisCache._release_lock(redis, RedisCacheKey.NOTE_INTERACTION_FLUSH_LOCK, token)
+    
+    @staticmethod
+    async def acquire_purge_lock(redis: Redis, knowledge_base_id: int, expire: int = 120) -> Optional[str]:
+        """获取知识库删除锁，保证同一知识库同时只有一个worker在删除
+        
+        Returns:
+            Optional[str]: 锁令牌，未获取到时返回None
+        """
+        key = RedisCacheKey.KNOWLEDGE_BASE_PURGE_LOCK.format(knowledge_base_id)
+        return await RedisCache._acquire_lock(redis, key, expire)
+    
+    @staticmethod
+    async def refresh_purge_lock(redis: Redis, knowledge_base_id: int, token: str, expire: int = 120) -> bool:
+        """延长知识库删除锁的过期时间，锁已过期或被其他worker持有时返回False"""
+        key = RedisCacheKey.KNOWLEDGE_BASE_PURGE_LOCK.format(knowledge_base_id)
+        return await RedisCache._refresh_lock(redis, key, token, expire)
+    
+    @staticmethod
+    async def release_purge_lock(redis: Redis, knowledge_base_id: int, token: str) -> bool:
+        """释放知识库删除锁"""
+        key = RedisCacheKey.KNOWLEDGE_BASE_PURGE_LOCK.format(knowledge_base_id)
+        return await RedisCache._release_lock(redis, key, token)
+    
+    @staticmethod
+    async def get_purge_progress(redis: Redis, knowledge_base_id: int) -> Optional[Dict[str, int]]:
+        """获取知识库删除进度
+        
+        Returns:
+            Optional[Dict[str, int]]: {"total": 笔记总数, "deleted": 已删除数, "done": 是否完成}
+        """
+        key = RedisCacheKey.KNOWLEDGE_BASE_PURGE_PROGRESS.format(knowledge_base_id)
+        data = await redis.hgetall(key)
+        return {field: int(value) for field, value in data.items()} if data else None
+    
+    @staticmethod
+    async def set_purge_progress(
+        redis: Redis,
+        knowledge_base_id: int,
+        expire: int = 86400,
+        **progress: int
+    ) -> None:
+        """设置知识库删除进度字段"""
+        key = RedisCacheKey.KNOWLEDGE_BASE_PURGE_PROGRESS.format(knowledge_base_id)
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping=progress)
+            pipe.expire(key, expire)
+            await pipe.execute()
+    
+    @staticmethod
+    async def incr_purge_progress(redis: Redis, knowledge_base_id: int, deleted: int) -> int:
+        """累加已删除的笔记数"""
+        key = RedisCacheKey.KNOWLEDGE_BASE_PURGE_PROGRESS.format(knowledge_base_id)
+        return int(await redis.hincrby(key, "deleted", deleted))
+    
+    @staticmethod
+    async def incr_hot_note(redis: Redis, note_id: int, weight: float) -> float:
+        """增加笔记热度
+        
+        Args:
+            redis: Redis连接
+            note_id: 笔记ID
+            weight: 本次事件的热度，按当前时间折算后累加
+            
+        Returns:
+            float: 累加后的存储分数
+        """
+        script = redis.register_script(_HOT_INCR_SCRIPT)
+        score = await script(
+            keys=[RedisCacheKey.HOT_NOTES, RedisCacheKey.HOT_NOTES_EPOCH],
+            args=[note_id, weight, int(time.time()), settings.HOT_NOTES_HALF_LIFE],
+        )
+        return float(score)
+    
+    @staticmethod
+    async def get_hot_notes(redis: Redis, limit: int) -> List[int]:
+        """按热度从高到低获取笔记ID"""
+        note_ids = await redis.zrevrange(RedisCacheKey.HOT_NOTES, 0, limit - 1)
+        return [int(note_id) for note_id in note_ids]
+    
+    @staticmethod
+    async def remove_hot_notes(redis: Redis, note_ids: List[int]) -> int:
+        """从热门排行中移除笔记"""
+        if not note_ids:
+            return 0
+        return await redis.zrem(RedisCacheKey.HOT_NOTES, *note_ids)
+    
+    @staticmethod
+    async def prune_hot_notes(redis: Redis) -> int:
+        """裁剪热门排行，只保留热度最高的 HOT_NOTES_MAX_SIZE 篇笔记
+        
+        Returns:
+            int: 移除的笔记数
+        """
+        script = redis.register_script(_HOT_PRUNE_SCRIPT)
+        return int(await script(
+            keys=[RedisCacheKey.HOT_NOTES, RedisCacheKey.HOT_NOTES_EPOCH],
+            args=[
+                int(time.time()),
+                settings.HOT_NOTES_HALF_LIFE,
+                settings.HOT_NOTES_REBASE_HALF_LIVES,
+                settings.HOT_NOTES_MAX_SIZE,
+            ],
+        ))
@@ -0,0 +1,191 @@
+"""
+笔记正文历史版本
+
+版本内容按正文哈希寻址存储, 相同正文只保存一份;
+与上一版本差异较小时只保存按行计算的差量, 差量链超过一定长度后保存完整快照
+
+集合说明:
+- note_revision_blobs: 版本内容, {_id: 正文哈希, kind: full|delta, base, ops, depth, content, codec, raw_size}
+- note_revisions: 笔记的版本记录, {note_id, hash, user_id, raw_size, created_at}
+"""
+
+import difflib
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from app.core.config import settings
+from app.log import logger
+from app.utils.content_codec import NoteContentCodec
+from app.utils.text_patch import content_hash
+
+BLOB_FULL = "full"
+BLOB_DELTA = "delta"
+
+
+def make_delta(base: str, content: str) -> list:
+    """
+    按行计算差量
+
+    Returns:
+        list: 操作列表, ["c", i1, i2] 表示复制基准版本的第 i1 到 i2 行, ["i", text] 表示插入文本
+    """
+    base_lines = base.splitlines(keepends=True)
+    new_lines = content.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["c", i1, i2])
+        elif tag in ("replace", "insert"):
+            ops.append(["i", "".join(new_lines[j1:j2])])
+    return ops
+
+
+def apply_delta(base: str, ops: list) -> str:
+    """将差量应用到基准版本"""
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for op in ops:
+        if op[0] == "c":
+            parts.extend(base_lines[op[1]:op[2]])
+        else:
+            parts.append(op[1])
+    return "".join(parts)
+
+
+class NoteRevisionStore:
+    """笔记历史版本存储"""
+
+    @staticmethod
+    async def ensure_indexes(mongodb: AsyncIOMotorDatabase) -> None:
+        """创建历史版本集合所需的索引"""
+        await mongodb.note_revisions.create_index([("note_id", ASCENDING), ("created_at", DESCENDING)])
+
+    @staticmethod
+    async def load_blob(mongodb: AsyncIOMotorDatabase, hash: str) -> Optional[str]:
+        """
+        读取版本内容, 沿差量链找到完整快照后依次应用差量
+
+        Returns:
+            Optional[str]: 正文, 版本不存在时返回None
+        """
+        chain = []
+        blob = await mongodb.note_revision_blobs.find_one({"_id": hash})
+        while blob and blob["kind"] == BLOB_DELTA:
+            chain.append(blob["ops"])
+            blob = await mongodb.note_revision_blobs.find_one({"_id": blob["base"]})
+        if not blob:
+            return None
+        content = NoteContentCodec.decode(blob)
+        for ops in reversed(chain):
+            content = apply_delta(content, ops)
+        return content
+
+    @staticmethod
+    async def _store_blob(mongodb: AsyncIOMotorDatabase, hash: str, content: str, base_hash: Optional[str]) -> None:
+        """保存版本内容, 已存在时直接复用"""
+        if await mongodb.note_revision_blobs.count_documents({"_id": hash}, limit=1):
+            return
+
+        blob = None
+        if base_hash:
+            base_blob = await mongodb.note_revision_blobs.find_one({"_id": base_hash}, {"depth": 1})
+            base = await NoteRevisionStore.load_blob(mongodb, base_hash) if base_blob else None
+            depth = base_blob.get("depth", 0) + 1 if base_blob else 0
+            if base is not None and depth <= settings.NOTE_REVISION_MAX_CHAIN:
+                ops = make_delta(base, content)
+                inserted = sum(len(op[1]) for op in ops if op[0] == "i")
+                # 差量明显小于全文时才保存差量
+                if inserted < len(content) / 2:
+                    blob = {"kind": BLOB_DELTA, "base": base_hash, "ops": ops, "depth": depth}
+
+        if blob is None:
+            blob = {"kind": BLOB_FULL, "depth": 0, **NoteContentCodec.encode(content)}
+        try:
+            await mongodb.note_revision_blobs.insert_one({"_id": hash, **blob})
+        except DuplicateKeyError:
+            pass
+
+    @staticmethod
+    async def append(
+        mongodb: AsyncIOMotorDatabase,
+        note_id: int,
+        user_id: int,
+        content: str,
+        created_at: Optional[datetime] = None,
+    ) -> Optional[str]:
+        """
+        追加一个历史版本, 与最新版本相同时跳过
+
+        Returns:
+            Optional[str]: 新版本哈希, 跳过时返回None
+        """
+        hash = content_hash(content)
+        latest = await mongodb.note_revisions.find_one(
+            {"note_id": note_id}, {"hash": 1}, sort=[("created_at", DESCENDING)]
+        )
+        if latest and latest["hash"] == hash:
+            return None
+
+        await NoteRevisionStore._store_blob(mongodb, hash, content, latest["hash"] if latest else None)
+        await mongodb.note_revisions.insert_one({
+            "note_id": note_id,
+            "hash": hash,
+            "user_id": user_id,
+            "raw_size": len(content.encode("utf-8")),
+            "created_at": created_at or datetime.now(),
+        })
+        return hash
+
+    @staticmethod
+    async def safe_append(
+        mongodb: AsyncIOMotorDatabase,
+        note_id: int,
+        user_id: int,
+        content: str,
+        created_at: Optional[datetime] = None,
+    ) -> None:
+        """追加历史版本, 失败只记录日志, 供后台任务使用"""
+        try:
+            await NoteRevisionStore.append(mongodb, note_id, user_id, content, created_at)
+        except Exception as e:
+            logger.error(f"笔记 {note_id} 保存历史版本失败: {e}")
+
+    @staticmethod
+    async def list_revisions(
+        mongodb: AsyncIOMotorDatabase,
+        note_id: int,
+        page: int,
+        page_size: int,
+    ) -> Tuple[int, List[dict]]:
+        """
+        分页获取笔记的历史版本, 按时间倒序
+
+        Returns:
+            Tuple[int, List[dict]]: (总数, 版本列表)
+        """
+        query = {"note_id": note_id}
+        total = await mongodb.note_revisions.count_documents(query)
+        docs = await mongodb.note_revisions.find(query, {"_id": 0}).sort(
+            "created_at", DESCENDING
+        ).skip((page - 1) * page_size).limit(page_size).to_list(None)
+        for doc in docs:
+            doc["created_at"] = doc["created_at"].strftime(settings.DATETIME_FORMAT)
+        return total, docs
+
+    @staticmethod
+    async def get(mongodb: AsyncIOMotorDatabase, note_id: int, hash: str) -> Optional[str]:
+        """获取笔记某个历史版本的正文, 版本不属于该笔记时返回None"""
+        if not await mongodb.note_revisions.count_documents({"note_id": note_id, "hash": hash}, limit=1):
+            return None
+        return await NoteRevisionStore.load_blob(mongodb, hash)
+
+    @staticmethod
+    async def remove_notes(mongodb: AsyncIOMotorDatabase, note_ids: List[int]) -> None:
+        """删除笔记的版本记录, 版本内容可能被其他笔记引用, 不做删除"""
+        if note_ids:
+            await mongodb.note_revisions.delete_many({"note_id": {"$in": note_ids}})
@@ -0,0 +1,391 @@
+"""
+笔记全文检索
+
+基于MongoDB存储的倒排索引, 对笔记标题、简介和正文分词建立索引并使用BM25排序
+
+集合说明:
+- note_search_postings: 倒排表, {term, note_id, tf, user_id, knowledge_bases_id, status},
+  冗余存储筛选字段, 查询时先筛选再按词频截取
+- note_search_docs: 文档信息, {note_id, user_id, knowledge_bases_id, status, length}
+- note_search_stats: 全局统计, {_id: "global", doc_count, total_length, version}
+- note_search_locks: 单篇笔记的索引锁, 同一笔记的索引任务串行执行
+"""
+
+import asyncio
+import html
+import math
+import re
+import unicodedata
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.log import logger
+from app.models.admin import Note
+from app.utils.content_codec import CONTENT_PROJECTION, NoteContentCodec
+
+# 中日韩字符范围
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[a-z0-9]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+
+# 字段权重: 标题和简介中的命中比正文更重要
+FIELD_WEIGHTS = {"title": 3, "introduction": 2, "content": 1}
+
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 每个查询词最多读取的倒排记录数(按词频从高到低), 防止高频词拖慢查询
+MAX_POSTINGS = 20000
+
+# 倒排记录可用于筛选的冗余字段
+FILTER_FIELDS = ("user_id", "knowledge_bases_id", "status")
+
+# 索引结构版本, 倒排记录结构变化时递增, 启动时重建旧版本的索引
+INDEX_VERSION = 2
+
+# 单篇笔记索引锁的过期时间和等待时间(秒)
+INDEX_LOCK_EXPIRE = 60
+INDEX_LOCK_WAIT = 30
+
+
+def normalize(text: Optional[str]) -> str:
+    """全角转半角并转为小写"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    分词
+
+    英文和数字按连续字母数字切分, 中日韩文本按二元组(bigram)切分,
+    单个汉字作为一个词
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        List[str]: 词列表(保留重复, 用于统计词频)
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(normalize(text)):
+        segment = match.group()
+        if _CJK_RE.match(segment):
+            if len(segment) == 1:
+                tokens.append(segment)
+            else:
+                tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+        else:
+            tokens.append(segment)
+    return tokens
+
+
+def highlight(text: Optional[str], terms: Iterable[str], tag: str = "em") -> str:
+    """
+    高亮文本中命中的词
+
+    Args:
+        text: 原始文本
+        terms: 查询词
+        tag: 高亮使用的HTML标签
+
+    Returns:
+        str: 转义后的HTML文本, 命中部分包裹在标签中
+    """
+    text = text or ""
+    spans = _match_spans(text, terms)
+    parts, last = [], 0
+    for start, end in spans:
+        parts.append(html.escape(text[last:start]))
+        parts.append(f"<{tag}>{html.escape(text[start:end])}</{tag}>")
+        last = end
+    parts.append(html.escape(text[last:]))
+    return "".join(parts)
+
+
+def snippet(text: Optional[str], terms: Iterable[str], size: int = 120, tag: str = "em") -> str:
+    """
+    截取正文中第一个命中位置附近的片段并高亮
+
+    Args:
+        text: 正文
+        terms: 查询词
+        size: 片段长度
+        tag: 高亮使用的HTML标签
+    """
+    text = text or ""
+    spans = _match_spans(text, terms)
+    start = max(spans[0][0] - size // 4, 0) if spans else 0
+    end = min(start + size, len(text))
+    fragment = highlight(text[start:end], terms, tag)
+    return ("..." if start > 0 else "") + fragment + ("..." if end < len(text) else "")
+
+
+def _match_spans(text: str, terms: Iterable[str]) -> List[Tuple[int, int]]:
+    """查找所有命中区间并合并重叠部分(中文二元组会相互重叠)"""
+    lowered = normalize(text)
+    # NFKC可能改变长度, 此时退化为原文小写匹配
+    if len(lowered) != len(text):
+        lowered = text.lower()
+    spans = []
+    for term in set(terms):
+        for match in re.finditer(re.escape(term), lowered):
+            spans.append((match.start(), match.end()))
+    spans.sort()
+    merged: List[Tuple[int, int]] = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class NoteSearchIndex:
+    """笔记倒排索引"""
+
+    @staticmethod
+    async def ensure_indexes(mongodb: AsyncIOMotorDatabase) -> None:
+        """创建索引集合所需的MongoDB索引"""
+        await mongodb.note_search_postings.create_index(
+            [("term", ASCENDING), ("note_id", ASCENDING)], unique=True
+        )
+        await mongodb.note_search_postings.create_index("note_id")
+        # 公开搜索按状态筛选, 搜索自己的笔记按作者筛选, 均按词频倒序截取
+        await mongodb.note_search_postings.create_index(
+            [("term", ASCENDING), ("status", ASCENDING), ("tf", DESCENDING)]
+        )
+        await mongodb.note_search_postings.create_index(
+            [("term", ASCENDING), ("user_id", ASCENDING), ("tf", DESCENDING)]
+        )
+        await mongodb.note_search_docs.create_index("note_id", unique=True)
+        # 持锁方崩溃时由TTL索引清理过期的锁
+        await mongodb.note_search_locks.create_index("expire_at", expireAfterSeconds=0)
+
+    @staticmethod
+    def _term_frequencies(title: Optional[str], introduction: Optional[str], content: Optional[str]) -> Counter:
+        """按字段权重统计词频"""
+        tf: Counter = Counter()
+        for field, text in (("title", title), ("introduction", introduction), ("content", content)):
+            weight = FIELD_WEIGHTS[field]
+            for token in tokenize(text):
+                tf[token] += weight
+        return tf
+
+    @staticmethod
+    async def _acquire_lock(mongodb: AsyncIOMotorDatabase, note_id: int) -> Optional[str]:
+        """
+        获取单篇笔记的索引锁, 锁被占用时等待
+
+        Returns:
+            Optional[str]: 锁令牌, 等待超时返回None
+        """
+        token = uuid.uuid4().hex
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + INDEX_LOCK_WAIT
+        while True:
+            now = datetime.utcnow()
+            try:
+                await mongodb.note_search_locks.insert_one(
+                    {"_id": note_id, "token": token, "expire_at": now + timedelta(seconds=INDEX_LOCK_EXPIRE)}
+                )
+                return token
+            except DuplicateKeyError:
+                # TTL索引清理有延迟, 已过期的锁直接删除
+                await mongodb.note_search_locks.delete_one({"_id": note_id, "expire_at": {"$lt": now}})
+            if loop.time() >= deadline:
+                return None
+            await asyncio.sleep(0.05)
+
+    @staticmethod
+    async def index_note(mongodb: AsyncIOMotorDatabase, note: Note, content: Optional[str]) -> None:
+        """
+        建立或更新一篇笔记的索引
+
+        同一笔记的索引任务通过锁串行执行, 替换倒排记录时不会冲突;
+        文档信息原子地替换并返回旧值, 全局统计按新旧长度的差值更新
+
+        Args:
+            mongodb: MongoDB数据库实例
+            note: 笔记模型实例
+            content: 笔记正文
+
+        Raises:
+            TimeoutError: 等待索引锁超时
+        """
+        tf = NoteSearchIndex._term_frequencies(note.title, note.introduction, content)
+        length = sum(tf.values())
+        fields = {field: getattr(note, field) for field in FILTER_FIELDS}
+
+        token = await NoteSearchIndex._acquire_lock(mongodb, note.id)
+        if token is None:
+            raise TimeoutError(f"等待笔记 {note.id} 的索引锁超时")
+        try:
+            await mongodb.note_search_postings.delete_many({"note_id": note.id})
+            if tf:
+                await mongodb.note_search_postings.insert_many(
+                    [{"term": term, "note_id": note.id, "tf": freq, **fields} for term, freq in tf.items()],
+                    ordered=False,
+                )
+            old_doc = await mongodb.note_search_docs.find_one_and_update(
+                {"note_id": note.id},
+                {"$set": {"note_id": note.id, "length": length, **fields}},
+                projection={"length": 1},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+            )
+            await mongodb.note_search_stats.update_one(
+                {"_id": "global"},
+                {"$inc": {
+                    "doc_count": 0 if old_doc else 1,
+                    "total_length": length - (old_doc["length"] if old_doc else 0),
+                }},
+                upsert=True,
+            )
+        finally:
+            await mongodb.note_search_locks.delete_one({"_id": note.id, "token": token})
+
+    @staticmethod
+    async def remove_notes(mongodb: AsyncIOMotorDatabase, note_ids: List[int]) -> None:
+        """从索引中删除笔记"""
+        if not note_ids:
+            return
+        # 逐篇原子删除文档信息, 并发删除同一笔记时只有一方计入统计
+        docs = await asyncio.gather(*(
+            mongodb.note_search_docs.find_one_and_delete({"note_id": note_id}, projection={"length": 1})
+            for note_id in note_ids
+        ))
+        docs = [doc for doc in docs if doc]
+        await mongodb.note_search_postings.delete_many({"note_id": {"$in": note_ids}})
+        if docs:
+            await mongodb.note_search_stats.update_one(
+                {"_id": "global"},
+                {"$inc": {
+                    "doc_count": -len(docs),
+                    "total_length": -sum(doc["length"] for doc in docs),
+                }},
+                upsert=True,
+            )
+
+    @staticmethod
+    async def safe_index_note(mongodb: AsyncIOMotorDatabase, note: Note, content: Optional[str]) -> None:
+        """建立索引, 失败只记录日志, 供后台任务使用"""
+        try:
+            await NoteSearchIndex.index_note(mongodb, note, content)
+        except Exception as e:
+            logger.error(f"笔记 {note.id} 建立索引失败: {e}")
+
+    @staticmethod
+    async def safe_remove_notes(mongodb: AsyncIOMotorDatabase, note_ids: List[int]) -> None:
+        """删除索引, 失败只记录日志, 供后台任务使用"""
+        try:
+            await NoteSearchIndex.remove_notes(mongodb, note_ids)
+        except Exception as e:
+            logger.error(f"笔记 {note_ids} 删除索引失败: {e}")
+
+    @staticmethod
+    async def search(
+        mongodb: AsyncIOMotorDatabase,
+        keyword: str,
+        filters: Optional[dict] = None,
+    ) -> Tuple[List[Tuple[int, float]], List[str]]:
+        """
+        检索笔记并按BM25得分排序
+
+        文档频率按全部倒排记录统计; 筛选条件作用于倒排记录后,
+        每个查询词只取词频最高的 MAX_POSTINGS 条参与排序, 高频词只返回排名靠前的结果
+
+        Args:
+            mongodb: MongoDB数据库实例
+            keyword: 查询关键词
+            filters: 筛选条件, 只能使用 FILTER_FIELDS 中的字段, 如 {"status": 1}
+
+        Returns:
+            Tuple[List[Tuple[int, float]], List[str]]: ([(笔记ID, 得分)], 查询词)
+        """
+        terms = list(dict.fromkeys(tokenize(keyword)))
+        if not terms:
+            return [], terms
+        filters = filters or {}
+        if set(filters) - set(FILTER_FIELDS):
+            raise ValueError(f"不支持的筛选字段: {set(filters) - set(FILTER_FIELDS)}")
+
+        postings_list = await asyncio.gather(*(
+            mongodb.note_search_postings.find(
+                {"term": term, **filters}, {"_id": 0, "note_id": 1, "tf": 1}
+            ).sort("tf", DESCENDING).limit(MAX_POSTINGS).to_list(None)
+            for term in terms
+        ))
+        df_list = await asyncio.gather(*(
+            mongodb.note_search_postings.count_documents({"term": term}) for term in terms
+        ))
+        df = dict(zip(terms, df_list))
+
+        # 每篇文档的命中词频
+        hits: Dict[int, Dict[str, int]] = {}
+        for term, postings in zip(terms, postings_list):
+            for posting in postings:
+                hits.setdefault(posting["note_id"], {})[term] = posting["tf"]
+        if not hits:
+            return [], terms
+
+        docs, stats = await asyncio.gather(
+            mongodb.note_search_docs.find(
+                {"note_id": {"$in": list(hits)}}, {"_id": 0, "note_id": 1, "length": 1}
+            ).to_list(None),
+            mongodb.note_search_stats.find_one({"_id": "global"}),
+        )
+        doc_count = max((stats or {}).get("doc_count", 0), 1)
+        avg_length = max((stats or {}).get("total_length", 0) / doc_count, 1)
+
+        scored = []
+        for doc in docs:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * doc["length"] / avg_length)
+            score = 0.0
+            for term, tf in hits[doc["note_id"]].items():
+                idf = math.log(1 + (doc_count - df[term] + 0.5) / (df[term] + 0.5))
+                score += idf * tf * (BM25_K1 + 1) / (tf + norm)
+            scored.append((doc["note_id"], score))
+        scored.sort(key=lambda item: (-item[1], -item[0]))
+        return scored, terms
+
+    @staticmethod
+    async def rebuild_if_outdated(mongodb: AsyncIOMotorDatabase, batch_size: int = 200) -> None:
+        """
+        索引为空或版本过旧时为全部已有笔记建立索引
+
+        通过插入统计文档或更新其中的版本号抢占重建任务, 多个worker同时启动时只有一个会执行;
+        重建期间旧版本的倒排记录没有筛选字段, 暂时搜索不到
+        """
+        try:
+            await mongodb.note_search_stats.insert_one(
+                {"_id": "global", "doc_count": 0, "total_length": 0, "version": INDEX_VERSION}
+            )
+        except DuplicateKeyError:
+            claimed = await mongodb.note_search_stats.update_one(
+                {"_id": "global", "version": {"$ne": INDEX_VERSION}},
+                {"$set": {"version": INDEX_VERSION}},
+            )
+            if not claimed.modified_count:
+                return
+
+        logger.info("开始重建笔记全文索引")
+        last_id = 0
+        while True:
+            notes = await Note.filter(id__gt=last_id).order_by("id").limit(batch_size)
+            if not notes:
+                break
+            docs = await mongodb.note_contents.find(
+                {"key": {"$in": [note.content for note in notes]}}, CONTENT_PROJECTION
+            ).to_list(None)
+            contents = {doc["key"]: await NoteContentCodec.load(mongodb, doc) for doc in docs}
+            for note in notes:
+                await NoteSearchIndex.safe_index_note(mongodb, note, contents.get(note.content, ""))
+            last_id = notes[-1].id
+        logger.info("笔记全文索引重建完成")
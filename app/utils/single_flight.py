@@ -0,0 +1,152 @@
+"""
+缓存未命中时的回源合并
+
+热点缓存过期时大量并发请求会同时未命中并各自回源、重复写入同一个缓存:
+- 进程内: 同一个键同时只有一个回源任务, 并发的请求等待同一个 Future
+- 跨worker: 回源前抢占一个短期Redis锁, 未抢到的worker轮询缓存等待结果,
+  持锁方未写入缓存就释放了锁时由抢到锁的等待者重新回源, 等待超时(回源过慢)后自行回源
+- 软过期的缓存先返回旧数据, 请求结束后在后台任务中刷新, 同一个键同时只刷新一次
+"""
+
+import asyncio
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from redis.asyncio import Redis
+
+from app.core.bgtask import BgTasks
+from app.core.config import settings
+from app.log import logger
+
+# 只释放自己持有的锁, 避免锁过期后被其他worker抢到时误删
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """按缓存键合并并发的回源请求"""
+
+    LOCK_PREFIX = "single_flight"
+    REFRESH_PREFIX = "single_flight_refresh"  # 后台刷新的去重键, 与回源锁分开, 刷新后保留不影响未命中的回源
+
+    _inflight: Dict[str, "asyncio.Future[Any]"] = {}
+    _refreshing: Set[str] = set()
+
+    @classmethod
+    async def load(
+        cls,
+        redis: Redis,
+        key: str,
+        read: Callable[[], Awaitable[Optional[Any]]],
+        load: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        合并回源
+
+        回源在独立的任务中执行, 发起请求被取消不会影响其他等待者
+
+        Args:
+            redis: Redis连接
+            key: 缓存键
+            read: 读取缓存, 未命中返回None
+            load: 回源并写入缓存, 返回与read相同格式的数据
+
+        Returns:
+            Any: 缓存数据; 回源抛出的异常会传递给所有等待者
+        """
+        future = cls._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(cls._load(redis, key, read, load))
+            cls._inflight[key] = future
+            future.add_done_callback(lambda done: cls._done(key, done))
+        return await asyncio.shield(future)
+
+    @classmethod
+    def _done(cls, key: str, future: "asyncio.Future[Any]") -> None:
+        if cls._inflight.get(key) is future:
+            del cls._inflight[key]
+
+    @classmethod
+    async def _load(
+        cls,
+        redis: Redis,
+        key: str,
+        read: Callable[[], Awaitable[Optional[Any]]],
+        load: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        lock_key = f"{cls.LOCK_PREFIX}:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = await redis.set(lock_key, token, nx=True, ex=settings.SINGLE_FLIGHT_LOCK_EXPIRE)
+        except Exception as e:
+            # Redis不可用时不做跨worker合并
+            logger.warning(f"获取回源锁 {key} 失败: {e}")
+            return await load()
+
+        # 其他worker正在回源, 等待其写入缓存
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.SINGLE_FLIGHT_WAIT
+        while not acquired and loop.time() < deadline:
+            await asyncio.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL)
+            try:
+                value = await read()
+                if value is not None:
+                    return value
+                # 锁已不存在说明持锁方没有写入缓存就结束了(回源返回None或抛出异常),
+                # 不再等待到超时, 由抢到锁的等待者重新回源
+                acquired = await redis.set(lock_key, token, nx=True, ex=settings.SINGLE_FLIGHT_LOCK_EXPIRE)
+            except Exception as e:
+                logger.warning(f"等待回源结果 {key} 失败: {e}")
+                break
+
+        if not acquired:
+            return await load()
+        try:
+            return await load()
+        finally:
+            try:
+                await redis.register_script(RELEASE_LOCK_SCRIPT)(keys=[lock_key], args=[token])
+            except Exception as e:
+                logger.warning(f"释放回源锁 {key} 失败: {e}")
+
+    @classmethod
+    async def schedule_refresh(cls, redis: Redis, key: str, load: Callable[[], Awaitable[Any]]) -> None:
+        """
+        在请求结束后的后台任务中刷新软过期的缓存
+
+        本进程已在回源或刷新该键时跳过; 不在请求上下文中(没有后台任务队列)时不刷新
+
+        Args:
+            redis: Redis连接
+            key: 缓存键
+            load: 回源并写入缓存
+        """
+        if key in cls._inflight or key in cls._refreshing:
+            return
+        if await BgTasks.get_bg_tasks_obj() is None:
+            return
+        cls._refreshing.add(key)
+        await BgTasks.add_task(cls._refresh, redis, key, load)
+
+    @classmethod
+    async def _refresh(cls, redis: Redis, key: str, load: Callable[[], Awaitable[Any]]) -> None:
+        refresh_key = f"{cls.REFRESH_PREFIX}:{key}"
+        token = uuid.uuid4().hex
+        try:
+            if not await redis.set(refresh_key, token, nx=True, ex=settings.SINGLE_FLIGHT_LOCK_EXPIRE):
+                return
+            try:
+                await load()
+            except Exception:
+                await redis.register_script(RELEASE_LOCK_SCRIPT)(keys=[refresh_key], args=[token])
+                raise
+            # 刷新成功后保留去重键, 过期前其他worker读到旧数据时不再重复刷新;
+            # 去重键与回源锁不同, 缓存被删除后的未命中仍能立即回源
+        except Exception as e:
+            logger.warning(f"后台刷新缓存 {key} 失败: {e}")
+        finally:
+            cls._refreshing.discard(key)
@@ -0,0 +1,40 @@
+"""
+笔记正文增量补丁
+
+补丁以基准版本为坐标, 每段补丁将 [start, end) 区间替换为 text,
+偏移量按Unicode字符计算
+"""
+
+import hashlib
+from typing import Iterable, Optional
+
+
+def content_hash(content: Optional[str]) -> str:
+    """计算正文的版本哈希(sha256)"""
+    return hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+
+
+def apply_patches(content: str, patches: Iterable) -> str:
+    """
+    将补丁应用到基准正文
+
+    Args:
+        content: 基准正文
+        patches: 补丁列表, 每项包含 start、end、text 属性
+
+    Returns:
+        str: 应用补丁后的正文
+
+    Raises:
+        ValueError: 区间越界或相互重叠
+    """
+    parts = []
+    last = 0
+    for patch in sorted(patches, key=lambda p: (p.start, p.end)):
+        if patch.start < last or patch.end < patch.start or patch.end > len(content):
+            raise ValueError(f"补丁区间无效: [{patch.start}, {patch.end})")
+        parts.append(content[last:patch.start])
+        parts.append(patch.text)
+        last = patch.end
+    parts.append(content[last:])
+    return "".join(parts)
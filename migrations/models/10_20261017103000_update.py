@@ -0,0 +1,11 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE `knowledge_bases` ADD `deleting` BOOL NOT NULL  COMMENT '是否正在后台删除' DEFAULT 0;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE `knowledge_bases` DROP COLUMN `deleting`;"""
@@ -0,0 +1,22 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS `note_like` (
+    `id` BIGINT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `created_at` DATETIME(6) NOT NULL  DEFAULT CURRENT_TIMESTAMP(6),
+    `updated_at` DATETIME(6) NOT NULL  DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    `user_id` INT NOT NULL  COMMENT '用户ID',
+    `note_id` INT NOT NULL  COMMENT '笔记ID',
+    UNIQUE KEY `uid_note_like_user_id_fb2f48` (`user_id`, `note_id`),
+    KEY `idx_note_like_created_7dad1f` (`created_at`),
+    KEY `idx_note_like_updated_4d634a` (`updated_at`),
+    KEY `idx_note_like_user_id_b0cea8` (`user_id`),
+    KEY `idx_note_like_note_id_895306` (`note_id`)
+) CHARACTER SET utf8mb4 COMMENT='笔记点赞表';"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS `note_like`;"""
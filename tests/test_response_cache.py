@@ -0,0 +1,46 @@
+"""接口响应缓存测试"""
+
+import asyncio
+
+from fastapi.responses import JSONResponse
+
+from app.core.dependency import RedisControl
+from app.core.response_cache import ResponseCache
+from app.utils.single_flight import SingleFlight
+
+
+def test_miss_writes_expire_and_stale_ttl(monkeypatch):
+    """未命中时写入的硬过期时间为 expire + stale"""
+    writes = []
+
+    async def get_redis_pool():
+        return object()
+
+    async def generations(redis, tags):
+        return [0 for _ in tags]
+
+    async def get(redis, key):
+        return None
+
+    async def set_(redis, key, body, expire, stale=0):
+        writes.append((expire, stale))
+        return "etag", body.decode("utf-8"), 0.0
+
+    async def load(redis, key, read, load):
+        return await load()
+
+    monkeypatch.setattr(RedisControl, "get_redis_pool", get_redis_pool)
+    monkeypatch.setattr(ResponseCache, "generations", generations)
+    monkeypatch.setattr(ResponseCache, "get", get)
+    monkeypatch.setattr(ResponseCache, "set", set_)
+    monkeypatch.setattr(SingleFlight, "load", load)
+
+    @ResponseCache.cached("test_ttl", expire=60, stale=30)
+    async def endpoint(page: int = 1):
+        return JSONResponse({"page": page})
+
+    response = asyncio.run(endpoint(page=1))
+
+    assert response.status_code == 200
+    assert writes == [(60, 30)]
+    assert sum(writes[0]) == 90